@@ -0,0 +1,255 @@
+"""
+Content-addressed storage for session outputs.
+
+    store = BlobStore("cache/blobs")
+    session = store.open_session("outputs/session_1")
+    session.ingest("outputs/session_1/1_photo_exposure_0.5.png")
+
+    python BlobStore.py gc --root cache/blobs [--prune-missing] [--dry-run]
+
+Files are moved to <root>/objects/<ab>/<hash><ext> (blake2b of the bytes) and replaced by a
+symlink under their readable name, so identical states (undo / redo / checkout copies, the
+same step re-rendered in another session) are stored once. Each session directory has a
+manifest <root>/manifests/<id>.json {readable name: blob}; `gc` deletes the blobs that no
+manifest refers to. A session that forgets a name (e.g. deleted by its retention policy) releases
+the blob right away once no manifest refers to it any more.
+
+Writers never write through a readable name: ImageIO.replacing_file writes a temporary file
+and renames it over the name, so the symlink is replaced and the shared blob is left as is.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from ImageIO import DECODED_IMAGE_CACHE, link_image
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+
+    def __init__(self, root: str = os.path.join("cache", "blobs")):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.manifests_dir = os.path.join(self.root, "manifests")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    def blob_path(self, blob: str) -> str:
+        """ blob is "<hash><ext>" """
+        return os.path.join(self.objects_dir, blob[:2], blob)
+
+    def is_blob_link(self, path: str) -> bool:
+        return os.path.islink(path) and os.path.dirname(os.path.dirname(os.readlink(path))) == self.objects_dir
+
+    def open_session(self, session_dir: str) -> "StoreSession":
+        return StoreSession(self, session_dir)
+
+    def store_file(self, path: str) -> Tuple[str, bool]:
+        """
+        Move a regular file into the store (or drop it if the same content is stored already).
+        Returns (blob, deduplicated). The caller re-creates the readable name.
+        """
+        blob = file_digest(path) + os.path.splitext(path)[1].lower()
+        blob_path = self.blob_path(blob)
+        if os.path.exists(blob_path):
+            os.remove(path)
+            os.utime(blob_path)  # recently referenced: keep it out of a concurrent gc's reach (see gc grace_seconds)
+            return blob, True
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        temp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.move(path, temp_path)  # a rename on the same file system, a copy otherwise
+        os.chmod(temp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(temp_path, blob_path)
+        return blob, False
+
+    def release(self, blobs, grace_seconds: float = 5) -> set:
+        """
+        Delete the blobs no manifest refers to, without waiting for gc. Returns the blobs that are gone.
+        Blobs touched in the last grace_seconds are kept: another session may be linking one
+        (store_file refreshes its mtime right before that session writes its manifest).
+        """
+        released, candidates = set(), []
+        now = time.time()
+        for blob in blobs:
+            try:
+                if now - os.stat(self.blob_path(blob)).st_mtime >= grace_seconds:
+                    candidates.append(blob)
+            except FileNotFoundError:
+                released.add(blob)
+        if candidates:
+            referenced = set()
+            for _, manifest in self.manifests():
+                referenced.update(manifest.get("files", {}).values())
+            for blob in candidates:
+                if blob in referenced:
+                    continue
+                try:
+                    os.remove(self.blob_path(blob))
+                except FileNotFoundError:
+                    pass
+                released.add(blob)
+        return released
+
+    def manifests(self):
+        """ Yield (manifest path, manifest dict) of every session """
+        for name in sorted(os.listdir(self.manifests_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.manifests_dir, name)
+            try:
+                with open(path) as manifest_file:
+                    yield path, json.load(manifest_file)
+            except (OSError, ValueError):
+                continue
+
+    def gc(self, prune_missing: bool = False, dry_run: bool = False, grace_seconds: float = 3600) -> Dict[str, int]:
+        """
+        Delete the blobs no session manifest refers to.
+
+        prune_missing: first drop the manifests whose session directory no longer exists,
+                       so deleting a session directory and running gc frees its blobs.
+        grace_seconds: keep unreferenced blobs younger than this, a running session may
+                       not have written its manifest entry yet.
+        Returns counts: manifests_pruned, blobs_removed, bytes_removed, blobs_kept.
+        """
+        stats = {"manifests_pruned": 0, "blobs_removed": 0, "bytes_removed": 0, "blobs_kept": 0}
+        reachable = set()
+        for manifest_path, manifest in self.manifests():
+            if prune_missing and not os.path.isdir(manifest.get("session_dir", "")):
+                stats["manifests_pruned"] += 1
+                if not dry_run:
+                    os.remove(manifest_path)
+                continue
+            reachable.update(manifest.get("files", {}).values())
+
+        now = time.time()
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            for blob in os.listdir(prefix_dir):
+                blob_path = os.path.join(prefix_dir, blob)
+                if blob in reachable:
+                    stats["blobs_kept"] += 1
+                    continue
+                blob_stat = os.stat(blob_path)
+                if now - blob_stat.st_mtime < grace_seconds:
+                    stats["blobs_kept"] += 1
+                    continue
+                stats["blobs_removed"] += 1
+                stats["bytes_removed"] += blob_stat.st_size
+                if not dry_run:
+                    os.remove(blob_path)
+        return stats
+
+
+class StoreSession:
+    """
+    The manifest of one session directory: readable file name => blob.
+    Thread-safe, background high-resolution renders ingest their outputs concurrently.
+    """
+
+    def __init__(self, store: BlobStore, session_dir: str):
+        self.store = store
+        self.session_dir = os.path.abspath(session_dir)
+        session_id = hashlib.blake2b(self.session_dir.encode(), digest_size=10).hexdigest()
+        self.manifest_path = os.path.join(store.manifests_dir, f"{session_id}.json")
+        self.files: Dict[str, str] = {}
+        self.unreferenced = set()  # forgotten blobs not released yet (still referenced elsewhere, or too recent)
+        self._lock = threading.Lock()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                self.files = json.load(manifest_file).get("files", {})
+
+    def ingest(self, path: str) -> Optional[str]:
+        """
+        Move a finished session file into the store and leave a symlink under its name.
+        Returns its blob (None if the file does not exist, e.g. an output that was not saved).
+        """
+        if self.store.is_blob_link(path):
+            return os.path.basename(os.readlink(path))
+        if not os.path.isfile(path):
+            return None
+        cached = DECODED_IMAGE_CACHE.get(path)
+        blob, deduplicated = self.store.store_file(path)
+        self._link(blob, path)
+        if cached is not None and deduplicated:
+            DECODED_IMAGE_CACHE.put(path, cached[0], cached[1])  # the stored blob has another mtime
+        return blob
+
+    def alias(self, source_path: str, target_path: str):
+        """ target_path gets the same content as source_path: one more name for its blob, nothing is hashed or copied """
+        if not self.store.is_blob_link(source_path):
+            link_image(source_path, target_path)
+            self.ingest(target_path)
+            return
+        if os.path.lexists(target_path):
+            os.remove(target_path)
+        self._link(os.path.basename(os.readlink(source_path)), target_path)
+        DECODED_IMAGE_CACHE.alias(source_path, target_path)
+
+    def forget(self, path: str):
+        """ path was deleted: drop it from the manifest and release its blob if nothing refers to it any more """
+        with self._lock:
+            blob = self.files.pop(os.path.relpath(os.path.abspath(path), self.session_dir), None)
+            if blob is None:
+                return
+            self._save()
+            self.unreferenced.add(blob)
+        self.release_unreferenced()
+
+    def release_unreferenced(self):
+        """ BlobStore.release the forgotten blobs; the ones kept (too recent, used by another session) are retried next time """
+        with self._lock:
+            self.unreferenced -= set(self.files.values())  # named again by this session
+            candidates = set(self.unreferenced)
+        released = self.store.release(candidates)
+        with self._lock:
+            self.unreferenced -= released
+
+    def _link(self, blob: str, path: str):
+        blob_path = self.store.blob_path(blob)
+        try:
+            os.symlink(blob_path, path)
+        except OSError:
+            link_image(blob_path, path)  # no symlinks here: a hard link to the blob
+        with self._lock:
+            self.files[os.path.relpath(os.path.abspath(path), self.session_dir)] = blob
+            self._save()
+
+    def _save(self):
+        temp_path = f"{self.manifest_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as manifest_file:
+            json.dump({"session_dir": self.session_dir, "files": self.files}, manifest_file, indent=1)
+        os.replace(temp_path, self.manifest_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    gc_parser = subparsers.add_parser("gc", help="delete blobs that no session manifest refers to")
+    gc_parser.add_argument("--root", default=os.path.join("cache", "blobs"))
+    gc_parser.add_argument("--prune-missing", action="store_true", help="drop manifests of deleted session directories first")
+    gc_parser.add_argument("--dry-run", action="store_true")
+    gc_parser.add_argument("--grace-seconds", type=float, default=3600)
+    args = parser.parse_args()
+
+    stats = BlobStore(args.root).gc(args.prune_missing, args.dry_run, args.grace_seconds)
+    print(f"{'would remove' if args.dry_run else 'removed'} {stats['blobs_removed']} blobs "
+          f"({stats['bytes_removed'] / (1 << 20):.1f} MB), kept {stats['blobs_kept']}, "
+          f"pruned {stats['manifests_pruned']} manifests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from typing import Callable
+import numpy as np
+
+from ImageIO import read_image_float, write_image_float
+
+
+def bake_lut3d(transform: Callable[[np.ndarray], np.ndarray], size: int = 33) -> np.ndarray:
+    """
+    Sample an RGB -> RGB transform on a size^3 grid.
+
+    Parameters:
+        transform: maps a float32 [0,1] RGB image (H, W, 3) to another one.
+        size (int): number of grid points per axis, typically 33 or 65.
+
+    Returns:
+        np.ndarray: float32 LUT of shape (size, size, size, 3), indexed [r, g, b].
+    """
+    axis = np.linspace(0.0, 1.0, size, dtype=np.float32)
+    r, g, b = np.meshgrid(axis, axis, axis, indexing="ij")
+    grid = np.stack([r, g, b], axis=-1).reshape(size * size, size, 3)
+    lut = np.clip(transform(grid), 0.0, 1.0)
+    return np.ascontiguousarray(lut, dtype=np.float32).reshape(size, size, size, 3)
+
+
+def apply_lut3d(img: np.ndarray, lut: np.ndarray, chunk_pixels: int = 1 << 18) -> np.ndarray:
+    """
+    Map a float32 [0,1] RGB image through a 3D LUT with trilinear interpolation.
+    The image is processed in chunks of `chunk_pixels` to bound temporary memory.
+    """
+    size = lut.shape[0]
+    # One flat table per output channel: 1D np.take is much faster than row gathers
+    tables = [np.ascontiguousarray(lut[..., channel], dtype=np.float32).ravel() for channel in range(3)]
+    stride_r, stride_g = size * size, size
+    scale = np.float32(size - 1)
+
+    pixels = img.reshape(-1, 3)
+    out = np.empty(pixels.shape, dtype=np.float32)
+    for start in range(0, pixels.shape[0], chunk_pixels):
+        position = pixels[start:start + chunk_pixels] * scale
+        np.clip(position, 0.0, scale, out=position)
+        lower = np.minimum(position.astype(np.int32), size - 2)
+        position -= lower  # fractional position inside the cell
+        fr, fg, fb = position[:, 0], position[:, 1], position[:, 2]
+
+        i000 = lower[:, 0] * stride_r + lower[:, 1] * stride_g + lower[:, 2]
+        i010 = i000 + stride_g
+        i100 = i000 + stride_r
+        i110 = i100 + stride_g
+
+        for channel, table in enumerate(tables):
+            def lerp_b(index):
+                low = table.take(index)
+                return low + fb * (table.take(index + 1) - low)
+
+            c00, c01, c10, c11 = lerp_b(i000), lerp_b(i010), lerp_b(i100), lerp_b(i110)
+            c0 = c00 + fg * (c01 - c00)
+            c1 = c10 + fg * (c11 - c10)
+            out[start:start + chunk_pixels, channel] = c0 + fr * (c1 - c0)
+    return out.reshape(img.shape)
+
+
+def write_cube(cube_path: str, lut: np.ndarray, title: str = None):
+    """
+    Save a (size, size, size, 3) [r, g, b] LUT in the Adobe/Resolve .cube format
+    (red index varies fastest in the data section).
+    """
+    size = lut.shape[0]
+    data = lut.transpose(2, 1, 0, 3).reshape(-1, 3)
+    with open(cube_path, "w") as cube_file:
+        if title:
+            cube_file.write(f'TITLE "{title}"\n')
+        cube_file.write(f"LUT_3D_SIZE {size}\n")
+        cube_file.write("DOMAIN_MIN 0.0 0.0 0.0\n")
+        cube_file.write("DOMAIN_MAX 1.0 1.0 1.0\n")
+        np.savetxt(cube_file, data, fmt="%.6f")
+
+
+def read_cube(cube_path: str) -> np.ndarray:
+    """
+    Load a 3D .cube file into a (size, size, size, 3) [r, g, b] float32 LUT.
+    Only 3D LUTs with the default [0,1] domain are supported.
+    """
+    size = None
+    values = []
+    with open(cube_path, "r") as cube_file:
+        for line in cube_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            keyword = line.split()[0]
+            if keyword == "LUT_3D_SIZE":
+                size = int(line.split()[1])
+            elif keyword == "LUT_1D_SIZE":
+                raise ValueError(f"1D .cube LUTs are not supported: {cube_path}")
+            elif keyword in ("DOMAIN_MIN", "DOMAIN_MAX"):
+                domain = [float(v) for v in line.split()[1:4]]
+                if domain != ([0.0] * 3 if keyword == "DOMAIN_MIN" else [1.0] * 3):
+                    raise ValueError(f"Only the [0,1] domain is supported: {cube_path}")
+            elif keyword == "TITLE":
+                continue
+            else:
+                values.append([float(v) for v in line.split()[:3]])
+
+    if size is None or len(values) != size ** 3:
+        raise ValueError(f"Malformed .cube file: {cube_path}")
+    data = np.asarray(values, dtype=np.float32).reshape(size, size, size, 3)
+    return np.ascontiguousarray(data.transpose(2, 1, 0, 3))
+
+
+def apply_cube(input_image_path: str, output_image_path: str, cube_path: str):
+    """
+    Render an image through a .cube LUT in a single pass.
+    -- input_image_path: str, the path of the input image (.npy / 8-bit / 16-bit).
+    -- output_image_path: str, the path of the output image, same bit depth as the input.
+    -- cube_path: str, the path of the .cube file.
+    """
+    img, bit_depth_in = read_image_float(input_image_path)
+    write_image_float(output_image_path, apply_lut3d(img, read_cube(cube_path)), bit_depth_in)
+    print(output_image_path)
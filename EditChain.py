@@ -0,0 +1,222 @@
+import functools
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+from ImageProcessing import (
+    exposure_array,
+    contrast_array,
+    shadow_array,
+    highlight_array,
+    black_array,
+    white_array,
+    saturation_array,
+    tone_array,
+    color_temperature_array,
+    lightness_pipeline_array,
+    process_image_file,
+    LIGHTNESS_TONE_MAPPINGS,
+)
+from ImageIO import quantize_float
+from TileProcessing import TileSize
+
+
+# Names recorded in ImageProcessingToolBoxes.function_calls => in-memory op.
+# The bare ImageProcessing names are accepted as well.
+OPERATIONS: Dict[str, Callable[[np.ndarray, float], np.ndarray]] = {
+    "adjust_saturation": saturation_array,
+    "adjust_shadows": shadow_array,
+    "adjust_highlights": highlight_array,
+    "adjust_contrast": contrast_array,
+    "adjust_blacks": black_array,
+    "adjust_whites": white_array,
+    "tone": tone_array,
+    "color_temperature": color_temperature_array,
+    "exposure": exposure_array,
+    "saturation": saturation_array,
+    "shadow": shadow_array,
+    "highlight": highlight_array,
+    "contrast": contrast_array,
+    "black": black_array,
+    "white": white_array,
+}
+
+# Operation name => name of its curve in LIGHTNESS_TONE_MAPPINGS
+LIGHTNESS_OPERATIONS = {
+    name: op.__name__[:-len("_array")]
+    for name, op in OPERATIONS.items()
+    if op.__name__[:-len("_array")] in LIGHTNESS_TONE_MAPPINGS
+}
+
+
+def active_operations(function_calls: List[list]) -> List[Tuple[str, float]]:
+    """
+    Replay a function_calls record and return the (name, factor) steps that
+    produce the current image, i.e. with undone steps removed.
+
+    Each image operation creates a new image state; undo_step creates a new
+    state equal to the one before the previous state (this is how the toolbox
+    restores image_paths[-2]), redo_step a new state equal to the state
+    reverted by the latest undo_step, and checkout_state a new state equal to
+    state image-N (call[1], 1-based). Other records (satisfactory, ...) leave
+    the image untouched.
+    """
+    chains = [[]]
+    undone = []  # chains reverted by undo_step, most recent last
+    for call in function_calls:
+        name = call[0]
+        if name == "undo_step":
+            if len(chains) < 2:
+                raise ValueError("Cannot replay undo_step without a previous image state.")
+            undone.append(chains[-1])
+            chains.append(chains[-2])
+        elif name == "redo_step":
+            if not undone:
+                raise ValueError("Cannot replay redo_step without an undone image state.")
+            chains.append(undone.pop())
+        elif name == "checkout_state":
+            if not 1 <= call[1] <= len(chains):
+                raise ValueError(f"Cannot replay checkout_state of image-{call[1]}.")
+            undone.clear()
+            chains.append(chains[call[1] - 1])
+        elif name in OPERATIONS:
+            undone.clear()
+            chains.append(chains[-1] + [(name, call[1])])
+    return list(chains[-1])
+
+
+def render_chain(img: np.ndarray, operations: List[Tuple[str, float]], fuse_lightness: bool = False,
+                 step_bit_depth: Optional[int] = None) -> np.ndarray:
+    """
+    Apply the (name, factor) steps to a float32 [0,1] RGB image in memory.
+
+    With fuse_lightness=True, runs of consecutive L-channel ops (contrast,
+    shadows, highlights, blacks, whites) are composed and applied with a
+    single Lab round trip via lightness_pipeline_array.
+
+    step_bit_depth (8 / 16): clip and round after every step, as a chain that
+    writes each step to an 8/16-bit image file does, so the replay matches
+    that step-by-step render. Not combinable with fuse_lightness.
+    """
+    if fuse_lightness and step_bit_depth is not None:
+        raise ValueError("fuse_lightness skips the rounding between L-channel steps, it cannot be used with step_bit_depth.")
+    index = 0
+    while index < len(operations):
+        name, factor = operations[index]
+        if fuse_lightness and name in LIGHTNESS_OPERATIONS:
+            steps = []
+            while index < len(operations) and operations[index][0] in LIGHTNESS_OPERATIONS:
+                steps.append((LIGHTNESS_OPERATIONS[operations[index][0]], operations[index][1]))
+                index += 1
+            img = lightness_pipeline_array(img, steps)
+            continue
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {name}")
+        img = OPERATIONS[name](img, factor)
+        if step_bit_depth is not None:
+            img = quantize_float(img, step_bit_depth)
+        index += 1
+    return img
+
+
+def render_chain_file(input_image_path: str, output_image_path: str, operations: List[Tuple[str, float]],
+                      tile_size: TileSize = None, num_workers: int = 1, fuse_lightness: bool = True,
+                      step_bit_depth: Optional[int] = None):
+    """
+    Replay the (name, factor) steps on an image file in one decode / encode.
+    Output keeps the bit depth of the input.
+    fuse_lightness / step_bit_depth: see render_chain (L-channel runs are fused by default).
+    tile_size / num_workers: see ImageProcessing.process_image_file.
+    """
+    chain = functools.partial(render_chain, fuse_lightness=fuse_lightness, step_bit_depth=step_bit_depth)
+    process_image_file(chain, input_image_path, output_image_path, operations, tile_size, num_workers)
+
+
+class PrefixRenderCache:
+    """
+    Keeps the rendered buffer of every prefix of an edit chain (within max_bytes).
+
+    render(operations) starts from the longest cached prefix, so changing the
+    factor of step k only re-renders steps k..n from the cached output of
+    step k-1 instead of the whole chain. Buffers are evicted least recently
+    used first; an evicted prefix just falls back to a shorter one.
+    L-channel runs are not fused here, every step keeps its own buffer.
+
+    - The source counts against max_bytes unless it is a np.memmap (file backed).
+    - band_rows: buffers are cached per full-width row band, so a frame whose
+      prefixes do not fit the budget whole still keeps some of its bands.
+      A render never evicts the bands it has just used or produced.
+    - step_bit_depth: see render_chain; matches a chain of 8/16-bit image files.
+    """
+
+    def __init__(self, source: np.ndarray, max_bytes: int = 1 << 30, band_rows: Optional[int] = None,
+                 step_bit_depth: Optional[int] = None):
+        self.source = source
+        self.max_bytes = max_bytes
+        self.band_rows = band_rows or source.shape[0]
+        self.step_bit_depth = step_bit_depth
+        self.source_bytes = 0 if isinstance(source, np.memmap) else source.nbytes
+        self.current_bytes = self.source_bytes
+        self.steps_rendered = 0
+        self.steps_reused = 0
+        self._entries: "OrderedDict[Tuple[Tuple[Tuple[str, float], ...], int], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bands(self) -> range:
+        """ Top row of every band """
+        return range(0, self.source.shape[0], self.band_rows)
+
+    def cached_length(self, operations: List[Tuple[str, float]]) -> int:
+        """ Length of the longest prefix of operations cached for every band (0: only the source) """
+        operations = tuple((name, factor) for name, factor in operations)
+        with self._lock:
+            for length in range(len(operations), 0, -1):
+                if all((operations[:length], top) in self._entries for top in self.bands()):
+                    return length
+        return 0
+
+    def render(self, operations: List[Tuple[str, float]]) -> np.ndarray:
+        """Render the (name, factor) steps on the source. The result is read-only when it is a cached buffer."""
+        operations = tuple((name, factor) for name, factor in operations)
+        with self._lock:
+            in_use = set()
+            if self.band_rows >= self.source.shape[0]:
+                return self._render_band(operations, 0, in_use)
+            out = np.empty(self.source.shape, np.float32)
+            for top in self.bands():
+                out[top:top + self.band_rows] = self._render_band(operations, top, in_use)
+            return out
+
+    def _render_band(self, operations, top: int, in_use: set) -> np.ndarray:
+        start, img = 0, self.source[top:top + self.band_rows]
+        for length in range(len(operations), 0, -1):
+            cached = self._entries.get((operations[:length], top))
+            if cached is not None:
+                self._entries.move_to_end((operations[:length], top))
+                in_use.add((operations[:length], top))
+                start, img = length, cached
+                break
+        self.steps_reused += start
+
+        for index in range(start, len(operations)):
+            img = render_chain(np.asarray(img, np.float32), [operations[index]], step_bit_depth=self.step_bit_depth)
+            self.steps_rendered += 1
+            self._put((operations[:index + 1], top), img, in_use)
+        return img
+
+    def _put(self, key, img: np.ndarray, in_use: set):
+        evictable = [old for old in self._entries if old not in in_use]
+        while self.current_bytes + img.nbytes > self.max_bytes and evictable:
+            self.current_bytes -= self._entries.pop(evictable.pop(0)).nbytes
+        if self.current_bytes + img.nbytes > self.max_bytes:
+            return
+        img.flags.writeable = False
+        self._entries[key] = img
+        self.current_bytes += img.nbytes
+        in_use.add(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = self.source_bytes
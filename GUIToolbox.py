@@ -1,20 +1,16 @@
 import os
 from typing import List, Callable
 import numpy as np
-from Levenshtein import distance
-
-import pyautogui
 
 import cv2
-import matplotlib.pyplot as plt
-from io import BytesIO
 import ast
 
 from PIL import Image, ImageEnhance, ExifTags
 from ImageProcessing import *
 
 from Utils import pretty_print_content
-from Toolbox import tool_doc
+from Toolbox import tool_doc, SessionRetention
+from Retention import SessionJanitor
 from GUIUtils import *
 
 def safe_color_str_to_list(input_str):
@@ -61,9 +57,9 @@ CURRENT_STATUS_TEMPLATE = {
 }
 
 
-class LightroomGUIToolBox:
+class LightroomGUIToolBox(SessionRetention):
 
-    def __init__(self, config_dic, output_dir_name, debug=True, image_name='test_image', clip_history_messages=False):
+    def __init__(self, config_dic, output_dir_name, debug=True, image_name='test_image', clip_history_messages=False, retention_policy=None):
         self.config = config_dic
         self.output_dir_path = output_dir_name
         self.image_name = image_name
@@ -87,6 +83,8 @@ class LightroomGUIToolBox:
         self.user_messages = []  # Record of messages back to user
         self.satisfactory_status = False
         self.log_file_path = os.path.join(self.output_dir_path, "processing_log.txt")
+        # Retention.RetentionPolicy for the preview / histogram screenshots (keep_previews=False to delete old ones)
+        self.janitor = SessionJanitor(retention_policy, output_dir_name, self.retention_states) if retention_policy is not None else None
 
         self.get_current_GUI_status()
         self.user_message_figure()
@@ -147,8 +145,9 @@ class LightroomGUIToolBox:
         get_GUI_preview_image(self.config, save_path=image_path)
         get_GUI_histo_image(self.config, save_path=histo_path)
 
-        self.image_paths.append(image_path)
-        self.histogram_paths.append(histo_path)
+        with self.retention_lock():
+            self.image_paths.append(image_path)
+            self.histogram_paths.append(histo_path)
         self.current_status["current_image"] = image_path
         self.current_status["histogram_image"] = histo_path
         self.current_status["processing_image_step"] = self.global_step
@@ -357,8 +356,9 @@ class LightroomGUIToolBox:
         }
         new_image_path = os.path.join(self.output_dir_path, f"{self.image_name}_{self.global_step+1}.jpg")
         new_histo_path = os.path.join(self.output_dir_path, f"{self.image_name}_{self.global_step+1}_histo.jpg")
-        self.image_paths.append(new_image_path)
-        self.histogram_paths.append(new_histo_path)
+        with self.retention_lock():
+            self.image_paths.append(new_image_path)
+            self.histogram_paths.append(new_histo_path)
         self.current_status["current_image"] = new_image_path
         self.current_status["histogram_image"] = new_histo_path
 
@@ -387,6 +387,13 @@ class LightroomGUIToolBox:
         get_GUI_preview_image(self.config, save_path=new_image_path)
         get_GUI_histo_image(self.config, save_path=new_histo_path)
         self.user_message_figure()
+        self.apply_retention()
+
+    def close(self):
+        """ Run a last retention pass and stop the retention thread """
+        if self.janitor is not None:
+            self.janitor.close()
+            self.janitor = None
 
     @tool_doc([
         {
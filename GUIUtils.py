@@ -5,8 +5,12 @@ import time
 import numpy as np
 import cv2
 from PIL import Image
-from pynput import mouse
-import pyautogui
+
+from Utils import LazyModule
+
+# GUI automation only: imported on first use, so headless processes never load them
+mouse = LazyModule("pynput.mouse")
+pyautogui = LazyModule("pyautogui")
 
 
 VALUE_RANGE = {
@@ -0,0 +1,122 @@
+from typing import Callable, List, Optional
+import numpy as np
+import cv2
+
+
+# Layout of the former matplotlib figure (6x6 in at 100 dpi, saved with bbox_inches='tight'),
+# kept so the histogram images shown to the LLM look the same
+CANVAS_WIDTH, CANVAS_HEIGHT = 485, 482
+AXES_LEFT, AXES_TOP = 10, 10  # data area; the frame is centred on its edges like a matplotlib spine
+AXES_WIDTH, AXES_HEIGHT = 465, 462
+FRAME_WIDTH = 3
+GUIDE_LINE_WIDTH = 3
+GUIDE_LINE_DASH, GUIDE_LINE_GAP = 11, 4
+GUIDE_LINE_GRAY = 128
+
+
+def render_histogram(hist: np.ndarray, auxiliary_lines: bool = True, line_positions: Optional[List[float]] = None) -> np.ndarray:
+    """
+    Rasterize a Photoshop-style histogram straight into a uint8 RGB array:
+    black bars on white, a 3 px black frame, dashed gray guide lines.
+
+    Parameters:
+        hist (np.ndarray): bin counts, shape (bins,) or (bins, 1).
+        auxiliary_lines (bool): draw the guide lines.
+        line_positions (list): guide line positions in bins. Defaults to 1/4, 1/2, 3/4.
+
+    Returns:
+        np.ndarray: uint8, (CANVAS_HEIGHT, CANVAS_WIDTH, 3).
+    """
+    hist = np.asarray(hist, dtype=np.float64).ravel()
+    bins = hist.shape[0]
+    canvas = np.full((CANVAS_HEIGHT, CANVAS_WIDTH), 255, dtype=np.uint8)
+    plot = canvas[AXES_TOP:AXES_TOP + AXES_HEIGHT, AXES_LEFT:AXES_LEFT + AXES_WIDTH]
+
+    # Bars: bin of every pixel column (sampled at the column centre), y range [0, max * 1.05]
+    column_bins = ((np.arange(AXES_WIDTH) + 0.5) * bins / AXES_WIDTH).astype(np.intp)
+    peak = hist.max() * 1.05
+    bar_heights = np.round(hist[column_bins] / peak * AXES_HEIGHT) if peak > 0 else np.zeros(AXES_WIDTH)
+    rows_from_bottom = np.arange(AXES_HEIGHT, 0, -1)[:, None]
+    plot[rows_from_bottom <= bar_heights[None, :]] = 0
+
+    # Dashed guide lines, drawn over the bars
+    if auxiliary_lines:
+        if not line_positions:
+            line_positions = [bins // 4, bins // 2, bins * 3 // 4]
+        dashes = (np.arange(AXES_HEIGHT) % (GUIDE_LINE_DASH + GUIDE_LINE_GAP)) < GUIDE_LINE_DASH
+        for position in line_positions:
+            centre = int(round(position * AXES_WIDTH / bins))
+            first = max(centre - GUIDE_LINE_WIDTH // 2, 0)
+            last = min(centre + GUIDE_LINE_WIDTH // 2 + 1, AXES_WIDTH)
+            plot[dashes, first:last] = GUIDE_LINE_GRAY
+
+    # Frame, centred on the edges of the data area
+    half = FRAME_WIDTH // 2
+    left, top = AXES_LEFT - half, AXES_TOP - half
+    right, bottom = AXES_LEFT + AXES_WIDTH + half + 1, AXES_TOP + AXES_HEIGHT + half + 1
+    canvas[top:top + FRAME_WIDTH, left:right] = 0
+    canvas[bottom - FRAME_WIDTH:bottom, left:right] = 0
+    canvas[top:bottom, left:left + FRAME_WIDTH] = 0
+    canvas[top:bottom, right - FRAME_WIDTH:right] = 0
+
+    return np.repeat(canvas[..., None], 3, axis=-1)
+
+
+class ColorHistogram:
+    """
+    Exact colour histogram of an 8-bit / 16-bit RGB image: its distinct colours and their pixel counts.
+
+    Every ImageProcessing op is pointwise (each output pixel depends only on the input
+    pixel's colour), so the histogram of the next image state is obtained by pushing the
+    distinct colours through the op's transfer function and merging the ones that land
+    on the same code. Counting it again from the written file is then unnecessary:
+    no decode and no full-frame pass, only one op call on the (fewer) distinct colours.
+    """
+
+    def __init__(self, colors: np.ndarray, counts: np.ndarray):
+        self.colors = colors  # (N, 3) RGB codes, uint8 or uint16
+        self.counts = counts  # (N,) pixel counts
+
+    @classmethod
+    def from_codes(cls, codes: np.ndarray, is_bgr: bool = True) -> "ColorHistogram":
+        """Count an (H, W, 3) uint8 / uint16 image (OpenCV BGR order by default)."""
+        pixels = codes.reshape(-1, codes.shape[-1])[:, :3]
+        if is_bgr:
+            pixels = pixels[:, ::-1]
+        return cls._merge(pixels, np.ones(pixels.shape[0], dtype=np.int64))
+
+    @classmethod
+    def from_image_file(cls, image_path: str) -> "ColorHistogram":
+        """Recount from an image file (the fallback for non-pointwise ops)."""
+        image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError(f"Can not read image: {image_path}")
+        if image.ndim == 2:
+            image = np.repeat(image[..., None], 3, axis=-1)
+        return cls.from_codes(image)
+
+    @staticmethod
+    def _merge(colors: np.ndarray, counts: np.ndarray) -> "ColorHistogram":
+        # Pack each colour into one int64 so np.unique works on scalars
+        packed = (colors[:, 0].astype(np.int64) << 32) | (colors[:, 1].astype(np.int64) << 16) | colors[:, 2]
+        unique, first, inverse = np.unique(packed, return_index=True, return_inverse=True)
+        merged_counts = np.bincount(inverse.ravel(), weights=counts, minlength=unique.shape[0]).astype(np.int64)
+        return ColorHistogram(colors[first], merged_counts)
+
+    def apply(self, op: Callable[[np.ndarray, float], np.ndarray], factor) -> "ColorHistogram":
+        """
+        Histogram after a pointwise float op (an ImageProcessing *_array function), quantized
+        back to the same bit depth the same way write_image_float does.
+        """
+        max_value = np.iinfo(self.colors.dtype).max
+        row = (self.colors.astype(np.float32) / max_value)[None]
+        mapped = np.clip(op(row, factor)[0], 0.0, 1.0)
+        codes = np.round(mapped * max_value).astype(self.colors.dtype)
+        return self._merge(codes, self.counts)
+
+    def luminance_histogram(self, bins: int = 256) -> np.ndarray:
+        """Gray-level (cv2.COLOR_RGB2GRAY) histogram with `bins` uniform bins, as cv2.calcHist would count it."""
+        max_value = np.iinfo(self.colors.dtype).max
+        gray = cv2.cvtColor(np.ascontiguousarray(self.colors[None]), cv2.COLOR_RGB2GRAY)[0]
+        bin_index = gray.astype(np.int64) * bins // (max_value + 1)
+        return np.bincount(bin_index, weights=self.counts, minlength=bins)
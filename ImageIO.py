@@ -0,0 +1,400 @@
+import contextlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Collection, Optional, Tuple
+import numpy as np
+import cv2
+
+from TileProcessing import TileSize, iter_tiles
+
+
+# ============================================================================
+# 统一的读写层
+# - read_image_float / write_image_float: 解码 / 编码, 统一为 float32, [0,1], RGB
+# - DECODED_IMAGE_CACHE: 进程内的解码缓存 (LRU, 按字节数限额)
+#   整幅处理时, process_image_file 把写出的数组本身 (不拷贝) 作为 "再读一次会得到的" 结果交给缓存,
+#   下一步操作读上一步的输出时直接从内存取, 不必再解码一次。
+#   分块 / 内存映射模式是为了限制内存, 不往缓存里放整幅数组
+# ============================================================================
+
+
+class DecodedImageCache:
+    """
+    已解码图像的 LRU 缓存, key 为 (绝对路径, mtime_ns, 文件大小)。
+    文件被改写后 mtime/size 变化, 旧条目自然失效, 不会读到过期数据。
+
+    缓存里的数组是只读的 (flags.writeable=False), 调用方需要修改时自己拷贝。
+    单幅超过 max_bytes 的图像不缓存; max_bytes=0 即关闭缓存。
+    默认 256 MB: 装得下全部 512 px 预览和一幅 12 MP 左右的 float32 全分辨率图像,
+    更大的图像不缓存, 缓存不会在每一步之外再常驻一整幅大图; 需要时设置 DECODED_IMAGE_CACHE.max_bytes。
+    """
+
+    def __init__(self, max_bytes: int = 256 << 20):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[tuple, np.ndarray, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_key(image_path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def fits(self, nbytes: int) -> bool:
+        return 0 < nbytes <= self.max_bytes
+
+    def get(self, image_path: str) -> Optional[Tuple[np.ndarray, int]]:
+        """返回 (img, bit_depth) 或 None。"""
+        path = os.path.abspath(image_path)
+        file_key = self._file_key(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != file_key:
+                if entry is not None:
+                    self._remove(path)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, image_path: str, img: np.ndarray, bit_depth: int) -> bool:
+        """
+        缓存 image_path 当前内容解码后的结果。img 归缓存所有 (会被设为只读)。
+        返回是否放入了缓存。
+        """
+        path = os.path.abspath(image_path)
+        file_key = self._file_key(path)
+        if file_key is None or not self.fits(img.nbytes):
+            return False
+        img.flags.writeable = False
+        with self._lock:
+            if path in self._entries:
+                self._remove(path)
+            self._entries[path] = (file_key, img, bit_depth)
+            self.current_bytes += img.nbytes
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def alias(self, source_path: str, target_path: str) -> bool:
+        """
+        target_path 与 source_path 内容相同 (硬链接 / 拷贝) 时, 让它共用 source_path 已缓存的数组, 不必再解码。
+        字节数按两个条目分别计入 (保守估计)。返回是否放入了缓存。
+        """
+        cached = self.get(source_path)
+        if cached is None:
+            return False
+        return self.put(target_path, cached[0], cached[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, path: str):
+        _, img, _ = self._entries.pop(path)
+        self.current_bytes -= img.nbytes
+
+
+DECODED_IMAGE_CACHE = DecodedImageCache()
+
+# 写出后可以直接放入缓存的格式 (解码结果与写入的量化值一致)
+LOSSLESS_EXTENSIONS = {'.png', '.tif', '.tiff', '.bmp', '.ppm', '.pgm', '.pnm'}
+
+
+def is_npy(image_path: str) -> bool:
+    return os.path.splitext(image_path)[-1].lower() == '.npy'
+
+
+def link_image(source_path: str, target_path: str) -> bool:
+    """
+    让 target_path 成为 source_path 的另一个名字 (硬链接): 不拷贝任何字节, 数据在最后一个名字删除后才释放。
+    跨文件系统等无法硬链接时退化为文件拷贝。解码缓存中的数组同样共用。
+
+    两个名字共享同一份数据, 之后不能原地改写其中任何一个文件 (本项目的写入都经过 replacing_file)。
+    返回是否为硬链接。
+    """
+    if os.path.lexists(target_path):
+        os.remove(target_path)  # 不能原地覆盖: 它可能也是别的文件的硬链接
+    try:
+        os.link(source_path, target_path)
+        linked = True
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+        linked = False
+    DECODED_IMAGE_CACHE.alias(source_path, target_path)
+    return linked
+
+
+@contextlib.contextmanager
+def replacing_file(output_path: str):
+    """
+    with replacing_file(path) as temp_path: 写 temp_path, 成功后 os.replace 为 path。
+    path 可能是硬链接或 BlobStore 的符号链接: 原地写会改掉共享这份数据的其它名字, 替换只换掉这一个名字。
+    临时文件保留扩展名 (cv2.imwrite / np.save / PIL 据此选择格式), 失败时删除。
+    """
+    root, extension = os.path.splitext(output_path)
+    temp_path = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{extension}"
+    try:
+        yield temp_path
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+
+
+def imwrite(output_image_path: str, img: np.ndarray):
+    """ cv2.imwrite, 替换而不是原地改写已有的文件 (见 replacing_file); 写入失败时抛出 IOError 而不是返回 False """
+    with replacing_file(output_image_path) as temp_path:
+        if not cv2.imwrite(temp_path, img):
+            raise IOError(f"无法写入图像: {output_image_path}")
+
+
+def normalize_image(raw: np.ndarray, max_value: float, is_bgr: bool) -> np.ndarray:
+    """
+    把解码后的原始数组 (或其中一块) 转为 float32, [0,1], RGB。
+    """
+    img = raw.astype(np.float32) / max_value if max_value != 1.0 else raw
+
+    if img.ndim == 2:
+        # 单通道 => 扩为3通道
+        img = np.stack([img, img, img], axis=-1)
+    elif is_bgr:
+        # BGR(A) -> RGB, 同时去掉 alpha 通道
+        img = img[..., 2::-1]
+    elif img.shape[-1] == 4:
+        # 有 alpha 通道 => 取前三通道
+        img = img[..., :3]
+
+    return np.ascontiguousarray(img, dtype=np.float32)
+
+
+def read_image_float(input_image_path: str, tile_size: TileSize = None,
+                     use_cache: bool = True) -> Tuple[np.ndarray, int]:
+    """
+    读取图像并转换为 float32, [0,1], RGB。
+
+    参数:
+        input_image_path (str): 输入路径（.npy / 8 位 / 16 位）
+        tile_size: 不为 None 时按块转换到预先分配的 float32 数组,
+                   避免整幅的中间拷贝 (见 TileProcessing.iter_tiles)
+        use_cache (bool): 先查 DECODED_IMAGE_CACHE, 未命中时解码; 整幅读取 (tile_size 为 None) 时放入缓存。
+                          命中或放入缓存时返回的数组是只读的。分块读取不放入缓存 (限制内存的模式)
+
+    返回:
+        (img, bit_depth_in): img 为 float32 [0,1] RGB, bit_depth_in 为 8 或 16
+                             (.npy 视为高精度 => 16)
+    """
+    if use_cache:
+        cached = DECODED_IMAGE_CACHE.get(input_image_path)
+        if cached is not None:
+            return cached
+
+    if is_npy(input_image_path):
+        # 视为已经是 [0,1] 的 float32/64，通道顺序 RGB
+        # 分块时用内存映射, 只把当前块读入内存, 不再整幅 np.load 后再拷贝一次
+        raw = np.load(input_image_path, mmap_mode=None if tile_size is None else 'r')
+        if raw.dtype not in [np.float32, np.float64]:
+            raise ValueError(".npy 图像应当是 float32/64。")
+        # 对于 npy，默认视为高精度 => bit_depth_in = 16
+        bit_depth_in, max_value, is_bgr = 16, 1.0, False
+    else:
+        # 用 OpenCV 读取 => BGR
+        raw = cv2.imread(input_image_path, cv2.IMREAD_UNCHANGED)
+        if raw is None:
+            raise IOError(f"无法读取图像: {input_image_path}")
+
+        # 判断是 8 位 还是 16 位
+        if raw.dtype == np.uint8:
+            bit_depth_in, max_value = 8, 255.0
+        elif raw.dtype == np.uint16:
+            bit_depth_in, max_value = 16, 65535.0
+        else:
+            raise ValueError("仅支持 8 位 或 16 位图像。")
+        is_bgr = raw.ndim == 3
+
+    if tile_size is None:
+        img = normalize_image(raw, max_value, is_bgr)
+    else:
+        img = np.empty(raw.shape[:2] + (3,), dtype=np.float32)
+        for rows, cols in iter_tiles(raw.shape[0], raw.shape[1], tile_size):
+            img[rows, cols] = normalize_image(raw[rows, cols], max_value, is_bgr)
+
+    if use_cache and tile_size is None:
+        DECODED_IMAGE_CACHE.put(input_image_path, img, bit_depth_in)
+    return img, bit_depth_in
+
+
+# JPEG: 可以在 DCT 域按 1/2, 1/4, 1/8 缩小解码 (PIL draft), 生成预览时不必解码全分辨率
+JPEG_EXTENSIONS = {'.jpg', '.jpeg', '.jpe', '.jfif'}
+
+# EXIF Orientation => cv2.rotate 参数 (与工具箱一直以来的处理方式一致, 只处理 3 / 6 / 8)
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_ROTATIONS = {3: cv2.ROTATE_180, 6: cv2.ROTATE_90_COUNTERCLOCKWISE, 8: cv2.ROTATE_90_CLOCKWISE}
+
+
+def preview_size(width: int, height: int, max_size: int) -> Tuple[int, int]:
+    scale_factor = min(max_size / width, max_size / height)
+    return int(width * scale_factor), int(height * scale_factor)
+
+
+def read_image_preview(image_path: str, max_size: int = 512,
+                       full_orientations: Collection[int] = ()) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[int]]:
+    """
+    为预览读取图像: 文件只读一次, EXIF 从同一份数据中解析。
+
+    - JPEG: PIL draft 在 DCT 域缩小解码 (不小于目标尺寸的最大 1/2^k 缩放), 再 LANCZOS 缩放到目标尺寸,
+            不解码全分辨率图像
+    - 其它格式无法缩小解码: 完整解码 (cv2 IMREAD_UNCHANGED) 后缩放, 全分辨率数组一并返回
+    - full_orientations: EXIF Orientation 在其中时 JPEG 也完整解码 (调用方反正需要全分辨率图像, 例如要旋转后重新编码),
+                         避免先缩小解码再完整解码一次
+
+    返回:
+        (preview, full, orientation):
+            preview 为 OpenCV 布局 (BGR(A) / 灰度), 两边都不超过 max_size, 未按 EXIF 旋转;
+            full 为完整解码的数组, 缩小解码的 JPEG 时为 None (需要时用 read_image_native 读取);
+            orientation 为 EXIF Orientation (没有时为 None)
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    with open(image_path, 'rb') as image_file:
+        data = image_file.read()
+
+    orientation = None
+    try:
+        with Image.open(BytesIO(data)) as pil_img:
+            if hasattr(pil_img, '_getexif'):
+                exif = pil_img._getexif()
+                orientation = exif.get(EXIF_ORIENTATION_TAG) if exif else None
+
+            if (os.path.splitext(image_path)[-1].lower() in JPEG_EXTENSIONS and pil_img.mode in ('L', 'RGB')
+                    and orientation not in full_orientations):
+                size = preview_size(pil_img.width, pil_img.height, max_size)
+                pil_img.draft('L' if pil_img.mode == 'L' else 'RGB', size)
+                reduced = np.asarray(pil_img.convert('L' if pil_img.mode == 'L' else 'RGB'))
+                if reduced.ndim == 3:
+                    reduced = np.ascontiguousarray(reduced[..., ::-1])  # RGB => BGR
+                return cv2.resize(reduced, size, interpolation=cv2.INTER_LANCZOS4), None, orientation
+    except (OSError, SyntaxError):
+        pass  # PIL 无法解析: 交给 OpenCV
+
+    full = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if full is None:
+        raise IOError(f"无法读取图像: {image_path}")
+    size = preview_size(full.shape[1], full.shape[0], max_size)
+    return cv2.resize(full, size, interpolation=cv2.INTER_LANCZOS4), full, orientation
+
+
+def read_image_native(input_image_path: str) -> np.ndarray:
+    """
+    读取 8 位 / 16 位图像, 不做 float 转换, 保持 OpenCV 的 BGR(A) / 灰度布局。
+    供能直接在整数上计算的操作使用 (见 ImageProcessing.channel_shift_array)。
+    """
+    raw = cv2.imread(input_image_path, cv2.IMREAD_UNCHANGED)
+    if raw is None:
+        raise IOError(f"无法读取图像: {input_image_path}")
+    if raw.dtype not in [np.uint8, np.uint16]:
+        raise ValueError("仅支持 8 位 或 16 位图像。")
+    return raw
+
+
+def write_image_native(output_image_path: str, raw: np.ndarray):
+    """
+    保存 8 位 / 16 位 BGR 图像 (read_image_native 的逆操作)。
+    不放入解码缓存: 整数路径本来就不生成 float 数组, 不为缓存再转换出一整幅 float32。
+    """
+    imwrite(output_image_path, raw)
+
+
+def _quantize_image(img: np.ndarray, bit_depth: int) -> np.ndarray:
+    """
+    float32 [0,1] RGB => 8 位或 16 位 BGR。
+    """
+    img = np.clip(img, 0.0, 1.0)
+    if bit_depth == 8:
+        # 输出 8 位
+        out = (img * 255.0).round().astype(np.uint8)
+    else:
+        # 输出 16 位
+        out = (img * 65535.0).round().astype(np.uint16)
+    return out[..., ::-1]
+
+
+def quantize_float(img: np.ndarray, bit_depth: int) -> np.ndarray:
+    """
+    float32 [0,1] RGB => 写成 bit_depth 位图像再用 read_image_float 读回会得到的值 (仍为 float32), 不经过文件。
+    供在内存里重放 "每一步都写图像文件" 的渲染链使用 (见 EditChain.render_chain)。
+    """
+    max_value = 255.0 if bit_depth == 8 else 65535.0
+    out = np.clip(img, 0.0, 1.0).astype(np.float32, copy=False)
+    out *= max_value
+    np.round(out, out=out)
+    out /= max_value
+    return out
+
+
+def write_image_float(output_image_path: str, img: np.ndarray, bit_depth: int = 8, tile_size: TileSize = None,
+                      use_cache: bool = False):
+    """
+    保存 float32 [0,1] RGB 图像。已有的 output_image_path 被替换, 不会原地改写 (见 replacing_file)。
+
+    参数:
+        output_image_path (str): 输出路径。.npy 直接保存 float32 (不截断),
+                                 其它格式按 bit_depth 量化为 8 位或 16 位
+        img (np.ndarray): float32, [0,1], RGB
+        bit_depth (int): 8 或 16
+        tile_size: 不为 None 时按块量化到预先分配的整型数组
+        use_cache (bool): 把 img 本身交给 DECODED_IMAGE_CACHE 作为这个文件的解码结果, 不拷贝,
+                          下一步读这个文件时不必再解码。无损格式先把 img 原地量化 (变为再解码会得到的值),
+                          之后 img 是只读的: 只有不再使用 img 的调用方 (process_image_file) 才传 True。
+                          分块写入 (tile_size 不为 None) 和 JPEG 等有损格式不放入缓存
+    """
+    cache = use_cache and tile_size is None and DECODED_IMAGE_CACHE.fits(img.nbytes)
+
+    if is_npy(output_image_path):
+        # 保存为 float32 [.npy], [0,1], RGB
+        with replacing_file(output_image_path) as temp_path:
+            if tile_size is None:
+                img = img.astype(np.float32, copy=False)
+                np.save(temp_path, img)
+            else:
+                # 分块写入内存映射文件, 不生成整幅 float32 拷贝
+                out = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float32, shape=img.shape)
+                for rows, cols in iter_tiles(img.shape[0], img.shape[1], tile_size):
+                    out[rows, cols] = img[rows, cols]
+                out.flush()
+                del out
+        if cache:
+            DECODED_IMAGE_CACHE.put(output_image_path, img, 16)
+        return
+
+    # 无损格式: 再解码得到的正是量化后的值; JPEG 等有损格式不放入缓存
+    cache = (cache and img.dtype == np.float32 and img.flags.writeable
+             and os.path.splitext(output_image_path)[-1].lower() in LOSSLESS_EXTENSIONS)
+    if cache:
+        # 与 _quantize_image 相同的运算, 原地进行: img 变为 code / max_value, 只另外分配整型的 out
+        max_value = 255.0 if bit_depth == 8 else 65535.0
+        np.clip(img, 0.0, 1.0, out=img)
+        img *= max_value
+        np.round(img, out=img)
+        out = np.empty(img.shape, dtype=np.uint8 if bit_depth == 8 else np.uint16)
+        np.copyto(out, img[..., ::-1], casting='unsafe')
+        img /= max_value
+    elif tile_size is None:
+        out = np.ascontiguousarray(_quantize_image(img, bit_depth))
+    else:
+        out = np.empty(img.shape, dtype=np.uint8 if bit_depth == 8 else np.uint16)
+        for rows, cols in iter_tiles(img.shape[0], img.shape[1], tile_size):
+            out[rows, cols] = _quantize_image(img[rows, cols], bit_depth)
+    imwrite(output_image_path, out)
+    if cache:
+        DECODED_IMAGE_CACHE.put(output_image_path, img, bit_depth)
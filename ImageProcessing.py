@@ -1,43 +1,185 @@
 import os
-from typing import List, Callable
+from functools import lru_cache
+from typing import List, Callable, Tuple
 import numpy as np
 import cv2
-from PIL import Image, ImageEnhance
+
+from ToneLUT import ToneLUT
+from TileProcessing import TileSize, apply_tiled, resolve_num_workers, row_bands
+from ImageIO import (read_image_float, write_image_float, read_image_native, write_image_native,
+                     normalize_image, is_npy, replacing_file, DECODED_IMAGE_CACHE)
+
+
+# ============================================================================
+# 读写相关函数 (解码 / 编码 / 解码缓存见 ImageIO)
+# 所有调整函数都分为两层:
+# - xxx_array(img, factor): 内存接口, 输入/输出均为 float32, [0,1], RGB
+# - xxx(input_path, output_path, factor): 路径接口, 读图 -> xxx_array -> 写图
+# 这样工具箱/批处理可以在内存里串联多个操作, 不必每一步都编解码一次
+# ============================================================================
+
+
+def process_image_file(op: Callable[[np.ndarray, float], np.ndarray], input_image_path: str, output_image_path: str,
+                       factor, tile_size: TileSize = None, num_workers: int = 1):
+    """
+    路径接口的通用实现: 读图 -> op -> 写图。
+
+    参数:
+        op: 内存接口, 例如 contrast_array
+        input_image_path (str): 输入路径（.npy / 8 位 / 16 位）
+        output_image_path (str): 输出路径, 位深与输入一致
+        factor: 传给 op 的调整因子
+        tile_size: None => 整幅处理; 否则逐块处理并原地写回,
+                   峰值内存约为一幅 float32 + 一块的临时数组 (见 TileProcessing)
+        num_workers: 并行线程数, 1 => 单线程; None => cv2.getNumThreads()。
+                     多线程时按块并行 (tile_size 为 None 则按行带切分), 结果与单线程一致
+    .npy => .npy 时总是通过内存映射流式处理 (见 _process_npy_file)。
+    """
+    num_workers = resolve_num_workers(num_workers)
+    if is_npy(input_image_path) and is_npy(output_image_path):
+        _process_npy_file(op, input_image_path, output_image_path, factor, tile_size, num_workers)
+        return
+
+    img, bit_depth_in = read_image_float(input_image_path, tile_size)
+    if tile_size is None and num_workers == 1:
+        img = op(img, factor)
+    else:
+        band_size = row_bands(img.shape[0], num_workers) if tile_size is None else tile_size
+        # 解码缓存里的数组是只读的, 这时写到新数组里
+        img = apply_tiled(op, img, factor, band_size, out=img if img.flags.writeable else None, num_workers=num_workers)
+    # img 不再使用: 整幅处理时直接交给解码缓存 (不拷贝), 分块时 write_image_float 不缓存
+    write_image_float(output_image_path, img, bit_depth_in, tile_size, use_cache=True)
+
+
+def _process_npy_file(op: Callable[[np.ndarray, float], np.ndarray], input_image_path: str, output_image_path: str,
+                      factor, tile_size: TileSize, num_workers: int):
+    """
+    .npy => .npy: 输入和输出都用内存映射, op 逐行带/逐块流过,
+    内存里只有正在处理的块, 不会整幅读入也不会整幅拷贝。
+    tile_size 为 None 时按行带切分 (结果与整幅处理逐位一致)。
+    输入在解码缓存里时直接用缓存; 输出是内存映射文件, 不放入缓存 (否则又多出一整幅常驻内存)。
+    """
+    cached = DECODED_IMAGE_CACHE.get(input_image_path)
+    src = np.load(input_image_path, mmap_mode='r') if cached is None else cached[0]
+    if src.dtype not in [np.float32, np.float64]:
+        raise ValueError(".npy 图像应当是 float32/64。")
+    band_size = row_bands(src.shape[0], num_workers) if tile_size is None else tile_size
+
+    def normalized_op(tile: np.ndarray, tile_factor) -> np.ndarray:
+        # float64 / 单通道 / RGBA 的 .npy 也按 read_image_float 的规则转换
+        return op(normalize_image(tile, 1.0, False), tile_factor)
+
+    # 输入和输出可能是同一个文件: 输出写到临时文件, 两个内存映射都关闭之后才替换 output_image_path
+    with replacing_file(output_image_path) as temp_path:
+        dst = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float32, shape=src.shape[:2] + (3,))
+        apply_tiled(normalized_op, src, factor, band_size, out=dst, num_workers=num_workers)
+        dst.flush()
+        del dst, src, cached
+
+
+def _apply_lightness_transfer(img: np.ndarray, transfer: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+    """
+    在 Lab 空间只对 L 通道做逐点映射，a/b 通道保持不变。
+
+    参数:
+        img (np.ndarray): float32, [0,1], RGB
+        transfer: L 传递函数, 输入/输出均为 [0,1] 的 L
+
+    返回:
+        (np.ndarray) 调整后的图像, float32, RGB
+    """
+    # 使用 cv2 的浮点 Lab 转换 => L 范围 [0,100], a/b 大约 [-128, 127]
+    # (OpenCV 会假定输入是 [0,1] 的 sRGB+D65，输出 L 通道就是 [0,100])
+    lab = cv2.cvtColor(np.ascontiguousarray(img, dtype=np.float32), cv2.COLOR_RGB2LAB)
+
+    # 归一化 L 到 [0,1] 以便做曲线映射
+    L_norm = lab[..., 0] / 100.0
+    L_norm_adjusted = np.clip(transfer(L_norm), 0.0, 1.0)
+
+    # 拼回 Lab => 转回 RGB [0,1]
+    lab[..., 0] = L_norm_adjusted * 100.0
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
 
 
 # ============================================================================
 # 亮度调整相关函数
 # 包括:
 # - black(): 调整暗部 (类似 Lightroom 的 Blacks)
-# - white(): 调整亮部 (类似 Lightroom 的 Whites) 
+# - white(): 调整亮部 (类似 Lightroom 的 Whites)
 # - tone(): 调整中间调 (类似 Lightroom 的 Exposure)
 # ============================================================================
 
 
-def exposure(input_image_path: str, output_image_path: str, exposure_factor: float):
+def exposure_tone_mapping(values: np.ndarray, exposure_factor: float) -> np.ndarray:
+    """
+    Gamma curve used by exposure(), applied to each RGB channel.
+    -- values: np.ndarray, [0,1].
+    -- exposure_factor: float, the factor to adjust the exposure. [-5, 5]
+    """
+    gamma = 1.0 / (1.0 + exposure_factor) if exposure_factor >= 0 else 1.0 - exposure_factor
+    return np.power(values, gamma)
+
+
+def exposure_array(img: np.ndarray, exposure_factor: float) -> np.ndarray:
+    """
+    Adjust the exposure of a float32 [0,1] RGB image with a gamma curve.
+    -- img: np.ndarray, float32, [0,1], RGB.
+    -- exposure_factor: float, the factor to adjust the exposure. [-5, 5]
+    """
+    return get_tone_lut("exposure", exposure_factor)(img)
+
+
+def exposure(input_image_path: str, output_image_path: str, exposure_factor: float, tile_size: TileSize = None, num_workers: int = 1):
     """
     @2024/10/27
     Adjust the exposure of the image.
     -- input_image_path: str, the path of the input image.
     -- output_image_path: str, the path of the output image.
     -- exposure_factor: float, the factor to adjust the exposure. [-5, 5]
+    -- tile_size: int or (rows, cols), process the image tile by tile to bound memory. None for full frame.
+    -- num_workers: int, number of threads working on row bands / tiles. None for cv2.getNumThreads().
+    """
+    process_image_file(exposure_array, input_image_path, output_image_path, exposure_factor, tile_size, num_workers)
+    print(output_image_path)
+
+
+def s_curve_contrast(L_channel: np.ndarray, c: float) -> np.ndarray:
+    """
+    S 型对比度曲线示例:
+    L_out = 0.5 + tanh( alpha * (L_in - 0.5) ) * 0.5
+    alpha = 1 + c * K
+    c: [-1,1], c>0 => 增强对比, c<0 => 减弱对比
+    K: 一个常数, 控制对比度响应强度
     """
-    with Image.open(input_image_path) as img:
-        # Convert to NumPy array
-        img_np = np.array(img)
-        gamma = 1.0 / (1.0 + exposure_factor) if exposure_factor >= 0 else 1.0 - exposure_factor
+    # 中心点 0.5 保持不变
+    # alpha 决定曲线陡峭程度
+    # c>0 => 越大越陡峭 => 对比更强
+    # c<0 => 越小越平 => 对比更弱
+    K = 1.0  # 你可以调大/调小该常数，增减曲线响应
+    alpha = 1.0 + c * K
+
+    # (L_in - 0.5) => 偏离中心
+    # tanh(...) => S 型
+    # 后面 * 0.5 + 0.5 => 映射回 [0,1] 大致区间
+    out = 0.5 + np.tanh(alpha * (L_channel - 0.5)) * 0.5
+    return out
+
 
-        gamma_table = [np.power(x / 255.0, gamma) * 255.0 for x in range(256)]
-        gamma_table = np.round(np.array(gamma_table)).astype(np.uint8)
-        adjusted_img = cv2.LUT(img_np, gamma_table)
+def contrast_array(img: np.ndarray, contrast_factor: float) -> np.ndarray:
+    """
+    对比度调整的内存接口: 在 Lab 空间里对 L 通道做 S 型曲线映射。
+
+    参数:
+        img (np.ndarray): float32, [0,1], RGB
+        contrast_factor (float): 对比度调整因子, 范围 -100 ~ 100
 
-        adjusted_img = Image.fromarray(adjusted_img)
-        
-        adjusted_img.save(output_image_path)
-        print(output_image_path)
+    返回:
+        (np.ndarray) 调整后的图像, float32, [0,1], RGB
+    """
+    return _apply_lightness_transfer(img, get_tone_lut("contrast", contrast_factor))
 
 
-def contrast(input_image_path: str, output_image_path: str, contrast_factor: float):  # checked 2025/01/02
+def contrast(input_image_path: str, output_image_path: str, contrast_factor: float, tile_size: TileSize = None, num_workers: int = 1):  # checked 2025/01/02
     """
     模拟类似 Lightroom 的“对比度”调整 (示例级，不是官方算法)，
     在 Lab 空间里对 L 通道做 S 型曲线映射。
@@ -48,242 +190,128 @@ def contrast(input_image_path: str, output_image_path: str, contrast_factor: flo
         contrast_factor (float): 对比度调整因子, 范围 -100 ~ 100
             * >0 => 增强对比度
             * <0 => 减弱对比度
+        tile_size (int / tuple): 分块大小, None => 整幅处理 (见 process_image_file)
+        num_workers (int): 并行线程数, None => cv2.getNumThreads() (见 process_image_file)
+    """
+    process_image_file(contrast_array, input_image_path, output_image_path, contrast_factor, tile_size, num_workers)
 
-    返回:
-        (np.ndarray) 调整后的图像, float32, [0,1], RGB
+
+def shadows_tone_mapping(L_channel: np.ndarray, factor: float) -> np.ndarray:
+    """
+    使用 S 形曲线来调整阴影：
+    - factor > 0 => 压暗阴影
+    - factor < 0 => 提亮阴影
+    - factor = 0 => 原样返回
+
+    下面使用了两个内部参数：
+    - shadow_threshold: 阴影阈值，决定分界点（越大则“阴影”范围越宽）
+    - shadow_compress: 压缩系数，避免提升或压暗过度
     """
+    # 你可以根据需要调节这两个参数
+    shadow_threshold = 0.4   # [0,1]，越大则阴影范围越宽
+    shadow_compress  = 0.5   # [0,1]，越大则压缩越明显
 
-    # 0) 规范化 contrast_factor => [-1,1]
-    #    一般我们将用户输入[-100,100]映射到[-1,1]做内部运算
-    contrast_intensity = np.clip(contrast_factor / 100.0, -1.0, 1.0)
+    # 如果不需要调整，直接返回原 L
+    if abs(factor) < 1e-8:
+        return L_channel
 
-    # 1) 读取并转换到 float32 [0,1], RGB
-    ext_in = os.path.splitext(input_image_path)[-1].lower()
+    # 正负标记: factor > 0 => 压暗, factor < 0 => 提亮
+    sign = np.sign(factor)
+    # 取绝对值做强度
+    strength = abs(factor)
 
-    if ext_in == '.npy':
-        img = np.load(input_image_path)
-        if img.ndim == 2:
-            img = np.stack([img, img, img], axis=-1)
-        elif img.shape[-1] == 4:
-            img = img[..., :3]
-        
-        if img.dtype not in [np.float32, np.float64]:
-            raise ValueError(".npy 图像应当是 float32/64。")
+    # 整幅数组一次计算 (替代逐像素 np.nditer 循环)
+    # 1) 计算归一化 t ∈ [0,1]，阴影区域之外截断为 1 (此时 base = 0)
+    t = np.minimum(L_channel / shadow_threshold, 1.0)
 
-        img = img.astype(np.float32)
-        bit_depth_in = 16  # 假设 .npy 来自高精度
-    else:
-        img_bgr = cv2.imread(input_image_path, cv2.IMREAD_UNCHANGED)
-
-        if img_bgr.dtype == np.uint8:
-            bit_depth_in = 8
-            img = (img_bgr.astype(np.float32) / 255.0)
-        elif img_bgr.dtype == np.uint16:
-            bit_depth_in = 16
-            img = (img_bgr.astype(np.float32) / 65535.0)
-        else:
-            raise ValueError("暂不支持此类型的位深")
-
-        img = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-
-    # 2) 转到 Lab 空间 => L ∈ [0,100]
-    lab = cv2.cvtColor(img.astype(np.float32), cv2.COLOR_RGB2LAB)
-
-    L = lab[..., 0]  # [0,100]
-    A = lab[..., 1]
-    B = lab[..., 2]
-
-    # 归一到 [0,1], 便于做曲线
-    L_norm = L / 100.0
-
-    # 3) 对比度映射 (S 曲线)
-    def s_curve_contrast(L_channel: np.ndarray, c: float) -> np.ndarray:
-        """
-        S 型对比度曲线示例:
-        L_out = 0.5 + tanh( alpha * (L_in - 0.5) ) * 0.5
-        alpha = 1 + c * K
-        c: [-1,1], c>0 => 增强对比, c<0 => 减弱对比
-        K: 一个常数, 控制对比度响应强度
-        """
-        # 中心点 0.5 保持不变
-        # alpha 决定曲线陡峭程度
-        # c>0 => 越大越陡峭 => 对比更强
-        # c<0 => 越小越平 => 对比更弱
-        K = 1.0  # 你可以调大/调小该常数，增减曲线响应
-        alpha = 1.0 + c * K
-
-        # (L_in - 0.5) => 偏离中心
-        # tanh(...) => S 型
-        # 后面 * 0.5 + 0.5 => 映射回 [0,1] 大致区间
-        out = 0.5 + np.tanh(alpha * (L_channel - 0.5)) * 0.5
-        return out
+    # 2) 计算基础提升/压暗量 (1 - t^2)
+    #    t=0 => 最大, t=1 => 0
+    base = strength * (1.0 - t * t)
 
-    L_norm_adjusted = s_curve_contrast(L_norm, contrast_intensity)
+    # 3) 压缩系数
+    #    shadow_compress 越大 => 越强的“抑制”作用
+    #    c 在 t=1 时 = 1 => 不再抑制
+    #    c 在 t=0 时 = 1 - compress => 最大抑制
+    if shadow_compress > 0.0:
+        base *= 1.0 - shadow_compress * (1.0 - t)
 
-    # clip到[0,1]以防数值越界
-    L_norm_adjusted = np.clip(L_norm_adjusted, 0.0, 1.0)
+    # 4) 根据正负来决定加/减
+    #    factor>0 => 压暗 => 用 (1 - base); factor<0 => 提亮 => 用 (1 + base)
+    L_shadow = L_channel * (1.0 - sign * base)
 
-    # 4) 拼回 Lab => 转回 RGB
-    L_adjusted = (L_norm_adjusted * 100.0).astype(np.float32)
-    lab_adjusted = np.stack([L_adjusted, A, B], axis=-1).astype(np.float32)
-    img_contrast = cv2.cvtColor(lab_adjusted, cv2.COLOR_LAB2RGB)
+    # 非阴影区域保持不变
+    L_out = np.where(L_channel < shadow_threshold, L_shadow, L_channel).astype(L_channel.dtype)
 
-    # 5) 保存结果
-    ext_out = os.path.splitext(output_image_path)[-1].lower()
+    return L_out
 
-    if ext_out == '.npy':
-        np.save(output_image_path, img_contrast)
-    else:
-        img_contrast = np.clip(img_contrast, 0.0, 1.0)
-        if bit_depth_in == 8:
-            out_8u = (img_contrast * 255.0).round().astype(np.uint8)
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_8u, cv2.COLOR_RGB2BGR))
-        else:
-            out_16u = (img_contrast * 65535.0).round().astype(np.uint16)
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_16u, cv2.COLOR_RGB2BGR))
+
+def shadow_array(img: np.ndarray, shadows_factor: float) -> np.ndarray:
+    """
+    阴影调整的内存接口。
+
+    参数:
+        img (np.ndarray): float32, [0,1], RGB
+        shadows_factor (float): 阴影调整因子，-100~100
+
+    返回:
+        (np.ndarray) 调整后的图像, float32, [0,1], RGB
+    """
+    return _apply_lightness_transfer(img, get_tone_lut("shadow", shadows_factor))
 
 
-def shadow(input_image_path: str, output_image_path: str, shadows_factor: float):  # checked 2025/01/02
+def shadow(input_image_path: str, output_image_path: str, shadows_factor: float, tile_size: TileSize = None, num_workers: int = 1):  # checked 2025/01/02
     """
     调整图像的“阴影”部分（类似 Lightroom 中的 Shadows），全程 float 运算。
     大体沿用 black 函数的逻辑，只在关键处做最小改动。
-    
+
     参数:
         input_image_path (str): 输入路径（.npy / 8 位 / 16 位）
         output_image_path (str): 输出路径（.npy / 8 位 / 16 位）
         shadows_factor (float): 阴影调整因子，-100~100
+        tile_size (int / tuple): 分块大小, None => 整幅处理 (见 process_image_file)
+        num_workers (int): 并行线程数, None => cv2.getNumThreads() (见 process_image_file)
     """
-    # ------------------ 0) 解析 shadows_factor => [-1, 1] ------------------
-    intensity = np.clip(shadows_factor / 100.0, -1.0, 1.0)
-
-    # ------------------ 1) 读取图像, 转为 float32 [0,1], RGB ---------------
-    ext_in = os.path.splitext(input_image_path)[-1].lower()
+    process_image_file(shadow_array, input_image_path, output_image_path, shadows_factor, tile_size, num_workers)
 
-    if ext_in == '.npy':
-        img = np.load(input_image_path)
-        if img.ndim == 2:
-            img = np.stack([img, img, img], axis=-1)
-        elif img.shape[-1] == 4:
-            img = img[..., :3]
 
-        if img.dtype not in [np.float32, np.float64]:
-            raise ValueError(".npy 图像应当是 float32/64。")
-
-        img = img.astype(np.float32)
-        bit_depth_in = 16  
+def highlights_tone_mapping(L_channel: np.ndarray, factor: float) -> np.ndarray:
+    """
+    针对较亮区间做调整:
+      factor: [-1,1]，>0 => 提亮高光, <0 => 压暗高光
+    """
+    # 对比 black/shadow，这里我们用一个对“亮部”更敏感的权重:
+    #   weight = L^3 或 L^4 (示例：L^3)
+    # 这样当 L>0.6~0.7 时，权重开始变得比较大；中低亮度则较小。
+    weight = np.power(L_channel, 4.0)
+
+    if factor > 0:
+        # 提升高光 => 用对数+小系数
+        # 跟 black/shadow 类似，但可改小/改大系数看需求
+        adjustment = weight * factor * np.log1p(L_channel) * 0.2
+    elif factor < 0:
+        # 压暗高光 => 用 exp(...) 让接近1的区域衰减
+        adjustment = weight * factor * np.exp(-(1 - L_channel)*2.5) * 0.5
     else:
-        img_bgr = cv2.imread(input_image_path, cv2.IMREAD_UNCHANGED)
-        if img_bgr.dtype == np.uint8:
-            bit_depth_in = 8
-            img = img_bgr.astype(np.float32) / 255.0
-        elif img_bgr.dtype == np.uint16:
-            bit_depth_in = 16
-            img = img_bgr.astype(np.float32) / 65535.0
-        else:
-            raise ValueError("仅支持 8 位 或 16 位图像。")
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    # ------------------ 2) 转到 float32 Lab => [L ∈ (0,100)] ---------------
-    lab_f32 = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
-    L = lab_f32[..., 0]
-    A = lab_f32[..., 1]
-    B = lab_f32[..., 2]
-
-    # 归一化 L => [0,1]
-    L_norm = L / 100.0
-
-    # ------------------ 3) Shadows 调整函数 (对比黑场稍更宽) ---------------
-    def shadows_tone_mapping(L_channel: np.ndarray, factor: float) -> np.ndarray:
-        """
-        使用 S 形曲线来调整阴影：
-        - factor > 0 => 压暗阴影
-        - factor < 0 => 提亮阴影
-        - factor = 0 => 原样返回
-
-        下面使用了两个内部参数：
-        - shadow_threshold: 阴影阈值，决定分界点（越大则“阴影”范围越宽）
-        - shadow_compress: 压缩系数，避免提升或压暗过度
-        """
-        # 你可以根据需要调节这两个参数
-        shadow_threshold = 0.4   # [0,1]，越大则阴影范围越宽
-        shadow_compress  = 0.5   # [0,1]，越大则压缩越明显
-        
-        # 如果不需要调整，直接返回原 L
-        if abs(factor) < 1e-8:
-            return L_channel
-
-        # 结果数组
-        L_out = np.copy(L_channel)
-        
-        # 正负标记: factor > 0 => 压暗, factor < 0 => 提亮
-        sign = np.sign(factor)   
-        # 取绝对值做强度
-        strength = abs(factor)
-
-        # 遍历像素
-        it = np.nditer(L_channel, flags=['multi_index'])
-        while not it.finished:
-            idx = it.multi_index
-            x = L_channel[idx]  # L ∈ [0,1]
-            
-            if x < shadow_threshold:
-                # 1) 计算归一化 t ∈ [0,1]
-                t = x / shadow_threshold
-                
-                # 2) 计算基础提升/压暗量 (1 - t^2) 
-                #    t=0 => 最大, t=1 => 0
-                base = strength * (1.0 - t * t)
-
-                # 3) 压缩系数
-                #    shadow_compress 越大 => 越强的“抑制”作用
-                #    c 在 t=1 时 = 1 => 不再抑制
-                #    c 在 t=0 时 = 1 - compress => 最大抑制
-                if shadow_compress > 0.0:
-                    c = 1.0 - shadow_compress * (1.0 - t)
-                    base *= c
-
-                # 4) 根据正负来决定加/减
-                if sign > 0:  
-                    # factor>0 => 压暗 => 用 (1 - base)
-                    y = x * (1.0 - base)
-                else:
-                    # factor<0 => 提亮 => 用 (1 + base)
-                    y = x * (1.0 + base)
-
-                L_out[idx] = y
-            else:
-                # 非阴影区域保持不变
-                L_out[idx] = x
-            
-            it.iternext()
+        adjustment = 0
 
-        return L_out
+    return L_channel + adjustment
 
-    # 调用
-    L_norm_adjusted = shadows_tone_mapping(L_norm, intensity)
-    L_norm_adjusted = np.clip(L_norm_adjusted, 0.0, 1.0)
 
-    # ------------------ 4) 拼回 Lab => 转回 RGB [0,1] ----------------------
-    L_adjusted = L_norm_adjusted * 100.0
-    lab_adjusted = np.stack([L_adjusted, A, B], axis=-1)
-    img_adjusted = cv2.cvtColor(lab_adjusted.astype(np.float32), cv2.COLOR_LAB2RGB)
+def highlight_array(img: np.ndarray, highlights_factor: float) -> np.ndarray:
+    """
+    高光调整的内存接口。
 
-    # ------------------ 5) 保存与返回 --------------------------------------
-    ext_out = os.path.splitext(output_image_path)[-1].lower()
+    参数:
+        img (np.ndarray): float32, [0,1], RGB
+        highlights_factor (float): 高光调整因子，-100~100
 
-    if ext_out == '.npy':
-        np.save(output_image_path, img_adjusted)
-    else:
-        img_adjusted = np.clip(img_adjusted, 0.0, 1.0)
-        if bit_depth_in == 8:
-            out_8u = (img_adjusted * 255.0).round().astype(np.uint8)
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_8u, cv2.COLOR_RGB2BGR))
-        else:
-            out_16u = (img_adjusted * 65535.0).round().astype(np.uint16)
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_16u, cv2.COLOR_RGB2BGR))
+    返回:
+        (np.ndarray) 调整后的图像, float32, [0,1], RGB
+    """
+    return _apply_lightness_transfer(img, get_tone_lut("highlight", highlights_factor))
 
 
-def highlight(input_image_path: str, output_image_path: str, highlights_factor: float):  # checked 2025/01/02
+def highlight(input_image_path: str, output_image_path: str, highlights_factor: float, tile_size: TileSize = None, num_workers: int = 1):  # checked 2025/01/02
     """
     调整图像的“高光”部分（类似 Lightroom 中的 Highlights），全程 float 运算。
     大体沿用 black/shadow 函数的结构，只在关键处做最小改动。
@@ -293,356 +321,223 @@ def highlight(input_image_path: str, output_image_path: str, highlights_factor:
         output_image_path (str): 输出路径（.npy / 8 位 / 16 位）
         highlights_factor (float): 高光调整因子，-100~100
             >0 => 提升高光；<0 => 压暗高光
+        tile_size (int / tuple): 分块大小, None => 整幅处理 (见 process_image_file)
+        num_workers (int): 并行线程数, None => cv2.getNumThreads() (见 process_image_file)
+    """
+    process_image_file(highlight_array, input_image_path, output_image_path, highlights_factor, tile_size, num_workers)
 
-    返回:
-        img_adjusted (np.ndarray): 调整后的图像(float32, [0,1], RGB)
-    """
-    # ------------------ 0) 解析 highlights_factor => [-1,1] ------------------
-    intensity = np.clip(highlights_factor / 100.0, -1.0, 1.0)
-
-    # ------------------ 1) 读取图像, 转为 float32 [0,1], RGB ---------------
-    ext_in = os.path.splitext(input_image_path)[-1].lower()
-
-    if ext_in == '.npy':
-        img = np.load(input_image_path)
-        if img.ndim == 2:
-            # 单通道 => 扩为3通道
-            img = np.stack([img, img, img], axis=-1)
-        elif img.shape[-1] == 4:
-            # 有 alpha 通道 => 取前三通道
-            img = img[..., :3]
-
-        if img.dtype not in [np.float32, np.float64]:
-            raise ValueError(".npy 图像应当是 float32/64。")
-        img = img.astype(np.float32)
-        bit_depth_in = 16  
-    else:
-        # OpenCV 读图 => BGR
-        img_bgr = cv2.imread(input_image_path, cv2.IMREAD_UNCHANGED)
-        if img_bgr is None:
-            raise IOError(f"无法读取图像: {input_image_path}")
-
-        if img_bgr.dtype == np.uint8:
-            bit_depth_in = 8
-            img = img_bgr.astype(np.float32) / 255.0
-        elif img_bgr.dtype == np.uint16:
-            bit_depth_in = 16
-            img = img_bgr.astype(np.float32) / 65535.0
-        else:
-            raise ValueError("仅支持 8 位 或 16 位图像。")
-
-        # BGR -> RGB
-        img = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-
-    # ------------------ 2) 转到 float32 Lab => L ∈ [0,100] ------------------
-    lab_f32 = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
-    L = lab_f32[..., 0]  # [0,100]
-    A = lab_f32[..., 1]
-    B = lab_f32[..., 2]
-
-    # 归一到 [0,1]
-    L_norm = L / 100.0
-
-    # ------------------ 3) Highlights 调整函数 -------------------------------
-    def highlights_tone_mapping(L_channel: np.ndarray, factor: float) -> np.ndarray:
-        """
-        针对较亮区间做调整:
-          factor: [-1,1]，>0 => 提亮高光, <0 => 压暗高光
-        """
-        # 对比 black/shadow，这里我们用一个对“亮部”更敏感的权重:
-        #   weight = L^3 或 L^4 (示例：L^3)
-        # 这样当 L>0.6~0.7 时，权重开始变得比较大；中低亮度则较小。
-        weight = np.power(L_channel, 4.0)
-
-        if factor > 0:
-            # 提升高光 => 用对数+小系数
-            # 跟 black/shadow 类似，但可改小/改大系数看需求
-            adjustment = weight * factor * np.log1p(L_channel) * 0.2
-        elif factor < 0:
-            # 压暗高光 => 用 exp(...) 让接近1的区域衰减
-            adjustment = weight * factor * np.exp(-(1 - L_channel)*2.5) * 0.5
-        else:
-            adjustment = 0
-
-        return L_channel + adjustment
-
-    # 调用
-    L_norm_adjusted = highlights_tone_mapping(L_norm, intensity)
-    L_norm_adjusted = np.clip(L_norm_adjusted, 0.0, 1.0)
-
-    # ------------------ 4) 拼回 Lab => 转回 RGB [0,1] ----------------------
-    L_adjusted = L_norm_adjusted * 100.0
-    lab_adjusted = np.stack([L_adjusted, A, B], axis=-1).astype(np.float32)
-    img_adjusted = cv2.cvtColor(lab_adjusted, cv2.COLOR_LAB2RGB)
-
-    # ------------------ 5) 保存&返回 ---------------------------------------
-    ext_out = os.path.splitext(output_image_path)[-1].lower()
-
-    if ext_out == '.npy':
-        np.save(output_image_path, img_adjusted)
+
+def blacks_tone_mapping(L_channel: np.ndarray, blacks_intensity: float) -> np.ndarray:
+    """
+    L_channel: [0,1]
+    blacks_intensity: [-1,1]
+    """
+    # 暗部权重
+    weight = np.power(np.abs(1 - L_channel), 8.0)
+
+    if blacks_intensity > 0:
+        # blacks_intensity > 0 => 压暗
+        adjustment = weight * blacks_intensity * np.log1p(1 - L_channel) * 0.5
+    elif blacks_intensity < 0:
+        # blacks_intensity < 0 => 提亮暗部
+        adjustment = weight * blacks_intensity * np.exp(-L_channel * 3) * 0.6
     else:
-        img_adjusted = np.clip(img_adjusted, 0, 1)
-        if bit_depth_in == 8:
-            out_8u = (img_adjusted * 255.0).round().astype(np.uint8)
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_8u, cv2.COLOR_RGB2BGR))
-        else:
-            out_16u = (img_adjusted * 65535.0).round().astype(np.uint16)
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_16u, cv2.COLOR_RGB2BGR))
+        adjustment = 0
+
+    return L_channel + adjustment
+
+
+def black_array(img: np.ndarray, blacks_factor: float) -> np.ndarray:
+    """
+    黑色色阶调整的内存接口。
+
+    参数：
+        img (np.ndarray): float32, [0,1], RGB
+        blacks_factor (float): 黑色色阶调整因子，范围为 -100 到 100
+
+    返回：
+        (np.ndarray) 调整后的图像（float32，范围 [0,1]，RGB）
+    """
+    return _apply_lightness_transfer(img, get_tone_lut("black", blacks_factor))
 
 
-def black(input_image_path: str, output_image_path: str, blacks_factor: float):  # Checked 2025/01/02
+def black(input_image_path: str, output_image_path: str, blacks_factor: float, tile_size: TileSize = None, num_workers: int = 1):  # Checked 2025/01/02
     """
     调整图像的黑色色阶（类似 Lightroom 的 Blacks 调整，非完全一致）
     保留全程 float 运算，以尽量保持 16 位精度。
-    
+
     参数：
         input_image_path (str): 输入图像的路径（.npy / 8 位 / 16 位）
         output_image_path (str): 输出图像的保存路径（.npy / 通常 8 或 16 位）
         blacks_factor (float): 黑色色阶调整因子，范围为 -100 到 100
-        
-    返回：
-        img_rgb (np.ndarray): 调整后的图像（float32，范围 [0,1]，RGB）
-    """
-    # ------------------------------------------------------------------------
-    # 0) 解析 blacks_factor 到 [-1, 1]
-    # ------------------------------------------------------------------------
-    intensity = np.clip(blacks_factor / 100.0, -1.0, 1.0)
-
-    # ------------------------------------------------------------------------
-    # 1) 读取图像到 img(float32, [0,1], RGB)
-    # ------------------------------------------------------------------------
-    ext_in = os.path.splitext(input_image_path)[-1].lower()
-
-    if ext_in == '.npy':
-        # 视为已经是 [0,1] 的 float32/64，通道顺序 RGB
-        img = np.load(input_image_path)
-        if img.ndim == 2:
-            # 单通道 => 扩为3通道
-            img = np.stack([img, img, img], axis=-1)
-        elif img.shape[-1] == 4:
-            # 如果有 alpha 通道 => 截到3通道
-            img = img[..., :3]
-
-        if img.dtype not in [np.float32, np.float64]:
-            raise ValueError(".npy 图像应当是 float32/64。")
-        img = img.astype(np.float32)
-
-        # 对于 npy，默认视为高精度 => bit_depth_in = 16
-        bit_depth_in = 16  
-    else:
-        # 用 OpenCV 读取 => BGR
-        img_bgr = cv2.imread(input_image_path, cv2.IMREAD_UNCHANGED)
-
-        # 判断是 8 位 还是 16 位
-        if img_bgr.dtype == np.uint8:
-            bit_depth_in = 8
-            img = img_bgr.astype(np.float32) / 255.0
-        elif img_bgr.dtype == np.uint16:
-            bit_depth_in = 16
-            img = img_bgr.astype(np.float32) / 65535.0
-        else:
-            raise ValueError("仅支持 8 位 或 16 位图像。")
-
-        # 转成 RGB
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    # ------------------------------------------------------------------------
-    # 2) 使用 cv2 的浮点 Lab 转换 => L 范围 [0,100], a/b 大约 [-128, 127]
-    #    (OpenCV 会假定输入是 [0,1]，输出 L 通道就是 [0,100])
-    # ------------------------------------------------------------------------
-    # 注意：OpenCV 对 float32 的 RGB2LAB 会自动假定 sRGB+D65 等。
-    #       结果中 L 通道为 [0, 100]，a/b 大约 [-128, 127]
-    lab_f32 = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)  # float32
-
-    # 拆分通道
-    L = lab_f32[..., 0]  # [0,100]
-    A = lab_f32[..., 1]  # [-128,127]
-    B = lab_f32[..., 2]  # [-128,127]
-
-    # 归一化 L 到 [0,1] 以便做 blacks 映射
-    L_norm = L / 100.0
-
-    # ------------------------------------------------------------------------
-    # 3) Blacks 调整函数
-    # ------------------------------------------------------------------------
-    def blacks_tone_mapping(L_channel: np.ndarray, blacks_intensity: float) -> np.ndarray:
-        """
-        L_channel: [0,1]
-        blacks_intensity: [-1,1]
-        """
-        # 暗部权重
-        weight = np.power(np.abs(1 - L_channel), 8.0)
-
-        if blacks_intensity > 0:
-            # blacks_intensity > 0 => 压暗
-            adjustment = weight * blacks_intensity * np.log1p(1 - L_channel) * 0.5
-        elif blacks_intensity < 0:
-            # blacks_intensity < 0 => 提亮暗部
-            adjustment = weight * blacks_intensity * np.exp(-L_channel * 3) * 0.6
-        else:
-            adjustment = 0
-
-        return L_channel + adjustment
-
-    L_norm_adjusted = blacks_tone_mapping(L_norm, intensity)
-    L_norm_adjusted = np.clip(L_norm_adjusted, 0.0, 1.0)
-
-    # ------------------------------------------------------------------------
-    # 4) 拼回 Lab，转换回 RGB
-    # ------------------------------------------------------------------------
-    # 先把 L_norm_adjusted 映射回 [0,100]
-    L_adjusted = L_norm_adjusted * 100.0
-
-    lab_adjusted = np.stack([L_adjusted, A, B], axis=-1)
-    # 这里 lab_adjusted 依旧是 float32
-    # 再做 LAB2RGB => 得到 float32 => RGB, 范围 [0,1]
-    img_adjusted = cv2.cvtColor(lab_adjusted.astype(np.float32), cv2.COLOR_LAB2RGB)
-
-    # ------------------------------------------------------------------------
-    # 5) 保存并返回
-    # ------------------------------------------------------------------------
-    ext_out = os.path.splitext(output_image_path)[-1].lower()
-
-    if ext_out == '.npy':
-        # 直接保存 [0,1] float32
-        np.save(output_image_path, img_adjusted)
+        tile_size (int / tuple): 分块大小, None => 整幅处理 (见 process_image_file)
+        num_workers (int): 并行线程数, None => cv2.getNumThreads() (见 process_image_file)
+    """
+    process_image_file(black_array, input_image_path, output_image_path, blacks_factor, tile_size, num_workers)
+
+
+def whites_tone_mapping(L_channel: np.ndarray, white_intensity: float) -> np.ndarray:
+    """
+    对于更亮的区域，给更高的权重，从而更显著地提升/压低高光
+    L_channel: [0,1]
+    white_intensity: [-1,1]
+    """
+    # 我们用 L^11 作为权重 => L 越大 => 权重越大 => 亮部影响更大
+    weight = np.power(L_channel, 11.0)
+
+    if white_intensity > 0:
+        # white_intensity > 0 => 提升亮部 => 让亮的更亮
+        # 用对数做一些柔和映射
+        adjustment = weight * white_intensity * np.log1p(L_channel) * 0.15
+    elif white_intensity < 0:
+        # white_intensity < 0 => 压低亮部 => 减少过曝
+        # 用 exp(...) 让接近 1 的地方衰减更明显
+        adjustment = weight * white_intensity * np.exp(- (1 - L_channel) * 3) * 0.4
     else:
-        img_adjusted = np.clip(img_adjusted, 0.0, 1.0)
-        # 根据输入图像位深选择输出。你也可以自定义。
-        if bit_depth_in == 8:
-            # 输出 8 位
-            out_8u = (img_adjusted * 255.0).round().astype(np.uint8)
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_8u, cv2.COLOR_RGB2BGR))
-        else:
-            # 输出 16 位
-            out_16u = (img_adjusted * 65535.0).round().astype(np.uint16)
+        adjustment = 0.0
 
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_16u, cv2.COLOR_RGB2BGR))
+    return L_channel + adjustment
 
 
-def white(input_image_path: str, output_image_path: str, whites_factor: float):  # Checked 2025/01/02
+def white_array(img: np.ndarray, whites_factor: float) -> np.ndarray:
+    """
+    白色色阶调整的内存接口。
+
+    参数：
+        img (np.ndarray): float32, [0,1], RGB
+        whites_factor (float): 白色色阶调整因子，范围为 -100 到 100
+
+    返回：
+        (np.ndarray) 调整后的图像（float32，范围 [0,1]，RGB）
+    """
+    return _apply_lightness_transfer(img, get_tone_lut("white", whites_factor))
+
+
+def white(input_image_path: str, output_image_path: str, whites_factor: float, tile_size: TileSize = None, num_workers: int = 1):  # Checked 2025/01/02
     """
     调整图像的白色色阶（类似 Lightroom 的 Whites 调整，非完全一致）
     保留全程 float 运算，以尽量保持 16 位精度。
-    
+
     参数：
         input_image_path (str): 输入图像的路径（.npy / 8 位 / 16 位）
         output_image_path (str): 输出图像的保存路径（.npy / 通常 8 或 16 位）
         whites_factor (float): 白色色阶调整因子，范围为 -100 到 100
+        tile_size (int / tuple): 分块大小, None => 整幅处理 (见 process_image_file)
+        num_workers (int): 并行线程数, None => cv2.getNumThreads() (见 process_image_file)
     """
-    # ------------------------------------------------------------------------
-    # 0) 将用户输入的 [-100, 100] 范围映射到 [-1, 1]
-    # ------------------------------------------------------------------------
-    intensity = np.clip(whites_factor / 100.0, -1.0, 1.0)
-
-    # ------------------------------------------------------------------------
-    # 1) 读取图像到 img(float32, [0,1], RGB)
-    # ------------------------------------------------------------------------
-    ext_in = os.path.splitext(input_image_path)[-1].lower()
-
-    if ext_in == '.npy':
-        # 视为已经是 [0,1] 的 float32/64，通道顺序 RGB
-        img = np.load(input_image_path)
-        if img.ndim == 2:
-            # 单通道 => 扩为3通道
-            img = np.stack([img, img, img], axis=-1)
-        elif img.shape[-1] == 4:
-            # 如果有 alpha 通道 => 截到3通道
-            img = img[..., :3]
-
-        if img.dtype not in [np.float32, np.float64]:
-            raise ValueError(".npy 图像应当是 float32/64。")
-        img = img.astype(np.float32)
-
-        # 对于 npy，默认视为高精度 => bit_depth_in = 16
-        bit_depth_in = 16  
-    else:
-        # 用 OpenCV 读取 => BGR
-        img_bgr = cv2.imread(input_image_path, cv2.IMREAD_UNCHANGED)
-
-        # 判断是 8 位 还是 16 位
-        if img_bgr.dtype == np.uint8:
-            bit_depth_in = 8
-            img = img_bgr.astype(np.float32) / 255.0
-        elif img_bgr.dtype == np.uint16:
-            bit_depth_in = 16
-            img = img_bgr.astype(np.float32) / 65535.0
-        else:
-            raise ValueError("仅支持 8 位 或 16 位图像。")
-
-        # 转成 RGB
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    # ------------------------------------------------------------------------
-    # 2) 使用 cv2 的浮点 Lab 转换 => L 范围 [0,100], a/b 大约 [-128, 127]
-    #    (OpenCV 会假定输入是 [0,1]，输出 L 通道就是 [0,100])
-    # ------------------------------------------------------------------------
-    # 注意：OpenCV 对 float32 的 RGB2LAB 会自动假定 sRGB+D65 等。
-    #       结果中 L 通道为 [0, 100]，a/b 大约 [-128, 127]
-    lab_f32 = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)  # float32
-
-    # 拆分通道
-    L = lab_f32[..., 0]  # [0,100]
-    A = lab_f32[..., 1]  # [-128,127]
-    B = lab_f32[..., 2]  # [-128,127]
-
-    # 归一化 L 到 [0,1] 以便做 blacks 映射
-    L_norm = L / 100.0
-
-    # ------------------------------------------------------------------------
-    # 3) Whites 调整函数
-    #    思路：对于更亮的区域，给更高的权重，从而更显著地提升/压低高光
-    # ------------------------------------------------------------------------
-    def whites_tone_mapping(L_channel: np.ndarray, white_intensity: float) -> np.ndarray:
-        """
-        L_channel: [0,1]
-        white_intensity: [-1,1]
-        """
-        # 我们用 sqrt(L) 作为权重 => L 越大 => sqrt(L) 越大 => 亮部影响更大
-        weight = np.power(L_channel, 11.0)
-
-        if white_intensity > 0:
-            # white_intensity > 0 => 提升亮部 => 让亮的更亮
-            # 用对数做一些柔和映射
-            adjustment = weight * white_intensity * np.log1p(L_channel) * 0.15
-        elif white_intensity < 0:
-            # white_intensity < 0 => 压低亮部 => 减少过曝
-            # 用 exp(...) 让接近 1 的地方衰减更明显
-            adjustment = weight * white_intensity * np.exp(- (1 - L_channel) * 3) * 0.4
-        else:
-            adjustment = 0.0
-
-        return L_channel + adjustment
-
-    L_norm_adjusted = whites_tone_mapping(L_norm, intensity)
-    L_norm_adjusted = np.clip(L_norm_adjusted, 0.0, 1.0)
-
-    # ------------------------------------------------------------------------
-    # 4) 组合回 Lab => 转回 RGB
-    # ------------------------------------------------------------------------
-    L_adjusted = L_norm_adjusted * 100.0
-    lab_adjusted = np.stack([L_adjusted, A, B], axis=-1)
-    # 转回 RGB [0,1]
-    img_adjusted = cv2.cvtColor(lab_adjusted.astype(np.float32), cv2.COLOR_LAB2RGB)
-
-    # ------------------------------------------------------------------------
-    # 5) 保存 & 返回
-    # ------------------------------------------------------------------------
-    ext_out = os.path.splitext(output_image_path)[-1].lower()
-
-    if ext_out == '.npy':
-        # 保存为 float32 [.npy], [0,1], RGB
-        np.save(output_image_path, img_adjusted)
-    else:
-        img_adjusted = np.clip(img_adjusted, 0.0, 1.0)
-        if bit_depth_in == 8:
-            # 输出 8 位
-            out_8u = (img_adjusted * 255.0).round().astype(np.uint8)
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_8u, cv2.COLOR_RGB2BGR))
-        else:
-            # 输出 16 位
-            out_16u = (img_adjusted * 65535.0).round().astype(np.uint16)
-            cv2.imwrite(output_image_path, cv2.cvtColor(out_16u, cv2.COLOR_RGB2BGR))
+    process_image_file(white_array, input_image_path, output_image_path, whites_factor, tile_size, num_workers)
+
+
+# ============================================================================
+# L 通道管线
+# contrast / shadow / highlight / black / white 都只在 Lab 空间改 L 通道,
+# 因此连续的多个操作可以先把曲线复合成一条 L 传递函数, 再只做一次
+# RGB -> Lab -> RGB 往返。
+# 单条曲线和复合曲线都通过 get_tone_lut / ToneLUT 采样成查找表并缓存,
+# 每次调用只剩一次查表, 不再对每个像素重复计算 power/exp/log1p。
+# 注意: 逐步执行时每一步之间都会回到 RGB (并可能在色域边界被截断),
+# 复合后没有这些中间往返, 对色域外的颜色结果会有细微差别。
+# ============================================================================
+
+
+# 操作名 => L 曲线 (输入 L ∈ [0,1], 强度 ∈ [-1,1])
+LIGHTNESS_TONE_MAPPINGS = {
+    "contrast": s_curve_contrast,
+    "shadow": shadows_tone_mapping,
+    "highlight": highlights_tone_mapping,
+    "black": blacks_tone_mapping,
+    "white": whites_tone_mapping,
+}
+
+
+def _tone_curve(op_name: str, factor: float) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    返回操作 op_name 在调整因子 factor 下的逐点曲线 (输入/输出均为 [0,1])。
+    """
+    if op_name == "exposure":
+        return lambda values: exposure_tone_mapping(values, factor)
+    if op_name not in LIGHTNESS_TONE_MAPPINGS:
+        raise ValueError(f"{op_name} 不是逐点曲线操作, 可选: {['exposure'] + list(LIGHTNESS_TONE_MAPPINGS)}")
+
+    tone_mapping = LIGHTNESS_TONE_MAPPINGS[op_name]
+    intensity = np.clip(factor / 100.0, -1.0, 1.0)
+    return lambda L_norm: np.clip(tone_mapping(L_norm, intensity), 0.0, 1.0)
+
+
+@lru_cache(maxsize=64)
+def get_tone_lut(op_name: str, factor: float, levels: int = 65536) -> ToneLUT:
+    """
+    取 (操作, 调整因子) 对应的查找表。每条曲线只采样一次, 按 LRU 淘汰。
+
+    参数:
+        op_name (str): "exposure" 或 LIGHTNESS_TONE_MAPPINGS 中的操作名
+        factor (float): 调整因子, 与对应路径接口相同
+        levels (int): 采样点数, 一般取 4096 或 65536
+
+    返回:
+        ToneLUT, 可直接作用于 [0,1] 的数组 (或 8/16 位整型数组)
+    """
+    return ToneLUT(_tone_curve(op_name, factor), levels)
+
+
+@lru_cache(maxsize=64)
+def _compile_lightness_pipeline(steps: Tuple[Tuple[str, float], ...], levels: int) -> ToneLUT:
+    curves = []
+    for name, factor in steps:
+        if name not in LIGHTNESS_TONE_MAPPINGS:
+            raise ValueError(f"{name} 不是 L 通道操作, 可选: {list(LIGHTNESS_TONE_MAPPINGS)}")
+        curves.append(_tone_curve(name, factor))
+
+    def composed(L_norm: np.ndarray) -> np.ndarray:
+        # 依次执行各条曲线 (每一步都截断到 [0,1], 与逐步执行一致)
+        for curve in curves:
+            L_norm = curve(L_norm)
+        return L_norm
+
+    return ToneLUT(composed, levels)
+
+
+def compile_lightness_pipeline(steps: List[Tuple[str, float]], levels: int = 65536) -> ToneLUT:
+    """
+    把若干个 L 通道操作复合成一条 L 传递函数。
+
+    参数:
+        steps: [(操作名, 调整因子), ...], 操作名见 LIGHTNESS_TONE_MAPPINGS,
+               调整因子与对应路径接口相同 (-100 ~ 100)
+        levels (int): 复合曲线在 [0,1] 上的采样点数
+
+    返回:
+        ToneLUT, transfer(L_norm) -> L_norm, 每个像素只做一次查表, 与步骤数无关
+    """
+    return _compile_lightness_pipeline(tuple((name, factor) for name, factor in steps), levels)
+
+
+def lightness_pipeline_array(img: np.ndarray, steps: List[Tuple[str, float]]) -> np.ndarray:
+    """
+    L 通道管线的内存接口: 只做一次 Lab 往返, 依次应用 steps 中的全部 L 曲线。
+
+    参数:
+        img (np.ndarray): float32, [0,1], RGB
+        steps: [(操作名, 调整因子), ...], 例如 [("contrast", 30), ("shadow", -20)]
+
+    返回:
+        (np.ndarray) 调整后的图像, float32, [0,1], RGB
+    """
+    return _apply_lightness_transfer(img, compile_lightness_pipeline(steps))
+
+
+def lightness_pipeline(input_image_path: str, output_image_path: str, steps: List[Tuple[str, float]], tile_size: TileSize = None, num_workers: int = 1):
+    """
+    一次性执行多个 L 通道操作 (contrast / shadow / highlight / black / white)。
+
+    参数:
+        input_image_path (str): 输入路径（.npy / 8 位 / 16 位）
+        output_image_path (str): 输出路径（.npy / 8 位 / 16 位）
+        steps: [(操作名, 调整因子), ...], 按顺序执行
+        tile_size (int / tuple): 分块大小, None => 整幅处理 (见 process_image_file)
+        num_workers (int): 并行线程数, None => cv2.getNumThreads() (见 process_image_file)
+    """
+    process_image_file(lightness_pipeline_array, input_image_path, output_image_path, steps, tile_size, num_workers)
 
 
 # ============================================================================
@@ -654,7 +549,51 @@ def white(input_image_path: str, output_image_path: str, whites_factor: float):
 # ============================================================================
 
 
-def saturation(input_image_path: str, output_image_path: str, saturation_factor: float):  # Checked 2025/01/01
+def saturation_array(img: np.ndarray, saturation_factor: float) -> np.ndarray:
+    """
+    Adjust the saturation of a float32 [0,1] RGB image using the HSL color model.
+
+    Parameters:
+        img (np.ndarray): float32, [0,1], RGB.
+        saturation_factor (float): Saturation adjustment factor in the range [-100, 100].
+
+    Returns:
+        np.ndarray: The adjusted image, float32, [0,1], RGB.
+    """
+    # Ensure saturation_factor is within the valid range
+    saturation_factor = np.clip(saturation_factor, -100, 100)
+
+    # Map saturation_factor (-100 to 100) to a scaling factor (0.0 to 2.0)
+    scale_factor = np.float32(1 + saturation_factor / 100.0)
+
+    # For a fixed hue and lightness, HSL -> RGB is l + C * (offset(h) - 1/2) per channel,
+    # with chroma C = (1 - |2l - 1|) * s. Scaling s therefore just scales every channel's
+    # distance to l, so the whole RGB -> HSL -> RGB round trip collapses to
+    #     rgb' = l + (rgb - l) * ratio,  ratio = clip(s * scale, 0, 1) / s = min(scale, 1 / s)
+    # with 1 / s = (1 - |2l - 1|) / (max - min). No hue, no sector masks.
+    # Elementwise max / min of the channel planes: much faster than a reduction over axis=-1
+    r, g, b = img[..., 0], img[..., 1], img[..., 2]
+    max_val = np.maximum(np.maximum(r, g), b)
+    min_val = np.minimum(np.minimum(r, g), b)
+    delta = max_val - min_val
+
+    # 1 - |2l - 1| = min(max + min, 2 - max - min), computed in place in max_val
+    lightness = np.add(max_val, min_val, out=min_val)
+    np.minimum(lightness, 2 - lightness, out=max_val)
+    lightness *= 0.5
+
+    # Gray pixels (delta == 0) have rgb == l, any ratio works: keep 1
+    ratio = np.divide(max_val, delta, out=np.ones_like(delta), where=delta > 0)
+    np.minimum(ratio, scale_factor, out=ratio)
+
+    lightness = lightness[..., None]
+    out = np.subtract(img, lightness, dtype=np.float32)
+    out *= ratio[..., None]
+    out += lightness
+    return np.clip(out, 0, 1, out=out)
+
+
+def saturation(input_image_path: str, output_image_path: str, saturation_factor: float, tile_size: TileSize = None, num_workers: int = 1):  # Checked 2025/01/01
     """
     Adjust the saturation of an image using the HSL color model.
 
@@ -665,206 +604,158 @@ def saturation(input_image_path: str, output_image_path: str, saturation_factor:
                                    - -100: Completely desaturate (gray image).
                                    - 0: No change.
                                    - 100: Saturation increased to double.
-    
+        tile_size (int or tuple): Process the image tile by tile to bound memory. None for full frame.
+        num_workers (int): Number of threads processing row bands / tiles. None for cv2.getNumThreads().
+
     Returns:
         None: The adjusted image is saved to the output_image_path.
+
+    8/16-bit outputs are rounded to the nearest code like every op (ImageIO.write_image_float); the
+    original implementation truncated, so about 40% of the 8-bit values are one code higher than before.
     """
-    # Ensure saturation_factor is within the valid range
-    saturation_factor = np.clip(saturation_factor, -100, 100)
+    process_image_file(saturation_array, input_image_path, output_image_path, saturation_factor, tile_size, num_workers)
+    print(f"Saturation adjusted image saved to {output_image_path}")
 
-    # Map saturation_factor (-100 to 100) to a scaling factor (0.0 to 2.0)
-    scale_factor = 1 + saturation_factor / 100.0
 
-    if input_image_path.endswith(".npy"):
-        img = np.load(input_image_path)
-    else:
-        # Load the input image
-        img_raw = cv2.imread(input_image_path, cv2.IMREAD_UNCHANGED)
-        if img_raw is None:
-            raise FileNotFoundError(f"Image not found at path: {input_image_path}")
-    
-        if img_raw.dtype == np.uint8:
-            max_pixel_value = 255.0
-        elif img_raw.dtype == np.uint16:
-            max_pixel_value = 65535.0
-        else:
-            raise ValueError(f"Unsupported image type: {img_raw.dtype}")
-        # Convert BGR to RGB for processing
-        img = cv2.cvtColor(img_raw, cv2.COLOR_BGR2RGB).astype(np.float32) / max_pixel_value  # Normalize to [0, 1]
-
-    # Step 1: Convert RGB to HSL
-    def rgb_to_hsl(image):
-        """Convert RGB image to HSL color space."""
-        r, g, b = image[..., 0], image[..., 1], image[..., 2]
-        max_val = np.max(image, axis=-1)
-        min_val = np.min(image, axis=-1)
-        l = (max_val + min_val) / 2
-
-        delta = max_val - min_val
-        s = np.zeros_like(l)
-        h = np.zeros_like(l)
-
-        # Saturation calculation
-        mask = delta > 0
-        s[mask & (l < 0.5)] = delta[mask & (l < 0.5)] / (max_val[mask & (l < 0.5)] + min_val[mask & (l < 0.5)])
-        s[mask & (l >= 0.5)] = delta[mask & (l >= 0.5)] / (2 - max_val[mask & (l >= 0.5)] - min_val[mask & (l >= 0.5)])
-
-        # Hue calculation
-        mask_r = (max_val == r) & mask
-        mask_g = (max_val == g) & mask
-        mask_b = (max_val == b) & mask
-
-        h[mask_r] = ((g[mask_r] - b[mask_r]) / delta[mask_r]) % 6
-        h[mask_g] = ((b[mask_g] - r[mask_g]) / delta[mask_g]) + 2
-        h[mask_b] = ((r[mask_b] - g[mask_b]) / delta[mask_b]) + 4
-
-        h /= 6
-        h[h < 0] += 1  # Ensure hue is in [0, 1]
-
-        return h, s, l
-
-    # Step 2: Adjust the saturation
-    def adjust_hsl_saturation(h, s, l, scale_factor):
-        """Adjust the saturation in HSL space."""
-        s = np.clip(s * scale_factor, 0, 1)  # Scale the saturation by the factor
-        return h, s, l
-
-    # Step 3: Convert HSL back to RGB
-    def hsl_to_rgb(h, s, l):
-        """Convert HSL image back to RGB color space."""
-        c = (1 - np.abs(2 * l - 1)) * s
-        x = c * (1 - np.abs((h * 6) % 2 - 1))
-        m = l - c / 2
-
-        rgb = np.zeros((h.shape[0], h.shape[1], 3), dtype=np.float32)
-        h6 = h * 6
-
-        idx = (h6 < 1)
-        rgb[idx] = np.stack([c[idx], x[idx], np.zeros_like(c[idx])], axis=-1)
-
-        idx = (1 <= h6) & (h6 < 2)
-        rgb[idx] = np.stack([x[idx], c[idx], np.zeros_like(c[idx])], axis=-1)
-
-        idx = (2 <= h6) & (h6 < 3)
-        rgb[idx] = np.stack([np.zeros_like(c[idx]), c[idx], x[idx]], axis=-1)
-
-        idx = (3 <= h6) & (h6 < 4)
-        rgb[idx] = np.stack([np.zeros_like(c[idx]), x[idx], c[idx]], axis=-1)
-
-        idx = (4 <= h6) & (h6 < 5)
-        rgb[idx] = np.stack([x[idx], np.zeros_like(c[idx]), c[idx]], axis=-1)
-
-        idx = (5 <= h6) & (h6 < 6)
-        rgb[idx] = np.stack([c[idx], np.zeros_like(c[idx]), x[idx]], axis=-1)
-
-        return np.clip(rgb + m[..., None], 0, 1)
-
-    # Convert RGB to HSL
-    h, s, l = rgb_to_hsl(img)
-
-    # Adjust the saturation
-    h, s, l = adjust_hsl_saturation(h, s, l, scale_factor)
-
-    # Convert HSL back to RGB
-    adjusted_img = hsl_to_rgb(h, s, l)
-
-    if input_image_path.endswith(".npy"):
-        np.save(output_image_path, adjusted_img)
-        print(f"Saturation adjusted image npy saved to {output_image_path}")
-    else:
-        # Convert back to 8-bit format
-        final_image = (adjusted_img * max_pixel_value).astype(img_raw.dtype)
+@lru_cache(maxsize=64)
+def _channel_shift_table(dtype_name: str, delta: int) -> np.ndarray:
+    """整数图像的平移表: code => clip(code + delta), 饱和到 [0, max]。"""
+    max_value = np.iinfo(dtype_name).max
+    table = np.clip(np.arange(max_value + 1, dtype=np.int64) + delta, 0, max_value).astype(dtype_name)
+    table.flags.writeable = False
+    return table
+
+
+def channel_shift_array(img: np.ndarray, shifts: Tuple[float, float, float]) -> np.ndarray:
+    """
+    Add a constant to each channel and saturate, natively at the image's bit depth.
+    -- img: np.ndarray, (H, W, 3), uint8 / uint16 / float32 [0,1]. Returned with the same dtype.
+    -- shifts: (s0, s1, s2), per-channel offsets in [0,1] units, in the channel order of img.
+    uint8: one cv2.LUT over all three channels; uint16: one table gather per shifted channel;
+    float32: one broadcast add + clip. No split / merge copies.
+    """
+    if img.dtype == np.uint8:
+        tables = [_channel_shift_table("uint8", int(np.round(shift * 255))) for shift in shifts]
+        return cv2.LUT(img, np.stack(tables, axis=-1)[None])
+
+    if img.dtype == np.uint16:
+        out = np.empty_like(img)
+        for channel, shift in enumerate(shifts):
+            delta = int(np.round(shift * 65535))
+            if delta == 0:
+                out[..., channel] = img[..., channel]
+            else:
+                out[..., channel] = _channel_shift_table("uint16", delta)[img[..., channel]]
+        return out
 
-        bgr_final_image = cv2.cvtColor(final_image, cv2.COLOR_RGB2BGR)
-        # 保存为 TIFF
-        cv2.imwrite(output_image_path, bgr_final_image)
-        print(f"Saturation adjusted image saved to {output_image_path}")
+    out = np.add(img, np.asarray(shifts, dtype=np.float32), dtype=np.float32)
+    return np.clip(out, 0.0, 1.0, out=out)
 
 
-def tone(input_image_path: str, output_image_path: str, tone_factor: float):
+def process_channel_shift_file(input_image_path: str, output_image_path: str, shifts: Tuple[float, float, float],
+                               tile_size: TileSize = None, num_workers: int = 1):
+    """
+    Path interface of channel_shift_array. 8-bit / 16-bit colour images are shifted on their
+    integer codes and written back at the same bit depth (no float round trip); .npy,
+    grayscale and already-decoded (cached) inputs go through process_image_file.
+    -- shifts: per-channel offsets in [0,1] units, RGB order.
+    -- tile_size / num_workers: only used by the float path; the integer path is a single gather.
+    """
+    if (is_npy(input_image_path) or is_npy(output_image_path)
+            or DECODED_IMAGE_CACHE.get(input_image_path) is not None):
+        process_image_file(channel_shift_array, input_image_path, output_image_path, shifts, tile_size, num_workers)
+        return
+
+    raw = read_image_native(input_image_path)
+    if raw.ndim == 2:
+        # 单通道 => float 路径 (扩为3通道后各通道平移不同)
+        process_image_file(channel_shift_array, input_image_path, output_image_path, shifts, tile_size, num_workers)
+        return
+    # BGR(A): 去掉 alpha 通道 (与 read_image_float 一致), 平移量按 BGR 顺序
+    bgr = np.ascontiguousarray(raw[..., :3])
+    write_image_native(output_image_path, channel_shift_array(bgr, tuple(shifts[::-1])))
+
+
+def _tone_shifts(tone_factor: float) -> Tuple[float, float, float]:
+    # tone_factor 以 8 位色阶为单位, 正值减少绿色 (偏品红)
+    return 0.0, -1 * tone_factor / 255.0, 0.0
+
+
+def tone_array(img: np.ndarray, tone_factor: float) -> np.ndarray:
+    """
+    Shift the green channel of an RGB image.
+    -- img: np.ndarray, RGB, uint8 / uint16 / float32 [0,1] (see channel_shift_array).
+    -- tone_factor: float, the factor to adjust the tone, in 8-bit levels. [-150, 150]
+    """
+    return channel_shift_array(img, _tone_shifts(tone_factor))
+
+
+def tone(input_image_path: str, output_image_path: str, tone_factor: float, tile_size: TileSize = None, num_workers: int = 1):
     """
     @2024/10/27
     Adjust the tone of the image.
     -- input_image_path: str, the path of the input image.
     -- output_image_path: str, the path of the output image.
     -- tone_factor: float, the factor to adjust the tone. [-150, 150]
+    -- tile_size: int or (rows, cols), process the image tile by tile to bound memory. None for full frame.
+    -- num_workers: int, number of threads working on row bands / tiles. None for cv2.getNumThreads().
+    8-bit / 16-bit inputs are processed natively at their bit depth (see process_channel_shift_file).
     """
-    img_raw = cv2.imread(input_image_path)
-    value = -1 * tone_factor
-    b, g, r = cv2.split(img_raw)
-    
-    if value >= 0:
-        lim = 255 - value
-        g[g > lim] = 255
-        g[g <= lim] += value
-      
+    process_channel_shift_file(input_image_path, output_image_path, _tone_shifts(tone_factor), tile_size, num_workers)
+
+
+def _color_temperature_shifts(color_temperature_factor: float) -> Tuple[float, float, float]:
+    original_temp = 6000
+    value = np.clip(color_temperature_factor, 2000, 50000)  # Ensure value is within the specified range
+    if value > original_temp:
+        value = ((value - original_temp) / (50000 - original_temp)) * 100  # Map to 0-100
     else:
-        lim = 0 - value
-        g[g < lim] = 0
-        g[g >= lim] -= abs(value)
-
-    
-    image = cv2.merge((b, g, r))
-    img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    output_image = Image.fromarray(img)
-    output_image.save(output_image_path)
-    print(output_image_path)
+        value = ((value - original_temp) / (original_temp - 2000)) * 100  # Map to -100-0
+    # The shift is applied in whole 8-bit levels
+    value = int(-1 * np.round(value)) / 255.0
+    return -value, 0.0, value
 
 
-def color_temperature(input_image_path: str, output_image_path: str, color_temperature_factor: float):
+def color_temperature_array(img: np.ndarray, color_temperature_factor: float) -> np.ndarray:
+    """
+    Shift the red/blue balance of an RGB image.
+    -- img: np.ndarray, RGB, uint8 / uint16 / float32 [0,1] (see channel_shift_array).
+    -- color_temperature_factor: float, the target color temperature. [2000, 50000]
+    !! We set the original color temperature to 6000K.
+    """
+    return channel_shift_array(img, _color_temperature_shifts(color_temperature_factor))
+
+
+def color_temperature(input_image_path: str, output_image_path: str, color_temperature_factor: float, tile_size: TileSize = None, num_workers: int = 1):
     """
     @2024/10/27
     Adjust the color temperature of the image.
     -- input_image_path: str, the path of the input image.
     -- output_image_path: str, the path of the output image.
     -- color_temperature_factor: float, the factor to adjust the color temperature. [2000, 50000]
+    -- tile_size: int or (rows, cols), process the image tile by tile to bound memory. None for full frame.
+    -- num_workers: int, number of threads working on row bands / tiles. None for cv2.getNumThreads().
     !! We set the original color temperature to 6000K.
+    8-bit / 16-bit inputs are processed natively at their bit depth (see process_channel_shift_file).
     """
-    img_raw = cv2.imread(input_image_path)
-    img = cv2.cvtColor(img_raw, cv2.COLOR_BGR2RGB)
-    original_temp = 6000
-    value = np.clip(color_temperature_factor, 2000, 50000)  # Ensure value is within the specified range
-    if value > original_temp:
-        value = ((value - original_temp) / (50000 - original_temp)) * 100  # Map to 0-100
-    else:
-        value = ((value - original_temp) / (original_temp - 2000)) * 100  # Map to -100-0
-    print(value)
-    value = np.round(value)  # Convert to uint8 to avoid casting issues
-    b, g, r = cv2.split(img)
-    value = int(-1 * value)
-    print(value)
-    if value >= 0:
-        lim = 255 - value
-        r[r > lim] = 255
-        r[r <= lim] += value
-        
-        lim1 = 0 + value
-        b[b < lim1] = 0
-        b[b >= lim1] -= value
-        
-    else:
-        lim = 0 - value
-        r[r < lim] = 0
-        r[r >= lim] -= abs(value)
-        
-        lim = 255 - abs(value)
-        b[b > lim] = 255
-        b[b <= lim] += abs(value)
-
-    image = cv2.merge((b, g, r))
-    #image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # Convert to RGB before saving
-    output_image = Image.fromarray(image)
-    output_image.save(output_image_path)
-    print(output_image_path)
+    process_channel_shift_file(input_image_path, output_image_path, _color_temperature_shifts(color_temperature_factor),
+                               tile_size, num_workers)
 
 
 if __name__ == "__main__":
-    saturation("berowra-landscape-photography.jpg", "cache/test/000.jpg", 100)
-    # shadows("berowra-landscape-photography.jpg", "cache/test/001.jpg", -100)
-    highlights("berowra-landscape-photography.jpg", "cache/test/002.jpg", 100)
-    contrast("berowra-landscape-photography.jpg", "cache/test/003.jpg", -100)
-    black("berowra-landscape-photography.jpg", "cache/test/004.jpg", -40)
-    white("berowra-landscape-photography.jpg", "cache/test/005.jpg", 100)
-    tone("berowra-landscape-photography.jpg", "cache/test/006.jpg", 30)
-    color_temperature("berowra-landscape-photography.jpg", "cache/test/007.jpg", 1000)
-    exposure("berowra-landscape-photography.jpg", "cache/test/008.jpg", 1)
\ No newline at end of file
+    # 对一张图依次跑一遍所有操作, 结果写到 cache/test/
+    # 用法: python ImageProcessing.py [输入图像]
+    import sys
+    input_image = sys.argv[1] if len(sys.argv) > 1 else "berowra-landscape-photography.jpg"
+    if not os.path.exists(input_image):
+        sys.exit(f"找不到输入图像: {input_image}")
+    os.makedirs(os.path.join("cache", "test"), exist_ok=True)
+    saturation(input_image, "cache/test/000.jpg", 100)
+    shadow(input_image, "cache/test/001.jpg", -100)
+    highlight(input_image, "cache/test/002.jpg", 100)
+    contrast(input_image, "cache/test/003.jpg", -100)
+    black(input_image, "cache/test/004.jpg", -40)
+    white(input_image, "cache/test/005.jpg", 100)
+    tone(input_image, "cache/test/006.jpg", 30)
+    color_temperature(input_image, "cache/test/007.jpg", 1000)
+    exposure(input_image, "cache/test/008.jpg", 1)
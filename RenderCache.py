@@ -0,0 +1,166 @@
+import hashlib
+import os
+import shutil
+import threading
+from typing import Callable, Dict, Tuple
+
+from ImageIO import replacing_file
+from TileProcessing import TileSize
+
+
+# Bump when an op's output changes for the same input, so stale renders are never reused
+RENDER_CACHE_VERSION = 3
+
+
+class RenderCache:
+    """
+    Persistent on-disk cache of rendered images.
+
+    Key: hash of (input file bytes, op name, op parameters, output format). The same
+    adjustment re-applied after an undo_step, a retry, or on an identical image in
+    another session is served by copying the cached file instead of re-rendering.
+
+    Entries are plain files <key><ext> in cache_dir. A hit refreshes the file's
+    mtime, and when the directory grows beyond max_bytes the entries with the
+    oldest mtime are evicted first (LRU that survives restarts, no index file),
+    down to low_water * max_bytes so the next misses do not evict again.
+    The directory is only listed when the running size estimate passes max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = os.path.join("cache", "render"), max_bytes: int = 2 << 30,
+                 low_water: float = 0.9):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._estimated_bytes = None  # size of the entries, listed on the first miss then kept up to date
+        self._digests: Dict[str, Tuple[tuple, str]] = {}  # path => ((mtime_ns, size), content digest)
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def content_digest(self, image_path: str) -> str:
+        """
+        Hash of the bytes of an image file, memoized per path / mtime / size. Reading the file is much cheaper
+        than decoding it (the op decodes it anyway on a miss, the prefix cache not at all); the bytes also fix
+        the bit depth of the output. The toolbox writes the same pixels to the same bytes, so equal states of
+        different sessions share their entries.
+        """
+        path = os.path.abspath(image_path)
+        stat = os.stat(path)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            memo = self._digests.get(path)
+        if memo is not None and memo[0] == file_key:
+            return memo[1]
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as input_file:
+            for chunk in iter(lambda: input_file.read(1 << 20), b""):
+                digest.update(chunk)
+        result = digest.hexdigest()
+        with self._lock:
+            self._digests[path] = (file_key, result)
+        return result
+
+    def key(self, input_image_path: str, op_name: str, params, output_extension: str, tile_size: TileSize = None) -> str:
+        # Quantized outputs keep the input bit depth, which the input bytes determine; .npy outputs are float32
+        description = (f"{RENDER_CACHE_VERSION}|{self.content_digest(input_image_path)}|{op_name}|{params!r}|"
+                       f"{output_extension.lower()}|{tiling(tile_size)}")
+        return hashlib.blake2b(description.encode(), digest_size=20).hexdigest()
+
+    def render(self, operation: Callable, input_image_path: str, output_image_path: str, factor, **kwargs):
+        """
+        operation(input_image_path, output_image_path, factor, **kwargs), served from the cache when possible.
+        tile_size is part of the key (see tiling); the other kwargs (num_workers, ...) must not change the result.
+        """
+        entry_path = self.entry_path(operation.__name__, input_image_path, output_image_path, factor, kwargs.get("tile_size"))
+        if self.fetch(entry_path, output_image_path):
+            return
+        operation(input_image_path, output_image_path, factor, **kwargs)
+        self.store(entry_path, output_image_path)
+
+    def entry_path(self, op_name: str, input_image_path: str, output_image_path: str, factor, tile_size: TileSize = None) -> str:
+        """ Cache file of op_name(input_image_path, factor) written as output_image_path (see key) """
+        extension = os.path.splitext(output_image_path)[1]
+        return os.path.join(self.cache_dir, self.key(input_image_path, op_name, factor, extension, tile_size) + extension)
+
+    def fetch(self, entry_path: str, output_image_path: str) -> bool:
+        """ Copy a cached render to output_image_path. Returns False (a miss) if there is none """
+        if os.path.exists(entry_path):
+            try:
+                with replacing_file(output_image_path) as temp_path:  # output_image_path may be a shared link
+                    shutil.copyfile(entry_path, temp_path)
+                os.utime(entry_path)
+                with self._lock:
+                    self.hits += 1
+                return True
+            except FileNotFoundError:
+                pass  # evicted in between: render it
+
+        with self._lock:
+            self.misses += 1
+        return False
+
+    def store(self, entry_path: str, output_image_path: str):
+        """ Add the render output_image_path after a miss of fetch(entry_path, ...) """
+        # Write under a temporary name and rename, so readers never see a partial entry
+        temp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(output_image_path, temp_path)
+        os.replace(temp_path, entry_path)
+        with self._lock:
+            if self._estimated_bytes is not None:
+                self._estimated_bytes += os.path.getsize(entry_path)
+            over = self._estimated_bytes is None or self._estimated_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self, target_bytes: int = None):
+        """
+        Delete the least recently used entries until the cache fits in target_bytes
+        (default: low_water * max_bytes once max_bytes is exceeded).
+        """
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            if target_bytes is None:
+                target_bytes = int(self.max_bytes * self.low_water) if total > self.max_bytes else total
+            for _, size, name in sorted(entries):
+                if total <= target_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+            self._estimated_bytes = total
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self.cache_dir):
+                os.remove(os.path.join(self.cache_dir, name))
+            self._estimated_bytes = 0
+
+
+def tiling(tile_size: TileSize) -> str:
+    """
+    The part of the tile configuration that can change a render: full-width row bands are
+    bit-identical to an untiled render (see TileProcessing.apply_tiled), narrower tiles are not.
+    """
+    if tile_size is None:
+        return "full"
+    tile_rows, tile_cols = (tile_size, tile_size) if isinstance(tile_size, int) else tile_size
+    return "full" if tile_cols is None else f"{tile_rows}x{tile_cols}"
@@ -0,0 +1,171 @@
+import os
+import threading
+from collections import Counter
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+
+# A session state: (state index, [(path, kind), ...]); kind is "preview" (preview / histogram images)
+# or "full" (full-resolution intermediates)
+SessionState = Tuple[int, List[Tuple[str, str]]]
+
+
+class RetentionPolicy:
+    """
+    Which intermediate files of a session to keep.
+
+    - The first state (the original) and the last keep_last states are always kept,
+      as are the states the toolbox pins (undo / redo targets, pending renders).
+      The exported final image is not a session state and is never touched.
+    - Older full-resolution intermediates are deleted; older previews and histograms
+      too unless keep_previews (they are small and the prompts refer to them as image-N).
+    - max_bytes: disk quota of the output directory (see directory_bytes: blobs its symlinks point to
+      count once). While it is exceeded, the remaining unprotected files are deleted oldest first,
+      full-resolution files before previews. Deleting the last link to a blob only frees its bytes if the
+      blob is released too (on_delete => BlobStore StoreSession.forget).
+    """
+
+    def __init__(self, keep_last: int = 2, keep_previews: bool = True, max_bytes: Optional[int] = None):
+        if keep_last < 1:
+            raise ValueError("keep_last must be at least 1 (the current state).")
+        self.keep_last = keep_last
+        self.keep_previews = keep_previews
+        self.max_bytes = max_bytes
+
+
+def directory_bytes(path: str) -> int:
+    """
+    Disk usage of a directory: its own files (a symlink counts as the link itself) plus, once each,
+    the outside files its symlinks point to (e.g. BlobStore blobs shared by several states)
+    """
+    total = 0
+    directory = os.path.realpath(path)
+    targets = set()
+    for entry in os.scandir(path):
+        try:
+            if entry.is_symlink():
+                total += entry.stat(follow_symlinks=False).st_size
+                target = os.path.realpath(entry.path)
+                if target not in targets and os.path.dirname(target) != directory and os.path.isfile(target):
+                    targets.add(target)
+                    total += os.stat(target).st_size
+            elif entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def select_evictions(states: List[SessionState], pinned: Set[int], policy: RetentionPolicy,
+                     used_bytes: int) -> List[str]:
+    """ Paths to delete, in order, to apply policy to the existing files of states """
+    indices = sorted({index for index, _ in states})
+    protected = set(pinned) | set(indices[:1]) | set(indices[-policy.keep_last:])
+    candidates = [(index, path, kind) for index, files in states if index not in protected
+                  for path, kind in files if os.path.lexists(path)]
+
+    evictions = [path for _, path, kind in candidates if kind == "full" or not policy.keep_previews]
+    if policy.max_bytes is not None:
+        # A symlink frees its target (counted once by directory_bytes) only with the last link of the session to it
+        links = Counter(os.path.realpath(path) for _, files in states for path, _ in files if os.path.islink(path))
+
+        def freed_by(path: str) -> int:
+            size = _link_bytes(path)
+            if os.path.islink(path):
+                target = os.path.realpath(path)
+                links[target] -= 1
+                if links[target] == 0:
+                    size += _file_bytes(target)
+            return size
+
+        freed = sum(freed_by(path) for path in evictions)
+        remaining = sorted((candidate for candidate in candidates if candidate[1] not in evictions),
+                           key=lambda candidate: (candidate[2] != "full", candidate[0]))
+        for _, path, _ in remaining:
+            if used_bytes - freed <= policy.max_bytes:
+                break
+            evictions.append(path)
+            freed += freed_by(path)
+    return evictions
+
+
+def _link_bytes(path: str) -> int:
+    try:
+        return os.lstat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _file_bytes(path: str) -> int:
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+class SessionJanitor:
+    """
+    Applies a RetentionPolicy to a session directory, on a background thread while the session runs.
+
+    collect() returns (states, pinned state indices); it is called under `lock` right before deleting,
+    so a toolbox that holds `lock` while it reuses an old state's files (undo, checkout) never sees
+    them disappear half-way. on_delete(path) is called after each deletion (e.g. BlobStore manifests).
+    """
+
+    def __init__(self, policy: RetentionPolicy, output_dir: str,
+                 collect: Callable[[], Tuple[List[SessionState], Iterable[int]]],
+                 on_delete: Optional[Callable[[str], None]] = None, background: bool = True):
+        self.policy = policy
+        self.output_dir = output_dir
+        self.collect = collect
+        self.on_delete = on_delete
+        self.lock = threading.RLock()
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+            self._thread.start()
+
+    def request(self):
+        """ A state was added: enforce the policy (in the background, or right away) """
+        if self._thread is None:
+            self.enforce()
+        else:
+            self._wake.set()
+
+    def enforce(self):
+        with self.lock:
+            states, pinned = self.collect()
+            used_bytes = directory_bytes(self.output_dir) if self.policy.max_bytes is not None else 0
+            for path in select_evictions(states, set(pinned), self.policy, used_bytes):
+                size = _file_bytes(path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self.deleted_files += 1
+                self.deleted_bytes += size
+                if self.on_delete is not None:
+                    self.on_delete(path)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stopped:
+                return
+            try:
+                self.enforce()
+            except Exception as error:  # keep the session running, retention is best effort
+                print(f"Retention failed: {error}")
+
+    def close(self):
+        """ Run a last pass and stop the background thread """
+        if self._thread is not None:
+            self._stopped = True
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.enforce()
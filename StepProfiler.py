@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def read_io_counters() -> Optional[Tuple[int, int]]:
+    """
+    (bytes read, bytes written) by this process so far, from /proc/self/io (Linux).
+    rchar / wchar count every read() / write() including the ones served by the page cache;
+    memory-mapped .npy access does not show up. None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/io") as io_file:
+            counters = dict(line.split(":") for line in io_file.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class StepProfiler:
+    """
+    Per-step timing / memory records of a toolbox session.
+
+    Each `with profiler.step(name, **context):` block produces one record:
+        name, context fields (state index, operation, factor, ...),
+        wall_s, cpu_s (process CPU time, all threads),
+        bytes_read, bytes_written (process I/O during the step, None if unavailable),
+        peak_alloc_bytes (tracemalloc peak above the memory in use when the step started,
+                          None when trace_memory is off),
+        depth / parent (steps nest: adjust_* => preview / histogram / high_resolution), thread.
+
+    Records are appended to `records`, written as one JSON object per line to sidecar_path
+    (if set) and passed to every callback. Nesting is tracked per thread, so a step running on
+    the background high-resolution worker is a top-level record of that thread; its CPU time,
+    I/O and allocation peak then also include whatever the main thread did meanwhile.
+    """
+
+    def __init__(self, sidecar_path: Optional[str] = None, callbacks: Optional[List[Callable[[dict], None]]] = None,
+                 trace_memory: bool = True):
+        self.sidecar_path = sidecar_path
+        self.callbacks = list(callbacks or [])
+        self.trace_memory = trace_memory
+        self.records: List[dict] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def add_callback(self, callback: Callable[[dict], None]):
+        self.callbacks.append(callback)
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def step(self, name: str, **context):
+        stack = self._stack()
+        frame = {"name": name, "child_peak": 0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # reset_peak() below would lose the enclosing step's peak so far: keep it in its frame
+                stack[-1]["child_peak"] = max(stack[-1]["child_peak"], peak)
+            tracemalloc.reset_peak()
+            frame["memory_start"] = current
+        stack.append(frame)
+        io_start = read_io_counters()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        started_at = time.time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            io_end = read_io_counters()
+            stack.pop()
+            peak_alloc = None
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+                peak_alloc = max(peak - frame["memory_start"], 0)
+                if stack:
+                    stack[-1]["child_peak"] = max(stack[-1]["child_peak"], peak)
+            record = {
+                "name": name,
+                **context,
+                "started_at": started_at,
+                "wall_s": wall,
+                "cpu_s": cpu,
+                "bytes_read": io_end[0] - io_start[0] if io_start and io_end else None,
+                "bytes_written": io_end[1] - io_start[1] if io_start and io_end else None,
+                "peak_alloc_bytes": peak_alloc,
+                "depth": len(stack),
+                "parent": stack[-1]["name"] if stack else None,
+                "thread": threading.current_thread().name,
+            }
+            self._emit(record)
+
+    def _emit(self, record: dict):
+        with self._lock:
+            self.records.append(record)
+            if self.sidecar_path is not None:
+                with open(self.sidecar_path, "a") as sidecar:
+                    sidecar.write(json.dumps(record, default=str) + "\n")
+        for callback in self.callbacks:
+            callback(record)
+
+    def summary(self) -> Dict[str, dict]:
+        """ Step name => {count, wall_s, cpu_s, bytes_read, bytes_written, peak_alloc_bytes (max)} """
+        totals: Dict[str, dict] = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            total = totals.setdefault(record["name"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "bytes_read": 0,
+                                                       "bytes_written": 0, "peak_alloc_bytes": 0})
+            total["count"] += 1
+            total["wall_s"] += record["wall_s"]
+            total["cpu_s"] += record["cpu_s"]
+            total["bytes_read"] += record["bytes_read"] or 0
+            total["bytes_written"] += record["bytes_written"] or 0
+            total["peak_alloc_bytes"] = max(total["peak_alloc_bytes"], record["peak_alloc_bytes"] or 0)
+        return totals
+
+    def close(self):
+        """ Stop tracemalloc if this profiler started it """
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+class _NullProfiler:
+    """ Stand-in when profiling is off: step() costs one no-op context manager """
+
+    @contextmanager
+    def step(self, name: str, **context):
+        yield
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = _NullProfiler()
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, Tuple, Union
+import numpy as np
+import cv2
+
+
+TileSize = Union[int, Tuple[int, Optional[int]]]
+
+
+def iter_tiles(height: int, width: int, tile_size: TileSize) -> Iterator[Tuple[slice, slice]]:
+    """
+    Yield (row_slice, col_slice) pairs covering a height x width frame.
+
+    tile_size:
+        int: square tiles of tile_size x tile_size pixels
+        (rows, cols): rectangular tiles; cols=None gives full-width row stripes
+    """
+    if isinstance(tile_size, int):
+        tile_rows, tile_cols = tile_size, tile_size
+    else:
+        tile_rows, tile_cols = tile_size
+    tile_cols = width if tile_cols is None else tile_cols
+    if tile_rows < 1 or tile_cols < 1:
+        raise ValueError(f"Tile size must be positive, got {tile_size}")
+
+    for top in range(0, height, tile_rows):
+        for left in range(0, width, tile_cols):
+            yield slice(top, min(top + tile_rows, height)), slice(left, min(left + tile_cols, width))
+
+
+def resolve_num_workers(num_workers: Optional[int]) -> int:
+    """
+    None => cv2.getNumThreads(), so cv2.setNumThreads(n) also caps the
+    thread pool (and cv2.setNumThreads(0) makes every render serial).
+    """
+    if num_workers is None:
+        return max(1, cv2.getNumThreads())
+    if num_workers < 1:
+        raise ValueError(f"num_workers must be positive, got {num_workers}")
+    return num_workers
+
+
+def row_bands(height: int, num_workers: int, bands_per_worker: int = 4) -> Tuple[int, None]:
+    """
+    Full-width stripe size splitting `height` rows into about
+    num_workers * bands_per_worker bands. A few bands per worker keeps the
+    pool busy when some bands (e.g. sky vs. foliage) are cheaper than others.
+    """
+    bands = max(1, num_workers * bands_per_worker)
+    return max(1, -(-height // bands)), None
+
+
+def apply_tiled(op: Callable[[np.ndarray, float], np.ndarray], img: np.ndarray, factor, tile_size: TileSize,
+                out: np.ndarray = None, num_workers: int = 1) -> np.ndarray:
+    """
+    Run a pointwise array op tile by tile.
+
+    Every ImageProcessing *_array op maps each pixel independently, so the
+    result matches op(img, factor) while the op's temporaries (Lab copies,
+    HSL planes, ...) only ever cover one tile. Full-width row bands are
+    bit-identical; narrower tiles move cvtColor's SIMD/scalar split and can
+    differ by one level on a few 16-bit pixels.
+
+    Parameters:
+        op: array op, op(tile, factor) -> tile, float32 [0,1] RGB.
+        img (np.ndarray): float32 [0,1] RGB frame.
+        factor: passed to op unchanged.
+        tile_size: see iter_tiles.
+        out (np.ndarray): destination frame; may be `img` itself to work in place.
+        num_workers (int): tiles processed concurrently by a thread pool;
+            None => resolve_num_workers. cvtColor and NumPy ufuncs release
+            the GIL, so the tiles really run in parallel.
+
+    Returns:
+        np.ndarray: `out`.
+    """
+    if out is None:
+        out = np.empty(img.shape, dtype=np.float32)
+
+    def run_tile(tile: Tuple[slice, slice]):
+        rows, cols = tile
+        # Square tiles are strided views; hand the op a contiguous copy
+        # (cv2 needs contiguous buffers and it keeps memory access linear)
+        out[rows, cols] = op(np.ascontiguousarray(img[rows, cols]), factor)
+
+    tiles = iter_tiles(img.shape[0], img.shape[1], tile_size)
+    num_workers = resolve_num_workers(num_workers)
+    if num_workers == 1:
+        for tile in tiles:
+            run_tile(tile)
+    else:
+        # Tiles never overlap, so writing back in place from several threads is safe.
+        # Only num_workers tiles are in flight at a time, which bounds the temporaries.
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            for _ in pool.map(run_tile, tiles):
+                pass  # re-raises the first exception from a worker
+    return out
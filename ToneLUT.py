@@ -0,0 +1,55 @@
+from typing import Callable, Dict
+import numpy as np
+
+
+class ToneLUT:
+    """
+    A pointwise tone curve sampled once on `levels` evenly spaced points of [0, 1].
+
+    Calling the LUT on a float array in [0, 1] replaces the per-pixel curve
+    evaluation (np.power / np.exp / np.log1p ...) by a table lookup:
+    - interpolate=False: a single gather of the nearest sample (default for 65536 levels)
+    - interpolate=True: linear interpolation between the two nearest samples
+      (default for coarser tables such as 4096 levels)
+    uint8 / uint16 arrays are mapped through an exact per-code table of the
+    same dtype, so 8-bit and 16-bit sources also cost one gather.
+    """
+
+    def __init__(self, curve: Callable[[np.ndarray], np.ndarray], levels: int = 65536, interpolate: bool = None):
+        if levels < 2:
+            raise ValueError(f"A LUT needs at least 2 levels, got {levels}")
+        self.curve = curve
+        self.levels = levels
+        self.interpolate = levels < 65536 if interpolate is None else interpolate
+        self.table = np.asarray(curve(np.linspace(0.0, 1.0, levels)), dtype=np.float32)
+        self._integer_tables: Dict[np.dtype, np.ndarray] = {}
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        """Map `values` through the curve. Floats are expected in [0, 1]."""
+        values = np.asarray(values)
+        if values.dtype in (np.uint8, np.uint16):
+            return self.integer_table(values.dtype)[values]
+
+        index = np.multiply(values, self.levels - 1, dtype=np.float32)
+        np.clip(index, 0, self.levels - 1, out=index)
+        if not self.interpolate:
+            index += 0.5
+            return self.table[index.astype(np.intp)]
+
+        lower = np.minimum(index.astype(np.intp), self.levels - 2)
+        index -= lower  # fractional position between the two samples
+        low_values = self.table[lower]
+        return low_values + index * (self.table[lower + 1] - low_values)
+
+    def integer_table(self, dtype) -> np.ndarray:
+        """
+        Output code for every input code of an integer image (256 entries for
+        uint8, 65536 for uint16), evaluated exactly at code / max_value.
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in self._integer_tables:
+            max_value = np.iinfo(dtype).max
+            codes = np.arange(max_value + 1, dtype=np.float64) / max_value
+            mapped = np.clip(self.curve(codes), 0.0, 1.0) * max_value
+            self._integer_tables[dtype] = np.round(mapped).astype(dtype)
+        return self._integer_tables[dtype]
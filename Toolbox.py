@@ -1,16 +1,21 @@
+import contextlib
+import functools
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Callable
 import numpy as np
-from Levenshtein import distance
-
-import pyautogui
 
 import cv2
-import matplotlib.pyplot as plt
-from io import BytesIO
 
-from PIL import Image, ImageEnhance, ExifTags
+from PIL import Image, ImageEnhance
 from ImageProcessing import *
+from EditChain import OPERATIONS, active_operations, render_chain, render_chain_file, PrefixRenderCache
+from ColorLUT import bake_lut3d, apply_lut3d, write_cube
+from Histogram import render_histogram, ColorHistogram
+from StepProfiler import StepProfiler, NULL_PROFILER
+from ImageIO import link_image, read_image_preview, is_npy, imwrite, replacing_file, EXIF_ROTATIONS, LOSSLESS_EXTENSIONS
+from Retention import SessionJanitor
 
 from Utils import pretty_print_content
 
@@ -22,13 +27,81 @@ def tool_doc(description):
     return decorator
 
 
-class ImageProcessingToolBoxes:
+def profiled_step(func):
+    """ Record a toolbox call (adjust_*, undo_step) as one step of self.profiler, with the state index it creates """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.profiler.step(func.__name__, state=len(self.image_paths)):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+class SessionRetention:
+    """
+    Retention hooks shared by the toolboxes (Retention.SessionJanitor.collect => retention_states).
+    A subclass sets self.janitor (a SessionJanitor or None) and self.image_paths / self.histogram_paths (one entry
+    per state), holds retention_lock while it appends to them, and can override full_resolution_paths / pinned_states.
+    """
+
+    def retention_lock(self):
+        """ Held while old states' files are reused, so the retention policy does not delete them meanwhile """
+        return self.janitor.lock if self.janitor is not None else contextlib.nullcontext()
+
+    def apply_retention(self):
+        if self.janitor is not None:
+            self.janitor.request()
 
-    def __init__(self, image_path, output_dir_name, debug=False, save_high_resolution=True, save_numpy_as_hr=True, extension_name="png"):
+    def retention_states(self):
+        """
+        Files of every state for the retention policy, and the states to keep whatever the policy (pinned_states).
+        The lists are read under retention_lock, which the methods appending to them hold.
+        """
+        with self.retention_lock():
+            image_paths, histogram_paths = list(self.image_paths), list(self.histogram_paths)
+            full_paths = self.full_resolution_paths()
+            pinned = self.pinned_states(len(image_paths))
+        states = []
+        for index, image_path in enumerate(image_paths):
+            files = [(image_path, "preview")]
+            if index < len(full_paths):
+                files.append((full_paths[index], "full"))
+            if index < len(histogram_paths):
+                files.append((histogram_paths[index], "preview"))
+            states.append((index, files))
+        return states, pinned
+
+    def full_resolution_paths(self):
+        """ Full-resolution file of each state (none by default), called under retention_lock """
+        return []
+
+    def pinned_states(self, state_count):
+        """ The state before the current one (the undo / comparison target), called under retention_lock """
+        return {max(state_count - 2, 0)}
+
+
+class ImageProcessingToolBoxes(SessionRetention):
+
+    def __init__(self, image_path, output_dir_name, debug=False, save_high_resolution=True, save_numpy_as_hr=False, extension_name="png", tile_size=None, num_workers=None, lazy_high_resolution=False, background_high_resolution=False, render_cache=None, prefix_cache_bytes=256 << 20, profile_steps=False, step_callback=None, blob_store=None, retention_policy=None):
         self.output_dir_path = output_dir_name
         self.extension_name = extension_name
         self.save_high_resolution = save_high_resolution
+        # Opt-in: store high-resolution intermediates as float32 .npy (memory-mapped by the ops, no rounding between steps).
+        # About 12 bytes per pixel and step, and not viewable: call export() for the final image.
+        # Off: high-resolution states are regular <extension_name> images at the original bit depth.
         self.save_numpy_as_hr = save_numpy_as_hr
+        self.tile_size = tile_size  # Tile size for high-resolution renders, None for full-frame processing
+        self.num_workers = num_workers  # Threads for high-resolution renders, None follows cv2.getNumThreads()
+        # Only render the preview while editing; the high-resolution image is rendered once by export()
+        self.lazy_high_resolution = lazy_high_resolution
+        # Render high-resolution steps on a background thread; the agent loop only waits in wait_high_resolution()
+        self.background_high_resolution = background_high_resolution
+        self.hr_futures = {}  # Index in hr_image_paths => Future of the background render producing it
+        self.hr_dependencies = {}  # Index in hr_image_paths => index of the state its render reads
+        # One worker: HR steps form a chain, each render already uses num_workers threads itself
+        self.hr_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hr-render") if background_high_resolution else None
+        self.render_cache = render_cache  # RenderCache consulted before every file render (see render_state), None to always render
+        self.prefix_cache_bytes = prefix_cache_bytes  # Memory budget of each PrefixRenderCache (preview / high resolution), source included
+        self.prefix_caches = {}  # high_resolution (bool) => (PrefixRenderCache, bit depth of the source)
         
         if not os.path.exists(output_dir_name):
             os.makedirs(output_dir_name)
@@ -37,9 +110,26 @@ class ImageProcessingToolBoxes:
         else:
             raise FileExistsError(f"The directory '{output_dir_name}' already exists.")
 
+        # Per-step wall / CPU time, I/O and allocation peak, written to processing_steps.jsonl and passed to step_callback
+        if profile_steps or step_callback is not None:
+            self.profiler = StepProfiler(os.path.join(output_dir_name, "processing_steps.jsonl"),
+                                         callbacks=[step_callback] if step_callback is not None else None)
+        else:
+            self.profiler = NULL_PROFILER
+        # Content-addressed storage (BlobStore): finished files become symlinks to deduplicated blobs
+        self.store_session = blob_store.open_session(output_dir_name) if blob_store is not None else None
+        # Retention.RetentionPolicy: delete old intermediates in the background; evicted states are re-rendered if reused
+        self.janitor = SessionJanitor(retention_policy, output_dir_name, self.retention_states, on_delete=self.forget_file) if retention_policy is not None else None
+
         self.image_paths = []  # List of image paths for OpenAI to view
         self.hr_image_paths = []  # List of high-resolution image paths
         self.histogram_paths = []  # List of histogram paths
+        self.color_histograms = []  # ColorHistogram of each preview state, updated through the ops instead of recounted
+        self.redo_stack = []  # Indices of the states reverted by undo_step, most recent last; cleared by a new adjustment
+        # Edit tree: image_paths index => node (index of the state that first rendered that content),
+        # node => (parent node, function name, factor). Restored / checked-out states point to an existing node.
+        self.state_nodes = [0]
+        self.edit_tree = {0: (None, None, None)}
         self.processing_log = []  # Log of processing steps
         self.function_calls = []  # Record of function calls
         self.history_messages = []  # Record of conversation history
@@ -52,56 +142,41 @@ class ImageProcessingToolBoxes:
         self.log_file_path = os.path.join(self.output_dir_path, "processing_log.txt")
         self.image_name, _ = os.path.splitext(os.path.basename(image_path))
 
-        # Load original image and downsample
-        img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+        # Load the 512 px preview: JPEGs are decoded at reduced resolution, EXIF is read from the same file read
         _, original_extension = os.path.splitext(image_path)
         self.original_extension = original_extension[1:]  # 去掉点号
-
-        # 检查图像是否为16位
-        if img.dtype == np.uint16:
-            # 将16位图像转换为8位
-            img_8bit = (img / 256).astype(np.uint8)
-
-        # Resize image to 512x512
-        height, width = img.shape[:2]
-        scale_factor = min(512/width, 512/height)
-        new_width, new_height = int(width * scale_factor), int(height * scale_factor)
-        img_resized = cv2.resize(img, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
+        # A rotated high-resolution copy has to be re-encoded, decode the full image once for both in that case
+        img_resized, img, orientation = read_image_preview(image_path, 512, EXIF_ROTATIONS if self.save_high_resolution else ())
+        # img is None for reduced-resolution JPEG decodes (8 bit): the high-resolution copy is then the original file
+        self.original_bit_depth = 16 if img is not None and img.dtype == np.uint16 else 8
 
         # 处理EXIF方向信息
-        try:
-            with Image.open(image_path) as pil_img:
-                if hasattr(pil_img, '_getexif'):
-                    for orientation in ExifTags.TAGS.keys():
-                        if ExifTags.TAGS[orientation]=='Orientation':
-                            break
-                    exif=dict(pil_img._getexif().items())
-
-                    if orientation in exif:
-                        if exif[orientation] == 3:
-                            img_resized = cv2.rotate(img_resized, cv2.ROTATE_180)
-                            img = cv2.rotate(img, cv2.ROTATE_180)
-                        elif exif[orientation] == 6:
-                            img_resized = cv2.rotate(img_resized, cv2.ROTATE_90_COUNTERCLOCKWISE)
-                            img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-                        elif exif[orientation] == 8:
-                            img_resized = cv2.rotate(img_resized, cv2.ROTATE_90_CLOCKWISE)
-                            img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-        except (AttributeError, KeyError, IndexError):
-            pass
+        rotation = EXIF_ROTATIONS.get(orientation)
+        if rotation is not None:
+            img_resized = cv2.rotate(img_resized, rotation)
 
         resized_path = os.path.join(self.output_dir_path, f"0_{self.image_name}_resized.{self.extension_name}")
-        cv2.imwrite(resized_path, img_resized)
+        imwrite(resized_path, img_resized)
         self.image_paths.append(resized_path)
 
         hr_path = os.path.join(self.output_dir_path, f"0_{self.image_name}_hr.{self.original_extension}")
         self.hr_image_paths.append(hr_path)
         if self.save_high_resolution:
-            cv2.imwrite(hr_path, img)
+            if rotation is None:
+                # Same pixels as the original: copy the file, no decode / re-encode (JPEGs lose no quality)
+                with replacing_file(hr_path) as temp_path:
+                    shutil.copyfile(image_path, temp_path)
+            else:
+                imwrite(hr_path, cv2.rotate(img, rotation))
+            self.store_file(hr_path)
+        self.store_file(resized_path)
+        del img
 
-        histogram_path = os.path.join(self.output_dir_path, f"0_{self.image_name}_histogram.{self.extension_name}")
-        self.histogram_paths.append(histogram_path)
-        self.plot_histogram(self.image_paths[-1]).save(self.histogram_paths[-1])
+        if self.preview_is_lossless():
+            self.color_histograms.append(ColorHistogram.from_codes(img_resized if img_resized.ndim == 3 else cv2.cvtColor(img_resized, cv2.COLOR_GRAY2BGR)))
+        else:
+            self.color_histograms.append(ColorHistogram.from_image_file(resized_path))
+        self.save_histogram()
 
     def set_plan_status(self, status):
         self.plan_status = status
@@ -179,12 +254,12 @@ class ImageProcessingToolBoxes:
         This method is useful for retrieving the list of function names excluding the special functions.
         """
         function_names = list(self.get_function_mapping().keys())
-        function_names = [name for name in function_names if name not in ['func_to_return_responses', 'func_to_get_plan', 'undo_step', 'satisfactory']]
+        function_names = [name for name in function_names if name not in ['func_to_return_responses', 'func_to_get_plan', 'undo_step', 'redo_step', 'checkout_state', 'show_edit_tree', 'satisfactory']]
         return function_names.__str__()
 
     def get_function_short_description(self):
         function_names = list(self.get_function_mapping().keys())
-        function_names = [name for name in function_names if name not in ['func_to_return_responses', 'func_to_get_plan', 'undo_step']]
+        function_names = [name for name in function_names if name not in ['func_to_return_responses', 'func_to_get_plan', 'undo_step', 'redo_step', 'checkout_state', 'show_edit_tree']]
 
         function_short_descriptions = []
 
@@ -277,13 +352,16 @@ class ImageProcessingToolBoxes:
         self.processing_plan = filtered_plan
 
     def similarity(self, a, b):
+        from Levenshtein import distance  # only needed to parse plans, keep it out of the import path
+
         max_len = max(len(a), len(b))
         return 1 - distance(a, b) / max_len
 
     def parse_lr_path_to_hr_path(self, lr_path):
         """ Convert low resolution path to high resolution path """
         base_name = os.path.splitext(os.path.basename(lr_path))[0]
-        hr_name = base_name + "_hr" + os.path.splitext(lr_path)[1]
+        hr_extension = ".npy" if self.save_numpy_as_hr else os.path.splitext(lr_path)[1]
+        hr_name = base_name + "_hr" + hr_extension
         hr_path = os.path.join(os.path.dirname(lr_path), hr_name)
         return hr_path
 
@@ -296,6 +374,80 @@ class ImageProcessingToolBoxes:
         if self.processing_plan:
             self.processing_plan = self.processing_plan[1:]
 
+    def get_active_operations(self):
+        """
+        Return the (function name, factor) steps that produce the current image.
+        Undone steps are removed, so this is the edit chain to replay on other renders.
+        """
+        return active_operations(self.function_calls)
+
+    def get_prefix_cache(self, high_resolution=False):
+        """
+        PrefixRenderCache over the original preview / high-resolution image, created on first use.
+        Steps are rounded like the session's image files (not between float32 .npy intermediates).
+        The source counts against prefix_cache_bytes: one that would take more than half of it is written to
+        a float32 .npy in the output directory and memory-mapped instead (removed by close()).
+        Buffers are cached in row bands of about 1/16 of the budget, so large frames keep part of their prefixes.
+        """
+        if high_resolution not in self.prefix_caches:
+            source_path = self.hr_image_paths[0] if high_resolution else self.image_paths[0]
+            img, bit_depth = read_image_float(source_path)
+            if img.nbytes > self.prefix_cache_bytes // 2:
+                spill_path = os.path.join(self.output_dir_path, f".{self.image_name}_prefix_source{'_hr' if high_resolution else ''}.npy")
+                with replacing_file(spill_path) as temp_path:
+                    np.save(temp_path, img)
+                img = np.load(spill_path, mmap_mode="r")
+            band_rows = max(1, (self.prefix_cache_bytes // 16) // (img.shape[1] * img.shape[2] * img.itemsize))
+            step_bit_depth = None if high_resolution and self.save_numpy_as_hr else bit_depth
+            self.prefix_caches[high_resolution] = (PrefixRenderCache(img, self.prefix_cache_bytes, band_rows, step_bit_depth), bit_depth)
+        return self.prefix_caches[high_resolution]
+
+    def render_operations(self, operations, output_path, high_resolution=False):
+        """
+        Render an edit chain [(function name, factor), ...] from the original image to output_path.
+        Prefixes rendered before are reused, so only the steps after the first change are recomputed.
+        """
+        prefix_cache, bit_depth = self.get_prefix_cache(high_resolution)
+        write_image_float(output_path, prefix_cache.render(operations), bit_depth)
+        return output_path
+
+    def render_with_factor(self, step_index, factor, output_path, high_resolution=False):
+        """
+        Re-render the current edit chain with the factor of one step changed ("tweak one slider").
+        step_index indexes get_active_operations(); steps before it are served from the prefix cache.
+        """
+        operations = self.get_active_operations()
+        operations[step_index] = (operations[step_index][0], factor)
+        return self.render_operations(operations, output_path, high_resolution)
+
+    def bake_color_lut(self, size=33):
+        """
+        Sample the current edit chain on a size^3 RGB grid (33 or 65).
+        Returns a float32 LUT of shape (size, size, size, 3).
+        """
+        operations = self.get_active_operations()
+        return bake_lut3d(lambda grid: render_chain(grid, operations), size)
+
+    def export_color_lut(self, cube_path=None, size=33):
+        """
+        Export the current edit chain as a .cube 3D LUT so any .cube reader can reuse the grade.
+        Returns the path of the .cube file.
+        """
+        if cube_path is None:
+            cube_path = os.path.join(self.output_dir_path, f"{self.image_name}_{size}.cube")
+        write_cube(cube_path, self.bake_color_lut(size), title=self.image_name)
+        self.log_processing_step(f"Export color LUT of {self.get_active_operations()} to: {cube_path}")
+        return cube_path
+
+    def render_with_color_lut(self, input_image_path, output_image_path, size=33):
+        """
+        Render an image (e.g. the full-resolution original) through the baked edit chain
+        with one trilinear lookup instead of replaying every step.
+        """
+        img, bit_depth_in = read_image_float(input_image_path)
+        write_image_float(output_image_path, apply_lut3d(img, self.bake_color_lut(size)), bit_depth_in)
+        return output_image_path
+
     @staticmethod
     def plot_histogram(img_path, bins=256, auxiliary_lines=True, line_positions=None):
         """
@@ -309,8 +461,8 @@ class ImageProcessingToolBoxes:
         1. Read image (cv2.IMREAD_UNCHANGED) to preserve original bit depth
         2. Check dtype: 8-bit -> [0,256], 16-bit -> [0,65536]
         3. Use cv2.calcHist for histogram calculation (with specified bins)
-        4. Plot using bar chart, no axis ticks, keep frame
-        5. Add auxiliary lines (axvline) as needed, can customize width, color etc.
+        4. Draw black bars with a thick frame, no axis ticks (Histogram.render_histogram, pure NumPy)
+        5. Add dashed gray auxiliary lines as needed
         """
         image = cv2.imread(img_path, cv2.IMREAD_UNCHANGED)
         if image is None:
@@ -330,60 +482,8 @@ class ImageProcessingToolBoxes:
         
         hist = cv2.calcHist([image], [0], None, [hist_bins], hist_range)
 
-        fig = plt.figure(figsize=(6, 6), facecolor='white')
-        ax = fig.add_subplot(111)
-
-        ax.bar(
-            x=range(hist_bins),
-            height=hist[:, 0],
-            color='black',
-            width=1
-        )
-
-        ax.set_xlim([0, hist_bins])
-        ax.set_ylim([0, hist.max() * 1.05])
-
-
-        ax.spines['top'].set_visible(True)
-        ax.spines['right'].set_visible(True)
-        ax.spines['bottom'].set_visible(True)
-        ax.spines['left'].set_visible(True)
-
-        # 设置外框颜色和线宽
-        for spine in ax.spines.values():
-            spine.set_color('black')
-            spine.set_linewidth(2)  # 让外框线更粗
-
-        ax.set_xticks([])
-        ax.set_yticks([])
-
-        # 7. 如果需要辅助线，就添加
-        if auxiliary_lines:
-            # 如果用户没指定 line_positions，就默认在 1/4、1/2、3/4 处
-            if not line_positions:
-                line_positions = [
-                    hist_bins // 4, 
-                    hist_bins // 2, 
-                    hist_bins * 3 // 4
-                ]
-            for x_val in line_positions:
-                ax.axvline(
-                    x=x_val, 
-                    color='gray', 
-                    linestyle='--', 
-                    linewidth=2  # 线条也加粗
-                )
-
-        # 8. 转换为 PIL.Image 并返回
-        buf = BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight')
-        buf.seek(0)
-        pil_image = Image.open(buf).copy()
-
-        plt.close(fig)
-        buf.close()
-
-        return pil_image
+        # 4-5. 直接栅格化为 uint8 数组 (黑色柱状图 + 外框 + 灰色虚线辅助线), 转换为 PIL.Image 返回
+        return Image.fromarray(render_histogram(hist, auxiliary_lines, line_positions))
 
     @tool_doc([
         {
@@ -445,26 +545,396 @@ class ImageProcessingToolBoxes:
             }
         }
     ])
+    @profiled_step
     def undo_step(self, reason):
         if len(self.image_paths) < 2:
             raise ValueError("Cannot undo operation because there are not enough image paths.")
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_undo.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
 
         last_function_call = self.function_calls[-1]
-        self.log_processing_step(f"Undo adjusting of `{last_function_call[0]}` of {self.image_paths[-2]}, reason: {reason}, save to: {self.image_paths[-1]}")
-        self.processing_log.append(f"Undo the last operation `{last_function_call[0]}` with parameter `{last_function_call[1]}`, generate image-{len(self.image_paths)}, reason: {reason}.")
+        self.log_processing_step(f"Undo adjusting of `{last_function_call[0]}` of {self.image_paths[-1]}, reason: {reason}, save to: {os.path.join(self.output_dir_path, new_output_path)}")
+        self.processing_log.append(f"Undo the last operation `{last_function_call[0]}` with parameter `{last_function_call[1]}`, generate image-{len(self.image_paths) + 1}, reason: {reason}.")
         self.function_calls.append(["undo_step", reason])
         self.history_messages.append({"role": "assistant", "content": f"Undo the last operation `{last_function_call[0]}` with parameter `{last_function_call[1]}`, reason: {reason}."})
         print(self.processing_log[-1])
 
-        with Image.open(self.image_paths[-3]) as img:
-            img.save(self.image_paths[-1])
-        
-        if self.save_high_resolution:
-            with Image.open(self.hr_image_paths[-3]) as img:
-                img.save(self.hr_image_paths[-1])   
+        self.redo_stack.append(len(self.image_paths) - 1)
+        self.restore_state(len(self.image_paths) - 2, new_output_path)
+
+    @tool_doc([
+        {
+            "name": "redo_step",
+            "description": (
+                "Redo the last operation reverted by undo_step, returning to the image state before that undo.\n"
+                "Only available right after one or more undo_step calls: any new adjustment discards the undone states.\n"
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "reason": {
+                        "type": "string",
+                        "description": """
+                            Describe the main reasons for choosing this operation in no more than three sentences.
+                        """,
+                    },
+                },
+                "required": ["reason"]
+            }
+        }
+    ])
+    @profiled_step
+    def redo_step(self, reason):
+        if not self.redo_stack:
+            raise ValueError("Cannot redo operation because no operation has been undone.")
+        state_index = self.redo_stack.pop()
+        new_output_path = f"{len(self.image_paths)}_{self.image_name}_redo.{self.extension_name}"
+
+        self.log_processing_step(f"Redo image-{state_index + 1} ({self.image_paths[state_index]}), reason: {reason}, save to: {os.path.join(self.output_dir_path, new_output_path)}")
+        self.processing_log.append(f"Redo the undone image-{state_index + 1}, generate image-{len(self.image_paths) + 1}, reason: {reason}.")
+        self.function_calls.append(["redo_step", reason])
+        self.history_messages.append({"role": "assistant", "content": f"Redo the undone image-{state_index + 1}, reason: {reason}."})
+        print(self.processing_log[-1])
+
+        self.restore_state(state_index, new_output_path)
+
+    @tool_doc([
+        {
+            "name": "checkout_state",
+            "description": (
+                "Continue editing from any earlier image state, e.g. to try an alternative to a later adjustment.\n"
+                "The chosen image-N becomes the current image again (nothing is re-rendered) and the next adjustment starts a new branch "
+                "from it, so alternatives such as 'contrast +30 vs. +60 after the same exposure' share the exposure result.\n"
+                "Use show_edit_tree to see the available states and branches.\n"
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "image_number": {
+                        "type": "integer",
+                        "description": "The N of the image-N state to continue from (image-1 is the original image).",
+                    },
+                    "reason": {
+                        "type": "string",
+                        "description": """
+                            Describe the main reasons for choosing this operation in no more than three sentences.
+                        """,
+                    },
+                },
+                "required": ["image_number", "reason"]
+            }
+        }
+    ])
+    @profiled_step
+    def checkout_state(self, image_number, reason):
+        image_number = int(image_number)
+        if not 1 <= image_number <= len(self.image_paths):
+            raise ValueError(f"Cannot checkout image-{image_number}: there are image-1 to image-{len(self.image_paths)}.")
+        new_output_path = f"{len(self.image_paths)}_{self.image_name}_checkout_{image_number}.{self.extension_name}"
+
+        self.log_processing_step(f"Checkout image-{image_number} ({self.image_paths[image_number - 1]}), reason: {reason}, save to: {os.path.join(self.output_dir_path, new_output_path)}")
+        self.processing_log.append(f"Checkout image-{image_number}, generate image-{len(self.image_paths) + 1}, reason: {reason}.")
+        self.function_calls.append(["checkout_state", image_number, reason])
+        self.history_messages.append({"role": "assistant", "content": f"Checkout image-{image_number} to continue editing from it, reason: {reason}."})
+        print(self.processing_log[-1])
+
+        self.redo_stack.clear()  # redo only follows undo_step on the same branch
+        self.restore_state(image_number - 1, new_output_path)
+
+    @tool_doc([
+        {
+            "name": "show_edit_tree",
+            "description": (
+                "Show the tree of image states: every adjustment with its factor, the state it was applied to, "
+                "the branches created with checkout_state and which state is current.\n"
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {},
+            }
+        }
+    ])
+    def show_edit_tree(self):
+        tree = self.describe_edit_tree()
+        self.history_messages.append({"role": "assistant", "content": f"The edit tree is:\n{tree}"})
+        print(tree)
+        return tree
+
+    def describe_edit_tree(self):
+        """
+        Text view of the edit tree, one state per line, children indented under their parent:
+            image-1: original
+              image-2: exposure 0.5
+                image-3: adjust_contrast 30
+                image-5: adjust_contrast 60 (also image-6) <= current
+        """
+        children = {}
+        for node, (parent, _, _) in self.edit_tree.items():
+            children.setdefault(parent, []).append(node)
+        aliases = {}
+        for index, node in enumerate(self.state_nodes):
+            if index != node:
+                aliases.setdefault(node, []).append(f"image-{index + 1}")
+
+        lines = []
+
+        def visit(node, depth):
+            _, name, factor = self.edit_tree[node]
+            line = f"{'  ' * depth}image-{node + 1}: {'original' if name is None else f'{name} {factor}'}"
+            if node in aliases:
+                line += f" (also {', '.join(aliases[node])})"
+            if node == self.state_nodes[-1]:
+                line += " <= current"
+            lines.append(line)
+            for child in children.get(node, []):
+                visit(child, depth + 1)
+
+        visit(0, 0)
+        return "\n".join(lines)
+
+    def restore_state(self, state_index, new_output_path):
+        """
+        Append a new state (keeping the image_paths numbering) equal to state state_index, without re-encoding:
+        the preview, its histogram and the high-resolution image become new names of the existing files
+        (link_state_file: hard links, or blob symlinks), so undo / redo cost a few file system calls whatever the image size.
+        Files deleted by the retention policy are rendered again from the original (render_operations).
+        """
+        source_hr_path = self.hr_image_paths[state_index]
+        # Same extension as the source state (e.g. the original .tif for state 0), so it can be linked as is
+        hr_name = os.path.splitext(new_output_path)[0] + "_hr" + os.path.splitext(source_hr_path)[1]
+        self.append_state_paths(new_output_path, hr_name)
+        self.color_histograms.append(self.color_histograms[state_index])
+        self.state_nodes.append(self.state_nodes[state_index])
+
+        with self.retention_lock():
+            with self.profiler.step("preview", state=len(self.image_paths) - 1, operation="restore_state"):
+                if os.path.lexists(self.image_paths[state_index]):
+                    self.link_state_file(self.image_paths[state_index], self.image_paths[-1])
+                else:
+                    self.render_operations(self.operations_of_state(state_index), self.image_paths[-1])
+                    self.store_file(self.image_paths[-1])
+            if os.path.lexists(self.histogram_paths[state_index]):
+                histogram_path = os.path.join(self.output_dir_path, f"{len(self.image_paths) - 1}_{self.image_name}_histogram.{self.extension_name}")
+                self.link_state_file(self.histogram_paths[state_index], histogram_path)
+                self.histogram_paths.append(histogram_path)  # retention_lock is held
+            else:
+                self.save_histogram()
+
+            if self.save_high_resolution and not self.lazy_high_resolution:
+                pending = self.hr_futures.get(state_index)
+                if os.path.lexists(source_hr_path) or (pending is not None and not pending.done()):
+                    self.submit_high_resolution(depends_on=state_index, task=self.link_state_file, args=(source_hr_path, self.hr_image_paths[-1]))
+                else:
+                    self.submit_high_resolution(depends_on=0, task=self.render_operations,
+                                                args=(self.operations_of_state(state_index), self.hr_image_paths[-1], True))
+        self.apply_retention()
+
+    def operations_of_state(self, state_index):
+        """ The (function name, factor) steps from the original to state state_index, following the edit tree """
+        operations = []
+        node = self.state_nodes[state_index]
+        while self.edit_tree[node][0] is not None:
+            parent, name, factor = self.edit_tree[node]
+            operations.append((name, factor))
+            node = parent
+        return operations[::-1]
+
+    def append_state_paths(self, new_output_path, hr_name=None):
+        """
+        Add the preview / high-resolution paths of a new state (hr_name defaults to parse_lr_path_to_hr_path),
+        under retention_lock so retention_states never sees one list longer than the other.
+        """
+        with self.retention_lock():
+            self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
+            self.hr_image_paths.append(os.path.join(self.output_dir_path, hr_name or self.parse_lr_path_to_hr_path(new_output_path)))
+
+    def full_resolution_paths(self):
+        """ Called under retention_lock by SessionRetention.retention_states """
+        return list(self.hr_image_paths)
+
+    def pinned_states(self, state_count):
+        """ The undo target, the redo targets and the states pending high-resolution renders read or write (under retention_lock) """
+        pinned = super().pinned_states(state_count) | set(self.redo_stack)
+        for index, future in list(self.hr_futures.items()):
+            if not future.done():
+                pinned.update((index, self.hr_dependencies[index]))
+        return pinned
+
+    def forget_file(self, path):
+        """ A file deleted by the retention policy: drop it from the blob store manifest """
+        if self.store_session is not None:
+            self.store_session.forget(path)
+
+    def link_state_file(self, source_path, target_path):
+        """ target_path becomes another name of the immutable file source_path (a blob symlink or a hard link) """
+        if self.store_session is None:
+            link_image(source_path, target_path)
+        else:
+            self.store_session.alias(source_path, target_path)
+
+    def store_file(self, path):
+        """ Hand a finished session file over to the blob store, if there is one """
+        if self.store_session is not None:
+            self.store_session.ingest(path)
+
+    def render_preview(self, operation, factor):
+        """
+        Render the last step on the preview (image_paths[-2] => image_paths[-1]) and derive its histogram.
+        The ops are pointwise, so the histogram is pushed through the op's array function; other operations
+        and lossy preview formats (the written codes are not the rendered ones) fall back to recounting the written preview.
+        """
+        self.redo_stack.clear()  # a new adjustment discards the undone states
+        node = len(self.image_paths) - 1
+        self.edit_tree[node] = (self.state_nodes[-1], self.function_calls[-1][0], factor)
+        self.state_nodes.append(node)
+        with self.profiler.step("preview", state=len(self.image_paths) - 1, operation=operation.__name__, factor=factor):
+            self.render_state(operation, self.image_paths[-2], self.image_paths[-1], factor, self.operations_of_state(len(self.image_paths) - 1))
+            self.store_file(self.image_paths[-1])
+        array_operation = OPERATIONS.get(operation.__name__)
+        if array_operation is None or not self.preview_is_lossless():
+            self.color_histograms.append(ColorHistogram.from_image_file(self.image_paths[-1]))
+        else:
+            self.color_histograms.append(self.color_histograms[-1].apply(array_operation, factor))
+        self.save_histogram()
+        self.apply_retention()
+
+    def preview_is_lossless(self):
+        """ Whether the previews are written without loss, i.e. their histogram can be derived instead of recounted """
+        return f".{self.extension_name.lower()}" in LOSSLESS_EXTENSIONS
+
+    def save_histogram(self):
+        """ Draw the histogram of the current preview state to <index>_<image_name>_histogram.<extension_name> """
+        histogram_path = os.path.join(self.output_dir_path, f"{len(self.image_paths) - 1}_{self.image_name}_histogram.{self.extension_name}")
+        with self.profiler.step("histogram", state=len(self.image_paths) - 1):
+            with replacing_file(histogram_path) as temp_path:
+                Image.fromarray(render_histogram(self.color_histograms[-1].luminance_histogram())).save(temp_path)
+            self.store_file(histogram_path)
+        with self.retention_lock():
+            self.histogram_paths.append(histogram_path)
+
+    def render_high_resolution(self, operation, factor):
+        """
+        Render the last step on the high-resolution image (hr_image_paths[-2] => hr_image_paths[-1]).
+        Skipped in lazy mode: export() replays the surviving steps once instead.
+        """
+        if not self.save_high_resolution or self.lazy_high_resolution:
+            return
+        self.submit_high_resolution(depends_on=len(self.hr_image_paths) - 2, task=self.render_state,
+                                    args=(operation, self.hr_image_paths[-2], self.hr_image_paths[-1], factor,
+                                          self.operations_of_state(len(self.hr_image_paths) - 1), True),
+                                    kwargs={"tile_size": self.tile_size, "num_workers": self.num_workers})
+
+    def render_state(self, operation, input_image_path, output_image_path, factor, operations, high_resolution=False, **kwargs):
+        """
+        Render a new state from its parent state's file (input_image_path); operations is the new state's edit chain.
+        When the prefix cache holds the parent's buffers, only the last step runs, in memory without decoding
+        input_image_path, and its output stays cached: a checkout_state + new adjustment ("tweak one slider")
+        re-renders only the steps after the change. Otherwise, and for lossy formats (re-encoded at every step,
+        which the prefix chain does not reproduce, or with prefix_cache_bytes=0), the operation runs on the file.
+        Either way the render cache is consulted first (keyed on the parent file, as in run_operation) and fed after.
+        """
+        extension = os.path.splitext(output_image_path)[1].lower()
+        if self.prefix_cache_bytes > 0 and (extension in LOSSLESS_EXTENSIONS or is_npy(output_image_path)) and operations[-1][0] in OPERATIONS:
+            prefix_cache, bit_depth = self.get_prefix_cache(high_resolution)
+            if prefix_cache.cached_length(operations[:-1]) == len(operations) - 1:
+                entry_path = None
+                if self.render_cache is not None:
+                    entry_path = self.render_cache.entry_path(operation.__name__, input_image_path, output_image_path, factor, kwargs.get("tile_size"))
+                    if self.render_cache.fetch(entry_path, output_image_path):
+                        return
+                write_image_float(output_image_path, prefix_cache.render(operations), bit_depth, kwargs.get("tile_size"))
+                if entry_path is not None:
+                    self.render_cache.store(entry_path, output_image_path)
+                return
+        self.run_operation(operation, input_image_path, output_image_path, factor, **kwargs)
+
+    def run_operation(self, operation, input_image_path, output_image_path, factor, **kwargs):
+        """ Call an ImageProcessing operation, through the render cache when there is one """
+        if self.render_cache is None:
+            operation(input_image_path, output_image_path, factor, **kwargs)
+        else:
+            self.render_cache.render(operation, input_image_path, output_image_path, factor, **kwargs)
+
+    def submit_high_resolution(self, depends_on, task, args, kwargs=None):
+        """
+        Produce hr_image_paths[-1] with task(*args, **kwargs), which reads hr_image_paths[depends_on].
+        Runs inline, or on the background worker when background_high_resolution is set.
+        A failed render is re-raised by the steps built on it and by wait_high_resolution().
+        """
+        kwargs = kwargs or {}
+        state = len(self.hr_image_paths) - 1
+
+        def profiled_task():
+            with self.profiler.step("high_resolution", state=state, operation=getattr(args[0], "__name__", task.__name__)):
+                task(*args, **kwargs)
+                self.store_file(self.hr_image_paths[state])
+
+        if self.hr_executor is None:
+            profiled_task()
+            return
+        dependency = self.hr_futures.get(depends_on)
+
+        def run():
+            if dependency is not None:
+                dependency.result()
+            profiled_task()
+
+        with self.retention_lock():
+            self.hr_dependencies[state] = depends_on
+            self.hr_futures[state] = self.hr_executor.submit(run)
+
+    def wait_high_resolution(self, index=-1):
+        """
+        Block until hr_image_paths[index] has been rendered (only this step and the ones it builds on).
+        Returns its path.
+        """
+        index = index % len(self.hr_image_paths)
+        future = self.hr_futures.get(index)
+        if future is not None:
+            future.result()
+        return self.hr_image_paths[index]
+
+    def close(self):
+        """Finish the queued high-resolution renders, stop the background worker, the retention thread and the step profiler, drop the prefix caches."""
+        if self.hr_executor is not None:
+            self.hr_executor.shutdown(wait=True)
+            self.hr_executor = None
+        if self.janitor is not None:
+            self.janitor.close()
+            self.janitor = None
+        if self.store_session is not None:
+            self.store_session.release_unreferenced()  # what is still too recent is left to BlobStore gc
+        for prefix_cache, _ in self.prefix_caches.values():
+            if isinstance(prefix_cache.source, np.memmap):
+                os.remove(prefix_cache.source.filename)
+        self.prefix_caches.clear()
+        self.profiler.close()
+
+    def export(self, output_path=None):
+        """
+        Write the final high-resolution image as a regular image file, at the bit depth of the original.
+        Defaults to <output_dir>/<image_name>_final.<extension_name>.
+        - Eager mode: convert the current high-resolution state (e.g. a float32 .npy intermediate).
+        - Lazy mode: replay the steps that survived undo_step on the original, in a single pass.
+          Each step is rounded to the original bit depth where the eager chain writes an image file
+          (not between float32 .npy intermediates) and L-channel runs are not fused, so both modes export
+          the same image (with a lossless extension_name; a JPEG chain also loses quality at every eager step).
+        """
+        if not self.save_high_resolution:
+            raise ValueError("High-resolution images are not saved (save_high_resolution=False).")
+        if output_path is None:
+            output_path = os.path.join(self.output_dir_path, f"{self.image_name}_final.{self.extension_name}")
+
+        with self.profiler.step("export", state=len(self.image_paths) - 1):
+            if self.lazy_high_resolution:
+                operations = self.get_active_operations()
+                render_chain_file(self.hr_image_paths[0], output_path, operations, tile_size=self.tile_size, num_workers=self.num_workers,
+                                  fuse_lightness=False, step_bit_depth=None if self.save_numpy_as_hr else self.original_bit_depth)
+                self.log_processing_step(f"Export high-resolution image by replaying {operations} on {self.hr_image_paths[0]} to {output_path}")
+            else:
+                img, _ = read_image_float(self.wait_high_resolution(-1), self.tile_size)
+                write_image_float(output_path, img, self.original_bit_depth, self.tile_size)
+                self.log_processing_step(f"Export high-resolution image {self.hr_image_paths[-1]} to {output_path}")
+        return output_path
 
     @tool_doc([
         {
@@ -509,13 +979,13 @@ class ImageProcessingToolBoxes:
             }
         },
     ])
+    @profiled_step
     def adjust_saturation(self, saturation_factor, reason):
         (
             "- Adjust Saturation: Which parts of the image benefit from changes in saturation? Increasing saturation can make colors more vivid and bold, enhancing emotional impact, while desaturating can give a more muted, artistic feel, focusing attention on texture and composition rather than color.\n"
         )
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_saturation_{saturation_factor}.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
+        self.append_state_paths(new_output_path)
 
         self.log_processing_step(f"Adjusting saturation of {self.image_paths[-2]} to {saturation_factor}, reason: {reason}, save to: {self.image_paths[-1]}")
         self.processing_log.append(f"Adjusting saturation of image-{len(self.image_paths)-1} to {saturation_factor}, generate image-{len(self.image_paths)}, reason: {reason}.")
@@ -523,10 +993,9 @@ class ImageProcessingToolBoxes:
         self.history_messages.append({"role": "assistant", "content": f"Adjusting saturation of image-{len(self.image_paths)-1} to {saturation_factor}, reason: {reason}."})
         print(self.processing_log[-1])
 
-        saturation(self.image_paths[-2], self.image_paths[-1], saturation_factor)
+        self.render_preview(saturation, saturation_factor)
 
-        if self.save_high_resolution:
-            saturation(self.hr_image_paths[-2], self.hr_image_paths[-1], saturation_factor)
+        self.render_high_resolution(saturation, saturation_factor)
 
     @tool_doc([
         {
@@ -568,13 +1037,13 @@ class ImageProcessingToolBoxes:
             }
         }
     ])
+    @profiled_step
     def adjust_shadows(self, shadow_factor, reason):
         (
             "- Adjust Shadows: How should the shadows be handled to influence the image's mood? Deepening shadows might add mystery or drama, while lifting shadows can soften the contrast and reveal more detail in darker areas, creating a gentler and more open feeling.\n"
         )
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_shadows_{shadow_factor}.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
+        self.append_state_paths(new_output_path)
 
         self.log_processing_step(f"Adjusting shadows of {self.image_paths[-2]} with factor {shadow_factor}, reason: {reason}, save to: {self.image_paths[-1]}")
         self.processing_log.append(f"Adjusting shadows of image-{len(self.image_paths)-1} with factor {shadow_factor}, generate image-{len(self.image_paths)}, reason: {reason}.")
@@ -582,10 +1051,9 @@ class ImageProcessingToolBoxes:
         self.history_messages.append({"role": "assistant", "content": f"Adjusting shadows of image-{len(self.image_paths)-1} with factor {shadow_factor}, reason: {reason}."})
         print(self.processing_log[-1])
 
-        shadows(self.image_paths[-2], self.image_paths[-1], shadow_factor)
+        self.render_preview(shadow, shadow_factor)
 
-        if self.save_high_resolution:
-            shadows(self.hr_image_paths[-2], self.hr_image_paths[-1], shadow_factor)
+        self.render_high_resolution(shadow, shadow_factor)
 
     @tool_doc([
         {
@@ -627,13 +1095,13 @@ class ImageProcessingToolBoxes:
             }
         },
     ])
+    @profiled_step
     def adjust_highlights(self, highlight_factor, reason):
         (
             "- Adjust Highlights: How will adjusting the highlights affect the brightest areas of the image? Increasing highlights can make these areas pop and appear more vibrant, while reducing highlights may prevent overexposure and recover lost details in bright areas, giving the image a more balanced look.\n"
         )
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_highlights_{highlight_factor}.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
+        self.append_state_paths(new_output_path)
 
         self.log_processing_step(f"Adjusting highlights of {self.image_paths[-2]} with factor {highlight_factor}, reason: {reason}, save to: {self.image_paths[-1]}")
         self.processing_log.append(f"Adjusting highlights of image-{len(self.image_paths)-1} with factor {highlight_factor}, generate image-{len(self.image_paths)}, reason: {reason}.")
@@ -641,10 +1109,9 @@ class ImageProcessingToolBoxes:
         self.history_messages.append({"role": "assistant", "content": f"Adjusting highlights of image-{len(self.image_paths)-1} with factor {highlight_factor}, generate image-{len(self.image_paths)}, reason: {reason}."})
         print(self.processing_log[-1])
 
-        highlights(self.image_paths[-2], self.image_paths[-1], highlight_factor)
+        self.render_preview(highlight, highlight_factor)
 
-        if self.save_high_resolution:
-            highlights(self.hr_image_paths[-2], self.hr_image_paths[-1], highlight_factor)
+        self.render_high_resolution(highlight, highlight_factor)
 
     @tool_doc([
         {
@@ -686,13 +1153,13 @@ class ImageProcessingToolBoxes:
             }
         },
     ])
+    @profiled_step
     def adjust_contrast(self, contrast_factor, reason):
         (
             "- Adjust Contrast: Should the contrast be modified to emphasize the difference between light and dark areas? For instance, increasing contrast can make the subject more striking and the details more pronounced, while lowering contrast may create a softer, more ethereal feel.\n"
         )
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_contrast_{contrast_factor}.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
+        self.append_state_paths(new_output_path)
 
         self.log_processing_step(f"Adjusting contrast of {self.image_paths[-2]} with factor {contrast_factor}, reason: {reason}, save to: {self.image_paths[-1]}")
         self.processing_log.append(f"Adjusting contrast of image-{len(self.image_paths)-1} with factor {contrast_factor}, generate image-{len(self.image_paths)}, reason: {reason}.")
@@ -700,10 +1167,9 @@ class ImageProcessingToolBoxes:
         self.history_messages.append({"role": "assistant", "content": f"Adjusting contrast of image-{len(self.image_paths)-1} with factor {contrast_factor}, generate image-{len(self.image_paths)}, reason: {reason}."})
         print(self.processing_log[-1])
 
-        contrast(self.image_paths[-2], self.image_paths[-1], contrast_factor)
+        self.render_preview(contrast, contrast_factor)
 
-        if self.save_high_resolution:
-            contrast(self.hr_image_paths[-2], self.hr_image_paths[-1], contrast_factor)
+        self.render_high_resolution(contrast, contrast_factor)
 
     @tool_doc([
         {
@@ -745,13 +1211,13 @@ class ImageProcessingToolBoxes:
             }
         },
     ])
+    @profiled_step
     def adjust_blacks(self, black_factor, reason):
         (
             "- Adjust Blacks: Should the black levels be deepened to add intensity to the image? For example, darkening the blacks can increase contrast and make the image more dramatic, while raising the black levels could reveal more detail in the shadowed areas, softening the overall mood.\n"
         )
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_blacks_{black_factor}.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
+        self.append_state_paths(new_output_path)
 
         self.log_processing_step(f"Adjusting blacks of {self.image_paths[-2]} with factor {black_factor}, reason: {reason}, save to: {self.image_paths[-1]}")
         self.processing_log.append(f"Adjusting blacks of image-{len(self.image_paths)-1} with factor {black_factor}, generate image-{len(self.image_paths)}, reason: {reason}.")
@@ -759,10 +1225,9 @@ class ImageProcessingToolBoxes:
         self.history_messages.append({"role": "assistant", "content": f"Adjusting blacks of image-{len(self.image_paths)-1} with factor {black_factor}, generate image-{len(self.image_paths)}, reason: {reason}."})
         print(self.processing_log[-1])
 
-        black(self.image_paths[-2], self.image_paths[-1], black_factor)
+        self.render_preview(black, black_factor)
 
-        if self.save_high_resolution:
-            black(self.hr_image_paths[-2], self.hr_image_paths[-1], black_factor)
+        self.render_high_resolution(black, black_factor)
 
     @tool_doc([
         {
@@ -805,13 +1270,13 @@ class ImageProcessingToolBoxes:
             }
         } 
     ])
+    @profiled_step
     def adjust_whites(self, white_factor, reason):
         (
             "- Adjust Whites: Will adjusting the white levels change the clarity of the brightest spots in the image? Increasing the whites can make the light areas more dazzling and eye-catching, while reducing the whites might tone down the overall brightness and create a more cohesive, understated look.\n"
         )
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_whites_{white_factor}.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
+        self.append_state_paths(new_output_path)
 
         self.log_processing_step(f"Adjusting whites of {self.image_paths[-2]} with factor {white_factor}, reason: {reason}, save to: {self.image_paths[-1]}")
         self.processing_log.append(f"Adjusting whites of image-{len(self.image_paths)-1} with factor {white_factor}, generate image-{len(self.image_paths)}, reason: {reason}.")
@@ -819,10 +1284,9 @@ class ImageProcessingToolBoxes:
         self.history_messages.append({"role": "assistant", "content": f"Adjusting whites of image-{len(self.image_paths)-1} with factor {white_factor}, generate image-{len(self.image_paths)}, reason: {reason}."})
         print(self.processing_log[-1])
 
-        white(self.image_paths[-2], self.image_paths[-1], white_factor)
+        self.render_preview(white, white_factor)
 
-        if self.save_high_resolution:
-            white(self.hr_image_paths[-2], self.hr_image_paths[-1], white_factor)
+        self.render_high_resolution(white, white_factor)
 
     @tool_doc([
         {
@@ -861,13 +1325,13 @@ class ImageProcessingToolBoxes:
             }
         }
     ])
+    @profiled_step
     def adjust_tone(self, tone_factor, reason):
         (
             "- Adjust Tone: How will tone adjustments affect the overall mood of the image? Increasing the tone towards red can make the image feel warmer and more vibrant, while shifting the tone towards green can create a cooler, more serene feel.\n"
         )
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_tone_{tone_factor}.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
+        self.append_state_paths(new_output_path)
 
         self.log_processing_step(f"Adjusting tone of {self.image_paths[-2]} with factor {tone_factor}, reason: {reason}, save to: {self.image_paths[-1]}")
         self.processing_log.append(f"Adjusting tone of image-{len(self.image_paths)-1} with factor {tone_factor}, generate image-{len(self.image_paths)}, reason: {reason}.")
@@ -875,10 +1339,9 @@ class ImageProcessingToolBoxes:
         self.history_messages.append({"role": "assistant", "content": f"Adjusting tone of image-{len(self.image_paths)-1} with factor {tone_factor}, generate image-{len(self.image_paths)}, reason: {reason}."})
         print(self.processing_log[-1])
 
-        tone(self.image_paths[-2], self.image_paths[-1], tone_factor)
+        self.render_preview(tone, tone_factor)
 
-        if self.save_high_resolution:
-            tone(self.hr_image_paths[-2], self.hr_image_paths[-1], tone_factor)
+        self.render_high_resolution(tone, tone_factor)
 
     @tool_doc([
         {
@@ -918,13 +1381,13 @@ class ImageProcessingToolBoxes:
             }
         }
     ])
+    @profiled_step
     def adjust_color_temperature(self, color_temperature_factor, reason):
         (
             "- Adjust Color Temperature: How will color temperature adjustments affect the overall mood of the image? Lowering the temperature can make the image feel cooler and more serene, while raising the temperature can make the image feel warmer and more vibrant.\n"
         )
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_temperature_{color_temperature_factor}.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
+        self.append_state_paths(new_output_path)
 
         self.log_processing_step(f"Adjusting color temperature of {self.image_paths[-2]} with factor {color_temperature_factor}, reason: {reason}, save to: {self.image_paths[-1]}")
         self.processing_log.append(f"Adjusting color temperature of image-{len(self.image_paths)-1} with factor {color_temperature_factor}, generate image-{len(self.image_paths)}, reason: {reason}.")
@@ -932,10 +1395,9 @@ class ImageProcessingToolBoxes:
         self.history_messages.append({"role": "assistant", "content": f"Adjusting color temperature of image-{len(self.image_paths)-1} with factor {color_temperature_factor}, generate image-{len(self.image_paths)}, reason: {reason}."})
         print(self.processing_log[-1])
 
-        color_temperature(self.image_paths[-2], self.image_paths[-1], color_temperature_factor)
+        self.render_preview(color_temperature, color_temperature_factor)
 
-        if self.save_high_resolution:
-            color_temperature(self.hr_image_paths[-2], self.hr_image_paths[-1], color_temperature_factor)
+        self.render_high_resolution(color_temperature, color_temperature_factor)
 
     @tool_doc([
         {
@@ -974,13 +1436,13 @@ class ImageProcessingToolBoxes:
             }
         }
     ])
+    @profiled_step
     def adjust_exposure(self, exposure_factor, reason):
         (
             "- Adjust Exposure: How will exposure adjustments affect the overall mood of the image? Increasing exposure might make the image feel more vibrant and energetic, while reducing exposure can add a sense of subtlety or calmness, enhancing any moody or low-light elements.\n"
         )
         new_output_path = f"{len(self.image_paths)}_{self.image_name}_exposure_{exposure_factor}.{self.extension_name}"
-        self.image_paths.append(os.path.join(self.output_dir_path, new_output_path))
-        self.hr_image_paths.append(os.path.join(self.output_dir_path, self.parse_lr_path_to_hr_path(new_output_path)))
+        self.append_state_paths(new_output_path)
 
         self.log_processing_step(f"Adjusting exposure of {self.image_paths[-2]} with factor {exposure_factor}, reason: {reason}, save to: {self.image_paths[-1]}")
         self.processing_log.append(f"Adjusting exposure of image-{len(self.image_paths)-1} with factor {exposure_factor}, generate image-{len(self.image_paths)}, reason: {reason}.")
@@ -988,8 +1450,7 @@ class ImageProcessingToolBoxes:
         self.history_messages.append({"role": "assistant", "content": f"Adjusting exposure of image-{len(self.image_paths)-1} with factor {exposure_factor}, generate image-{len(self.image_paths)}, reason: {reason}."})
         print(self.processing_log[-1])
 
-        exposure(self.image_paths[-2], self.image_paths[-1], exposure_factor)
+        self.render_preview(exposure, exposure_factor)
 
-        if self.save_high_resolution:
-            exposure(self.hr_image_paths[-2], self.hr_image_paths[-1], exposure_factor)
+        self.render_high_resolution(exposure, exposure_factor)
 
@@ -1,6 +1,24 @@
 import base64
 import os
 import json
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+    Used for GUI / plotting dependencies (pyautogui, pynput, ...) so headless
+    workers can import the toolboxes without a display or those packages.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
 
 
 def base64_encode_image(image_path):
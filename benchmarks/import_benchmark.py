@@ -0,0 +1,66 @@
+"""
+Benchmark: cold import time of the toolbox modules.
+
+    python benchmarks/import_benchmark.py --modules ImageProcessing Toolbox GUIToolbox
+
+Each module is imported in a fresh interpreter with `-X importtime`. Reports the
+total import time, the slowest top-level dependencies, and whether any GUI /
+plotting package (pyautogui, pynput, matplotlib, Levenshtein) was loaded.
+A headless worker's cold start should be dominated by numpy / cv2.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GUI_PACKAGES = ["pyautogui", "pynput", "matplotlib", "Levenshtein"]
+
+
+def import_profile(module: str):
+    """Return ({dependency: cumulative microseconds}, total microseconds, loaded GUI packages)."""
+    check = f"import sys, {module}; print(','.join(p for p in {GUI_PACKAGES!r} if p in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", check],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    per_package = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # nesting is shown by indentation
+        if depth == 0:  # imported by the interpreter / the -c statement
+            total += int(cumulative)
+        elif depth == 1:  # imported directly by one of those: numpy, cv2, PIL, our own modules, ...
+            per_package[name.strip().split(".")[0]] += int(cumulative)
+    loaded = [package for package in result.stdout.strip().split(",") if package]
+    return per_package, total, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["ImageProcessing", "Toolbox"])
+    parser.add_argument("--repeat", type=int, default=3, help="best of N fresh interpreters")
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            runs = [import_profile(module) for _ in range(args.repeat)]
+        except RuntimeError as error:
+            print(f"{module}: {error}")
+            continue
+        per_package, total, loaded = min(runs, key=lambda run: run[1])
+        print(f"{module}: {total / 1000:.0f} ms, GUI / plotting packages loaded: {', '.join(loaded) or 'none'}")
+        for package, microseconds in sorted(per_package.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {package:<20} {microseconds / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Benchmark harness for the ImageProcessing path operations.
+
+    python benchmarks/ops_benchmark.py                                  # everything
+    python benchmarks/ops_benchmark.py --megapixels 0.25 12 --kinds 8bit float
+    python benchmarks/ops_benchmark.py --baseline benchmarks/results/<old>.json
+
+Synthetic 8-bit PNG, 16-bit PNG and float32 .npy inputs are generated once per
+resolution in --work-dir. Every (input, op, backend) runs in a fresh process:
+
+- cold: first call (empty decoded-image cache, no tone LUTs built yet)
+- warm: best of --repeat further calls (input served by the decoded-image
+  cache when it fits its budget, LUTs cached)
+- peak RSS of that process (includes the interpreter and numpy / cv2)
+
+Backends are the process_image_file execution modes: full frame, row-band
+tiles, and the thread pool. Results are written as JSON to
+benchmarks/results/ (with the git commit and library versions); --baseline
+prints the warm-time ratio against an earlier result file.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+OPERATIONS = {
+    "exposure": 0.5,
+    "contrast": 30,
+    "shadow": 40,
+    "highlight": -40,
+    "black": -20,
+    "white": 20,
+    "saturation": 30,
+    "tone": 10,
+    "color_temperature": 8000,
+}
+
+# Backend name => (tile_size, num_workers) passed to the op
+BACKENDS = {
+    "full": (None, 1),
+    "tiled": ((1024, None), 1),
+    "threaded": (None, None),
+}
+
+KINDS = {"8bit": ".png", "16bit": ".png", "float": ".npy"}
+
+
+def input_path(work_dir: str, megapixels: float, kind: str) -> str:
+    return os.path.join(work_dir, f"input_{megapixels:g}mp_{kind}{KINDS[kind]}")
+
+
+def generate_inputs(work_dir: str, megapixel_list, kinds):
+    """Write the synthetic inputs that are not in work_dir yet."""
+    import numpy as np
+    from ImageIO import write_image_float
+    from synthetic import synthetic_image
+
+    os.makedirs(work_dir, exist_ok=True)
+    for megapixels in megapixel_list:
+        missing = [kind for kind in kinds if not os.path.exists(input_path(work_dir, megapixels, kind))]
+        if not missing:
+            continue
+        img = synthetic_image(megapixels)
+        for kind in missing:
+            path = input_path(work_dir, megapixels, kind)
+            print(f"generating {path}")
+            if kind == "float":
+                np.save(path, img)
+            else:
+                write_image_float(path, img, 8 if kind == "8bit" else 16, use_cache=False)
+        del img
+
+
+def run_worker(job: dict) -> dict:
+    """Runs inside the fresh process: one cold call, then the warm calls."""
+    import ImageProcessing
+
+    operation = getattr(ImageProcessing, job["op"])
+    tile_size, num_workers = BACKENDS[job["backend"]]
+    output = os.path.join(job["work_dir"], f"output_{os.getpid()}{os.path.splitext(job['input'])[1]}")
+
+    def timed_call():
+        wall, cpu = time.perf_counter(), time.process_time()
+        operation(job["input"], output, OPERATIONS[job["op"]], tile_size=tile_size, num_workers=num_workers)
+        return time.perf_counter() - wall, time.process_time() - cpu
+
+    cold_wall, cold_cpu = timed_call()
+    warm = [timed_call() for _ in range(job["repeat"])]
+    os.remove(output)
+    warm_wall, warm_cpu = min(warm)
+    return {
+        "cold_s": cold_wall,
+        "cold_cpu_s": cold_cpu,
+        "warm_s": warm_wall,
+        "warm_cpu_s": warm_cpu,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KB on Linux
+    }
+
+
+def run_job(job: dict) -> dict:
+    result_path = os.path.join(job["work_dir"], f"result_{os.getpid()}.json")
+    command = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(job), "--worker-output", result_path]
+    completed = subprocess.run(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+    with open(result_path) as result_file:
+        result = json.load(result_file)
+    os.remove(result_path)
+    return result
+
+
+def environment() -> dict:
+    import cv2
+    import numpy as np
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cv2_threads": cv2.getNumThreads(),
+    }
+
+
+def result_key(result: dict) -> tuple:
+    return result["megapixels"], result["kind"], result["op"], result["backend"]
+
+
+def print_comparison(results, baseline_path: str, threshold: float = 1.1):
+    with open(baseline_path) as baseline_file:
+        baseline = {result_key(result): result for result in json.load(baseline_file)["results"]}
+    print(f"\nwarm time vs {baseline_path} (> {threshold:.2f}x flagged):")
+    for result in results:
+        previous = baseline.get(result_key(result))
+        if previous is None or "warm_s" not in previous or "warm_s" not in result:
+            continue
+        ratio = result["warm_s"] / previous["warm_s"]
+        flag = "  <-- slower" if ratio > threshold else ""
+        print(f"{result['megapixels']:>6g} {result['kind']:>6} {result['op']:>18} {result['backend']:>9} {ratio:6.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[0.25, 12, 48, 100])
+    parser.add_argument("--kinds", nargs="+", choices=list(KINDS), default=list(KINDS))
+    parser.add_argument("--ops", nargs="+", choices=list(OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=["full"])
+    parser.add_argument("--repeat", type=int, default=2, help="warm calls per job (best is reported)")
+    parser.add_argument("--work-dir", default=os.path.join(ROOT, "cache", "benchmark"))
+    parser.add_argument("--output", help="JSON result path, default benchmarks/results/<date>_<commit>.json")
+    parser.add_argument("--baseline", help="earlier JSON result to compare against")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.worker_output, "w") as result_file:
+            json.dump(run_worker(json.loads(args.worker)), result_file)
+        return
+
+    generate_inputs(args.work_dir, args.megapixels, args.kinds)
+    env = environment()
+    results = []
+    print(f"{'MP':>6} {'kind':>6} {'op':>18} {'backend':>9} {'cold s':>8} {'warm s':>8} {'warm MP/s':>10} {'peak RSS MB':>12}")
+    for megapixels in args.megapixels:
+        for kind in args.kinds:
+            for op in args.ops:
+                for backend in args.backends:
+                    job = {"input": input_path(args.work_dir, megapixels, kind), "op": op, "backend": backend,
+                           "repeat": args.repeat, "work_dir": args.work_dir}
+                    result = {"megapixels": megapixels, "kind": kind, "op": op, "backend": backend, **run_job(job)}
+                    results.append(result)
+                    if "error" in result:
+                        print(f"{megapixels:6g} {kind:>6} {op:>18} {backend:>9}  error: {result['error']}")
+                        continue
+                    print(f"{megapixels:6g} {kind:>6} {op:>18} {backend:>9} {result['cold_s']:8.3f} {result['warm_s']:8.3f} "
+                          f"{megapixels / result['warm_s']:10.1f} {result['peak_rss_mb']:12.0f}")
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{env['date'][:10]}_{env['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump({"environment": env, "results": results}, output_file, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.baseline:
+        print_comparison(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark: fused saturation kernel vs. the previous HSL round trip.
+
+    python benchmarks/saturation_benchmark.py --megapixels 12 48
+
+Both kernels run over the same synthetic image in full-width row bands
+(TileProcessing.apply_tiled), so 48 MP fits in a few GB of RAM. Reports
+seconds, megapixels per second, the speedup and the largest difference
+between the two float outputs (must stay below 1/255).
+
+The float kernels agree; the 8/16-bit files do not: saturation() now rounds to the
+nearest code like every op, the original truncated (about 40% of 8-bit values +1).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ImageProcessing import saturation_array  # noqa: E402
+from TileProcessing import apply_tiled  # noqa: E402
+from synthetic import synthetic_image  # noqa: E402
+
+
+# Previous implementation (six sector masks + fancy-index assignments), kept as the reference
+
+def legacy_saturation_array(img: np.ndarray, saturation_factor: float) -> np.ndarray:
+    """
+    Adjust the saturation of a float32 [0,1] RGB image using the HSL color model.
+
+    Parameters:
+        img (np.ndarray): float32, [0,1], RGB.
+        saturation_factor (float): Saturation adjustment factor in the range [-100, 100].
+
+    Returns:
+        np.ndarray: The adjusted image, float32, [0,1], RGB.
+    """
+    # Ensure saturation_factor is within the valid range
+    saturation_factor = np.clip(saturation_factor, -100, 100)
+
+    # Map saturation_factor (-100 to 100) to a scaling factor (0.0 to 2.0)
+    scale_factor = 1 + saturation_factor / 100.0
+
+    # Step 1: Convert RGB to HSL
+    def rgb_to_hsl(image):
+        """Convert RGB image to HSL color space."""
+        r, g, b = image[..., 0], image[..., 1], image[..., 2]
+        max_val = np.max(image, axis=-1)
+        min_val = np.min(image, axis=-1)
+        l = (max_val + min_val) / 2
+
+        delta = max_val - min_val
+        s = np.zeros_like(l)
+        h = np.zeros_like(l)
+
+        # Saturation calculation
+        mask = delta > 0
+        s[mask & (l < 0.5)] = delta[mask & (l < 0.5)] / (max_val[mask & (l < 0.5)] + min_val[mask & (l < 0.5)])
+        s[mask & (l >= 0.5)] = delta[mask & (l >= 0.5)] / (2 - max_val[mask & (l >= 0.5)] - min_val[mask & (l >= 0.5)])
+
+        # Hue calculation
+        mask_r = (max_val == r) & mask
+        mask_g = (max_val == g) & mask
+        mask_b = (max_val == b) & mask
+
+        h[mask_r] = ((g[mask_r] - b[mask_r]) / delta[mask_r]) % 6
+        h[mask_g] = ((b[mask_g] - r[mask_g]) / delta[mask_g]) + 2
+        h[mask_b] = ((r[mask_b] - g[mask_b]) / delta[mask_b]) + 4
+
+        h /= 6
+        h[h < 0] += 1  # Ensure hue is in [0, 1]
+
+        return h, s, l
+
+    # Step 2: Adjust the saturation
+    def adjust_hsl_saturation(h, s, l, scale_factor):
+        """Adjust the saturation in HSL space."""
+        s = np.clip(s * scale_factor, 0, 1)  # Scale the saturation by the factor
+        return h, s, l
+
+    # Step 3: Convert HSL back to RGB
+    def hsl_to_rgb(h, s, l):
+        """Convert HSL image back to RGB color space."""
+        c = (1 - np.abs(2 * l - 1)) * s
+        x = c * (1 - np.abs((h * 6) % 2 - 1))
+        m = l - c / 2
+
+        rgb = np.zeros((h.shape[0], h.shape[1], 3), dtype=np.float32)
+        h6 = h * 6
+
+        idx = (h6 < 1)
+        rgb[idx] = np.stack([c[idx], x[idx], np.zeros_like(c[idx])], axis=-1)
+
+        idx = (1 <= h6) & (h6 < 2)
+        rgb[idx] = np.stack([x[idx], c[idx], np.zeros_like(c[idx])], axis=-1)
+
+        idx = (2 <= h6) & (h6 < 3)
+        rgb[idx] = np.stack([np.zeros_like(c[idx]), c[idx], x[idx]], axis=-1)
+
+        idx = (3 <= h6) & (h6 < 4)
+        rgb[idx] = np.stack([np.zeros_like(c[idx]), x[idx], c[idx]], axis=-1)
+
+        idx = (4 <= h6) & (h6 < 5)
+        rgb[idx] = np.stack([x[idx], np.zeros_like(c[idx]), c[idx]], axis=-1)
+
+        idx = (5 <= h6) & (h6 < 6)
+        rgb[idx] = np.stack([c[idx], np.zeros_like(c[idx]), x[idx]], axis=-1)
+
+        return np.clip(rgb + m[..., None], 0, 1)
+
+    # Convert RGB to HSL
+    h, s, l = rgb_to_hsl(img)
+
+    # Adjust the saturation
+    h, s, l = adjust_hsl_saturation(h, s, l, scale_factor)
+
+    # Convert HSL back to RGB
+    return hsl_to_rgb(h, s, l).astype(np.float32)
+
+
+def time_kernel(kernel, img: np.ndarray, factor: float, band_rows: int, repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = apply_tiled(kernel, img, factor, (band_rows, None))
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[12, 48])
+    parser.add_argument("--factors", type=float, nargs="+", default=[-50, 30, 100])
+    parser.add_argument("--band-rows", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'MP':>6} {'factor':>7} {'legacy s':>9} {'fused s':>8} {'legacy MP/s':>12} {'fused MP/s':>11} {'speedup':>8} {'max diff':>9}")
+    for megapixels in args.megapixels:
+        img = synthetic_image(megapixels)
+        actual_mp = img.shape[0] * img.shape[1] / 1e6
+        for factor in args.factors:
+            legacy_time, legacy_out = time_kernel(legacy_saturation_array, img, factor, args.band_rows, args.repeat)
+            fused_time, fused_out = time_kernel(saturation_array, img, factor, args.band_rows, args.repeat)
+            max_diff = float(np.abs(legacy_out - fused_out).max()) * 255
+            print(f"{actual_mp:6.1f} {factor:7.0f} {legacy_time:9.2f} {fused_time:8.2f} "
+                  f"{actual_mp / legacy_time:12.1f} {actual_mp / fused_time:11.1f} "
+                  f"{legacy_time / fused_time:7.1f}x {max_diff:8.4f}/255")
+            del legacy_out, fused_out
+
+
+if __name__ == "__main__":
+    main()
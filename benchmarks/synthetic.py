@@ -0,0 +1,15 @@
+import numpy as np
+
+
+def synthetic_image(megapixels: float, seed: int = 0) -> np.ndarray:
+    """float32 [0,1] RGB test image, 3:2 aspect ratio, smooth gradients plus noise."""
+    height = int(round(np.sqrt(megapixels * 1e6 / 1.5)))
+    width = int(round(height * 1.5))
+    rng = np.random.default_rng(seed)
+    img = np.empty((height, width, 3), dtype=np.float32)
+    ramp = np.linspace(0.0, 1.0, width, dtype=np.float32)
+    for channel in range(3):
+        img[..., channel] = np.roll(ramp, channel * width // 3)
+    img += rng.normal(0.0, 0.05, size=(1, width, 3)).astype(np.float32)
+    img *= np.linspace(0.3, 1.0, height, dtype=np.float32)[:, None, None]
+    return np.clip(img, 0.0, 1.0, out=img)
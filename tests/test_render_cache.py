@@ -0,0 +1,53 @@
+"""
+The toolbox renders through a shared RenderCache: a second session with the same edits is served from it.
+
+    python -m pytest tests/test_render_cache.py
+"""
+import glob
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ImageIO import DECODED_IMAGE_CACHE  # noqa: E402
+from RenderCache import RenderCache  # noqa: E402
+from Toolbox import ImageProcessingToolBoxes  # noqa: E402
+
+TEST_IMAGE = sorted(glob.glob(os.path.join(ROOT, "cache", "test", "*.jpg")))[0]
+
+
+def run_session(output_dir, render_cache):
+    toolbox = ImageProcessingToolBoxes(TEST_IMAGE, str(output_dir), render_cache=render_cache)
+    toolbox.adjust_exposure(0.4, "test")
+    toolbox.adjust_contrast(30, "test")
+    toolbox.adjust_shadows(-40, "test")
+    toolbox.close()
+    return toolbox
+
+
+def test_second_session_hits_render_cache(tmp_path):
+    render_cache = RenderCache(str(tmp_path / "render"))
+    run_session(tmp_path / "session_1", render_cache)
+    assert render_cache.stats()["hits"] == 0
+    assert render_cache.stats()["misses"] > 0
+
+    DECODED_IMAGE_CACHE.clear()
+    run_session(tmp_path / "session_2", render_cache)
+    assert render_cache.stats()["hits"] > 0
+
+
+def test_second_session_steps_are_hits_with_identical_bytes(tmp_path):
+    render_cache = RenderCache(str(tmp_path / "render"))
+    first = run_session(tmp_path / "session_1", render_cache)
+    misses = render_cache.stats()["misses"]
+
+    DECODED_IMAGE_CACHE.clear()
+    second = run_session(tmp_path / "session_2", render_cache)
+    # Every preview and high-resolution step of the second session is served from the cache
+    assert render_cache.stats()["misses"] == misses
+    assert render_cache.stats()["hits"] == 2 * 3
+
+    for first_path, second_path in zip(first.image_paths + first.hr_image_paths, second.image_paths + second.hr_image_paths):
+        with open(first_path, "rb") as first_file, open(second_path, "rb") as second_file:
+            assert first_file.read() == second_file.read(), second_path
@@ -0,0 +1,88 @@
+"""
+shadow() against the per-pixel np.nditer loop it replaced, on the cache/test images.
+
+    python -m pytest tests/test_shadow_parity.py
+"""
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ImageIO import DECODED_IMAGE_CACHE  # noqa: E402
+from ImageProcessing import shadow  # noqa: E402
+
+TEST_IMAGES = sorted(glob.glob(os.path.join(ROOT, "cache", "test", "*.jpg")))
+FACTORS = [-100, -35, 60]
+
+
+def legacy_shadows_tone_mapping(L_channel: np.ndarray, factor: float) -> np.ndarray:
+    """ The original loop of shadow(), kept verbatim as the reference """
+    shadow_threshold = 0.4
+    shadow_compress = 0.5
+
+    if abs(factor) < 1e-8:
+        return L_channel
+
+    L_out = np.copy(L_channel)
+    sign = np.sign(factor)
+    strength = abs(factor)
+
+    it = np.nditer(L_channel, flags=['multi_index'])
+    while not it.finished:
+        idx = it.multi_index
+        x = L_channel[idx]
+
+        if x < shadow_threshold:
+            t = x / shadow_threshold
+            base = strength * (1.0 - t * t)
+            if shadow_compress > 0.0:
+                c = 1.0 - shadow_compress * (1.0 - t)
+                base *= c
+            if sign > 0:
+                y = x * (1.0 - base)
+            else:
+                y = x * (1.0 + base)
+            L_out[idx] = y
+        else:
+            L_out[idx] = x
+
+        it.iternext()
+
+    return L_out
+
+
+def legacy_shadow(input_image_path: str, output_image_path: str, shadows_factor: float):
+    """ The original shadow() for 8-bit inputs: decode, Lab, loop over L, encode """
+    intensity = np.clip(shadows_factor / 100.0, -1.0, 1.0)
+    img_bgr = cv2.imread(input_image_path, cv2.IMREAD_UNCHANGED)
+    img = cv2.cvtColor(img_bgr.astype(np.float32) / 255.0, cv2.COLOR_BGR2RGB)
+
+    lab_f32 = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
+    L_norm = lab_f32[..., 0] / 100.0
+    L_norm_adjusted = np.clip(legacy_shadows_tone_mapping(L_norm, intensity), 0.0, 1.0)
+
+    lab_adjusted = np.stack([L_norm_adjusted * 100.0, lab_f32[..., 1], lab_f32[..., 2]], axis=-1)
+    img_adjusted = np.clip(cv2.cvtColor(lab_adjusted.astype(np.float32), cv2.COLOR_LAB2RGB), 0.0, 1.0)
+    out_8u = (img_adjusted * 255.0).round().astype(np.uint8)
+    cv2.imwrite(output_image_path, cv2.cvtColor(out_8u, cv2.COLOR_RGB2BGR))
+
+
+@pytest.mark.parametrize("factor", FACTORS)
+@pytest.mark.parametrize("image_path", TEST_IMAGES, ids=os.path.basename)
+def test_shadow_matches_legacy_loop(tmp_path, image_path, factor):
+    legacy_path = str(tmp_path / "legacy.png")
+    current_path = str(tmp_path / "current.png")
+    legacy_shadow(image_path, legacy_path, factor)
+    DECODED_IMAGE_CACHE.clear()
+    shadow(image_path, current_path, factor)
+
+    legacy = cv2.imread(legacy_path, cv2.IMREAD_UNCHANGED).astype(np.int16)
+    current = cv2.imread(current_path, cv2.IMREAD_UNCHANGED).astype(np.int16)
+    assert current.shape == legacy.shape
+    assert np.abs(current - legacy).max() <= 1